@@ -1,8 +1,21 @@
+import os
+import sys
+
+if __name__ == "__main__":
+    # `python main.py` hands over to `uvicorn main:app` before building anything. This file
+    # must not stay __main__: spawned parse workers (ParsePool) re-import the __main__ module,
+    # and would rebuild the whole app (stores, LanceDB, registry) every time one starts.
+    print("💎 LAUNCHING PRODUCTION SERVER 💎")
+    os.execv(sys.executable, [sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000",
+                              "--app-dir", os.path.dirname(os.path.abspath(__file__))])
+
 from fastapi import FastAPI, BackgroundTasks, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
 import logging
 import contextlib
+import json
 
 from teacher_assistant.src.core.models import ChatRequest, ChatResponse, CourseCreate, LoginRequest, RegisterRequest
 from auth_service import (
@@ -22,34 +35,53 @@ from auth_service import (
 )
 import datetime
 from teacher_assistant.src.core.resource_guard import ResourceGuard
+from teacher_assistant.src.core.scheduler import PRIORITY_FAST_LANE, PRIORITY_TEACHER, PRIORITY_VOICE, PRIORITY_STUDENT
+from teacher_assistant.src.core.load_monitor import LEVEL_REDUCED, LEVEL_CACHE_ONLY
 from teacher_assistant.src.infrastructure.database import VectorDatabase
 from teacher_assistant.src.infrastructure.ollama_client import OllamaClient
 from teacher_assistant.src.infrastructure.smart_cache import SmartCache
 from teacher_assistant.src.infrastructure.workspace import WorkspaceManager
+from teacher_assistant.src.infrastructure.blocking_executor import configure_blocking_executor
+from teacher_assistant.src.infrastructure.embedding_store import EmbeddingStore
 from teacher_assistant.src.use_cases.rag_engine import RAGService
 from teacher_assistant.src.use_cases.ingestion import IngestionService
-import os
+from teacher_assistant.src.infrastructure.document_parser import configure_page_cache, shutdown_parse_pool
+from teacher_assistant.src.infrastructure.ingest_manifest import IngestManifest
+from teacher_assistant.src.infrastructure.uploads import TEMP_PREFIX, store_upload
+from teacher_assistant.src.use_cases.service_registry import ServiceRegistry
 import shutil
 import hashlib
 import time
-from typing import List
+from typing import List, Optional
 from fastapi import UploadFile, File, Form
 
 # --- CONFIGURATION ---
 DB_PATH = "./super_precise_db"
 API_TITLE = "IITU Teacher Assistant AI"
 API_VERSION = "2.0.0 (SmartCache/ResourceGuard)"
+# How long a request waits server-side for a slot before getting a ticket to retry with
+ADMISSION_WAIT_SECONDS = 20.0
 
 # --- LIFESPAN MANAGER (Startup/Shutdown) ---
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print(f"\n🚀 {API_TITLE} Starting...")
-    print(f"✅ Resource Guard: Active (Limit: 50 slots, Overheat: 90%)")
+    print(f"✅ Resource Guard: Active (Limit: 50 slots, {guard.generation.scheduler.capacity} concurrent generations, Overheat: 90%)")
     print(f"✅ Smart Cache: Active (Matrix/L1)")
+    guard.rate_limiter.start()  # Background sweep of idle rate-limit buckets
+    guard.load_monitor.start()  # Background CPU/memory/load sampling
     yield
     # Shutdown
     print(f"🛑 {API_TITLE} Shutting down...")
+    guard.rate_limiter.stop()
+    guard.load_monitor.stop()
+    await llm.aclose()  # Pooled Ollama connections of this loop
+    service_registry.close()
+    db_rel.close() # Flushes queued usage analytics before closing connections
+    embedding_store.close()
+    blocking_executor.shutdown(wait=False)
+    shutdown_parse_pool()
 
 # --- APP SETUP ---
 app = FastAPI(title=API_TITLE, version=API_VERSION, lifespan=lifespan)
@@ -63,8 +95,14 @@ app.add_middleware(
 
 # --- DEPENDENCIES ---
 workspace_manager = WorkspaceManager(base_dir="./storage")
-llm = OllamaClient()
+# Shared across courses: identical chunk text is embedded once per model
+embedding_store = EmbeddingStore(db_path=os.path.join(workspace_manager.base_dir, "embedding_cache.db"))
+llm = OllamaClient(embedding_store=embedding_store)
+# Extracted PDF page text by (file hash, page): re-ingesting a textbook skips layout analysis
+configure_page_cache(os.path.join(workspace_manager.base_dir, "page_text_cache.db"))
 guard = ResourceGuard(max_concurrent=50, max_cpu_percent=90.0)
+# Blocking LanceDB/SQLite work on the async path: one thread per admitted request
+blocking_executor = configure_blocking_executor(max_workers=guard.max_concurrent)
 
 # MOUNT LEGACY DATABASE (Pre-trained)
 legacy_db_path = os.path.abspath("backend/super_precise_db")
@@ -85,17 +123,16 @@ if os.path.exists(legacy_db_path):
         }
     )
 
+# Shared per-course caches/RAG services (warm L1 + embedding matrix across requests)
+service_registry = ServiceRegistry(workspace_manager, llm, idle_ttl=1800.0, generation_gate=guard.generation)
+
 # Service Factory Helpers
 def get_rag_service(course_id: str):
-    db = workspace_manager.get_database(course_id)
-    cache_path = workspace_manager.get_cache_path(course_id)
-    cache = SmartCache(db_path=cache_path)
-    return RAGService(db, llm, cache)
+    return service_registry.get_rag_service(course_id)
 
 # Global Ingestion Service
 default_db = workspace_manager.get_database("test_course")
-default_cache = SmartCache(db_path=workspace_manager.get_cache_path("test_course"))
-default_rag = RAGService(default_db, llm, default_cache)
+default_rag = get_rag_service("test_course")
 ingestion_service = IngestionService(default_db, llm, default_rag)
 
 # --- AUTHENTICATION (SQLite + RBAC) ---
@@ -151,11 +188,101 @@ async def health():
     return {
         "status": "online" if is_healthy else "degraded",
         "health_message": msg,
+        "load": guard.load_monitor.snapshot(),  # Level, smoothed signals, recent transitions
         "version": API_VERSION,
         "total_workspaces": len(workspace_manager._db_cache),
         "total_database_docs": total_docs
     }
 
+async def _guest_search(request: ChatRequest) -> dict:
+    """Business Rule: Guests can only SEARCH, not GENERATE."""
+    # Perform Semantic Search on existing Q&A
+    start_time = time.time()
+    
+    # Simple keyword extraction (Naive) or vector 
+    keywords = request.message.split() 
+    match = await blocking_executor.run(db_rel.search_similar_questions, request.course_id, keywords)
+    
+    elapsed = (time.time() - start_time) * 1000
+    db_rel.log_usage(request.course_id, "guest_search", elapsed, tokens_saved=100) # 100% saved
+    
+    if match:
+         return {
+             "response": f"Found a similar question:\n\nQ: {match['question']}\n\nA: {match['answer']}",
+             "references": ["Community Forum"],
+             "status": "cached"
+         }
+    return {
+        "response": "I couldn't find a previous answer to this. Please Login to ask the AI directly.",
+        "references": [],
+        "status": "guest_limited"
+    }
+
+def _is_cached(course_id: str, message: str) -> bool:
+    return service_registry.get_cache(course_id).contains(message)
+
+async def _admission_priority(request: ChatRequest, user: dict) -> int:
+    """Fast lane for answers already cached, then teachers, then voice sessions, then students."""
+    if await blocking_executor.run(_is_cached, request.course_id, request.message):
+        return PRIORITY_FAST_LANE
+    return _role_priority(request, user)
+
+def _role_priority(request: ChatRequest, user: dict) -> int:
+    if user.get("role") in ("teacher", "admin"):
+        return PRIORITY_TEACHER
+    if request.is_voice:
+        return PRIORITY_VOICE
+    return PRIORITY_STUDENT
+
+def _enforce_rate_limit(client_ip: str, user: Optional[dict]):
+    if not guard.check_rate_limit(client_ip, user):
+        raise HTTPException(status_code=429, detail="Rate Limit Exceeded. Slow down.")
+
+async def _admit(request: ChatRequest, client_ip: str, user: dict):
+    """
+    Rate limit + concurrency slot for registered users.
+    Returns None when a slot was acquired (caller must release it), else the queue reply.
+    The request waits server-side for up to ADMISSION_WAIT_SECONDS; after that the client
+    gets a ticket_id and re-sends with it to resume its place in line.
+    """
+    # 1. DDoS Guard (per user, limit by role)
+    _enforce_rate_limit(client_ip, user)
+
+    # 2. Free slot and nobody waiting: no cache lookup needed (admitted under the caller's role)
+    if not request.ticket_id and guard.scheduler.try_acquire(_role_priority(request, user)):
+        return None
+
+    # 3. Priority queue (awaitable)
+    priority = await _admission_priority(request, user)
+    admitted, ticket_id = await guard.wait_for_slot(priority, request.ticket_id, timeout=ADMISSION_WAIT_SECONDS,
+                                                    course_id=request.course_id)
+    if admitted:
+        return None
+
+    request.ticket_id = ticket_id
+    q_status = guard.get_queue_status(ticket_id)
+    return {
+        "status": "queued",
+        "response": f"Hold tight! You are #{q_status['position']} in line.",
+        "references": [],
+        "ticket_id": ticket_id,
+        "position": q_status['position'],
+        "wait_time": q_status['wait_time']
+    }
+
+async def _save_to_forum(request: ChatRequest, user: dict, response: ChatResponse):
+    """SAVE TO FORUM: freshly generated answers become shared course history."""
+    if not response.status.startswith("generated_"):
+        return
+    await blocking_executor.run(
+        db_rel.save_chat_message,
+        course_id=request.course_id,
+        user_email=user['sub'],
+        user_name=user['name'],
+        question=request.message,
+        answer=response.response
+    )
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, raw_request: Request):
     """
@@ -168,99 +295,107 @@ async def chat(request: ChatRequest, raw_request: Request):
     
     # --- GUEST MODE (Unregistered) ---
     if not current_user_payload:
-        # Business Rule: Guests can only SEARCH, not GENERATE.
-        # Perform Semantic Search on existing Q&A
-        start_time = time.time()
-        
-        # Simple keyword extraction (Naive) or vector 
-        keywords = request.message.split() 
-        match = db_rel.search_similar_questions(request.course_id, keywords)
-        
-        elapsed = (time.time() - start_time) * 1000
-        db_rel.log_usage(request.course_id, "guest_search", elapsed, tokens_saved=100) # 100% saved
-        
-        if match:
-             return {
-                 "response": f"Found a similar question:\n\nQ: {match['question']}\n\nA: {match['answer']}",
-                 "references": ["Community Forum"],
-                 "status": "cached"
-             }
-        else:
-             return {
-                 "response": "I couldn't find a previous answer to this. Please Login to ask the AI directly.",
-                 "references": [],
-                 "status": "guest_limited"
-             }
+        return await _guest_search(request)
 
     # --- REGISTERED USER MODE (Student/Teacher) ---
-        
-    # 1. DDoS Guard
-    if not guard.check_rate_limit(client_ip):
-        raise HTTPException(status_code=429, detail="Rate Limit Exceeded. Slow down.")
-
-    # 2. Concurrency Slot
-    # 2. Concurrency Control with Queue
-    ok, msg = guard.acquire_slot(request.ticket_id)
-    if not ok:
-         if msg == "System Busy" or msg == "Queue Required":
-             # Auto-Join Queue if not already in one
-             if not request.ticket_id:
-                 request.ticket_id = guard.join_queue()
-             
-             q_status = guard.get_queue_status(request.ticket_id)
-             return {
-                 "status": "queued",
-                 "response": "You are in the queue. Please wait...",
-                 "ticket_id": request.ticket_id,
-                 "position": q_status['position'],
-                 "wait_time": q_status['wait_time']
-             }
-         elif msg == "Wait Your Turn":
-              q_status = guard.get_queue_status(request.ticket_id)
-              return {
-                 "status": "queued", 
-                 "response": f"Hold tight! You are #{q_status['position']} in line.",
-                 "ticket_id": request.ticket_id,
-                 "position": q_status['position'],
-                 "wait_time": q_status['wait_time']
-             }
+    queued = await _admit(request, client_ip, current_user_payload)
+    if queued:
+        return JSONResponse(queued)  # Not a ChatResponse: keep ticket_id/position/wait_time
     
+    started = guard.begin_service()
+    response = None
     try:
-        # 3. Overheat Check
-        is_healthy, _ = guard.check_health()
-        force_cache = not is_healthy
+        # 3. Overheat Check (graded: shorter answers first, then cache only)
+        level = guard.degradation_level()
+        force_cache = level == LEVEL_CACHE_ONLY
         
         # 4. Get Isolated RAG Service
-        rag_service = get_rag_service(request.course_id)
+        rag_service = await blocking_executor.run(get_rag_service, request.course_id)
         
-        # 5. Process Request
-        response = rag_service.answer_question(
+        # 5. Process Request (async end to end - never blocks the event loop)
+        response = await rag_service.answer_question_async(
             request.message,
             history=request.history, 
             force_cache_only=force_cache,
-            is_voice=request.is_voice
+            is_voice=request.is_voice,
+            reduced=level == LEVEL_REDUCED
         )
         
-        # If we had a ticket, we are done with it now
-        if request.ticket_id:
-            guard.leave_queue(request.ticket_id)
-
         if force_cache and response.status == "cached":
              response.response += "\n\n(Generated from cache while system is cooling down ❄️)"
         
-        # SAVE TO FORUM (If generated successfully)
-        if response.status == "success":
-            db_rel.save_chat_message(
-                course_id=request.course_id,
-                user_email=current_user_payload['sub'],
-                user_name=current_user_payload['name'],
-                question=request.message,
-                answer=response.response
-            )
+        await _save_to_forum(request, current_user_payload, response)
 
         return response
     finally:
-        guard.release_slot()
+        guard.release_slot(time.monotonic() - started, response.status if response else None)
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, raw_request: Request):
+    """
+    Streaming Chat (Server-Sent Events).
+    Events: `token` (answer text as generated), `done` (final ChatResponse payload),
+    `queued` (no slot within ADMISSION_WAIT_SECONDS - retry with ticket_id), `error`.
+    """
+    client_ip = raw_request.client.host if raw_request.client else "unknown"
+    current_user_payload = get_optional_user(raw_request)
+    sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    if not current_user_payload:
+        guest_reply = await _guest_search(request)
+        return StreamingResponse(iter([_sse("done", guest_reply)]), media_type="text/event-stream", headers=sse_headers)
+
+    queued = await _admit(request, client_ip, current_user_payload)
+    if queued:
+        return StreamingResponse(iter([_sse("queued", queued)]), media_type="text/event-stream", headers=sse_headers)
+
+    started = guard.begin_service()
+
+    # Release exactly once: normally from the generator's finally, or from the
+    # background hook if the client disconnected before streaming started.
+    released = False
+    final_status = None
+    def release_once():
+        nonlocal released
+        if not released:
+            released = True
+            guard.release_slot(time.monotonic() - started, final_status)
+
+    async def event_stream():
+        nonlocal final_status
+        try:
+            level = guard.degradation_level()
+            force_cache = level == LEVEL_CACHE_ONLY
+            rag_service = await blocking_executor.run(get_rag_service, request.course_id)
+
+            async for kind, payload in rag_service.stream_answer_async(
+                request.message,
+                history=request.history,
+                force_cache_only=force_cache,
+                is_voice=request.is_voice,
+                reduced=level == LEVEL_REDUCED
+            ):
+                if kind == "token":
+                    yield _sse("token", {"text": payload})
+                    continue
+
+                response = payload
+                final_status = response.status
+                if force_cache and response.status == "cached":
+                    response.response += "\n\n(Generated from cache while system is cooling down ❄️)"
+                await _save_to_forum(request, current_user_payload, response)
+                yield _sse("done", response.dict())
+        except Exception as e:
+            logging.exception("Streaming chat failed")
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            release_once()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=sse_headers,
+                             background=BackgroundTask(release_once))
 
 @app.get("/api/chat/history/{course_id}")
 async def get_forum_history(course_id: str, request: Request):
@@ -307,6 +442,7 @@ async def delete_course(course_id: str, user: dict = Depends(require_role("admin
         # Clear from cache
         if course_id in workspace_manager._db_cache:
             del workspace_manager._db_cache[course_id]
+        service_registry.invalidate(course_id)
         return {"message": f"Successfully wiped workspace {course_id}"}
     raise HTTPException(status_code=404, detail="Workspace not found.")
 
@@ -322,7 +458,7 @@ async def list_materials(course_id: str):
     materials = []
     for filename in os.listdir(doc_dir):
         file_path = os.path.join(doc_dir, filename)
-        if os.path.isfile(file_path):
+        if os.path.isfile(file_path) and not filename.startswith(TEMP_PREFIX):
             stats = os.stat(file_path)
             materials.append({
                 "id": hashlib.md5(filename.encode()).hexdigest(),
@@ -345,20 +481,27 @@ async def upload_materials(
     doc_dir = os.path.join(workspace_path, "documents")
     os.makedirs(doc_dir, exist_ok=True)
     
-    saved_files = []
+    teacher_db = await blocking_executor.run(workspace_manager.get_database, course_id)
+    manifest = IngestManifest(teacher_db.db_path)
+
+    # STREAMED: chunks go to disk off the event loop and are hashed on the way;
+    # content the course already has is neither stored again nor re-ingested
+    saved_files, duplicates = [], []
     for file in files:
-        file_path = os.path.join(doc_dir, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        saved_files.append(file.filename)
-    
+        name, same_as = await store_upload(file, doc_dir, manifest, blocking_executor)
+        if same_as is None:
+            saved_files.append(name)
+        else:
+            duplicates.append({"file": name, "same_as": same_as})
+
     # Trigger Ingestion
-    teacher_db = workspace_manager.get_database(course_id)
-    teacher_rag = get_rag_service(course_id)
-    local_ingestion = IngestionService(teacher_db, llm, teacher_rag, course_id=course_id)
-    background_tasks.add_task(local_ingestion.process_directory, doc_dir)
-    
-    return {"message": f"Uploaded {len(saved_files)} files.", "files": saved_files}
+    if saved_files:
+        teacher_rag = get_rag_service(course_id)
+        local_ingestion = IngestionService(teacher_db, llm, teacher_rag, course_id=course_id)
+        background_tasks.add_task(local_ingestion.process_directory, doc_dir)
+
+    return {"message": f"Uploaded {len(saved_files)} files ({len(duplicates)} duplicates skipped).",
+            "files": saved_files, "duplicates": duplicates}
 
 @app.delete("/api/materials/{course_id}/{filename}")
 async def delete_material(course_id: str, filename: str, user: dict = Depends(require_role("teacher"))):
@@ -371,6 +514,7 @@ async def delete_material(course_id: str, filename: str, user: dict = Depends(re
         # Wipe from DB (using filename as filter)
         db = workspace_manager.get_database(course_id)
         db.delete_by_source(filename)
+        service_registry.get_cache(course_id).invalidate_l1()
         return {"message": f"Successfully removed {filename} from {course_id}"}
     raise HTTPException(status_code=404, detail="File not found.")
 
@@ -397,17 +541,19 @@ async def get_ingest_status(course_id: str):
     status = IngestionService._progress_map.get(course_id, {"status": "idle", "progress": 0, "current_file": ""})
     return status
 
+@app.get("/api/ingest/index-health/{course_id}")
+async def get_index_health(course_id: str, user: dict = Depends(require_role("teacher"))):
+    """Vector/FTS index state of a course: unindexed rows, index age, search parameters."""
+    db = workspace_manager.get_database(course_id)
+    return await blocking_executor.run(db.index_health)
+
 @app.get("/api/analytics/costs")
 async def get_cost_forensics():
     """Prove 'Cost-Effective' requirement via cross-teacher cache hits."""
-    total_hits = 0
-    # Discover all teacher workspaces to aggregate stats
-    for entry in os.listdir(workspace_manager.base_dir):
-        if entry.startswith("teacher_"):
-            t_id = entry.replace("teacher_", "")
-            cache = SmartCache(db_path=workspace_manager.get_cache_path(t_id))
-            total_hits += cache.get_stats()['total_hits']
-    
+    # Discover all teacher workspaces to aggregate stats (idle ones are read, not loaded)
+    hits = await blocking_executor.run(service_registry.cache_hits_by_course)
+    total_hits = sum(hits.values())
+
     return {
         "saved_tokens_approx": total_hits * 450,
         "saved_gpu_hours": total_hits * 0.002,
@@ -420,6 +566,19 @@ async def trigger_stress_test(concurrency: int = 5):
     # This would simulate internal dummy queries to verify guard
     return {"message": f"Stress scenario with {concurrency} users initialized."}
 
+@app.get("/api/admin/metrics")
+async def get_metrics(user: dict = Depends(require_role("admin"))):
+    """Admin Only: service-time percentiles per path, queue state and adaptive concurrency."""
+    return guard.metrics()
+
+@app.put("/api/admin/course-weight/{course_id}")
+async def set_course_weight(course_id: str, weight: float, user: dict = Depends(require_role("admin"))):
+    """Admin Only: fair-share weight of a course in the queues (e.g. 2.0 before its exam; 1.0 resets)."""
+    if weight <= 0:
+        raise HTTPException(status_code=400, detail="Weight must be positive")
+    guard.set_course_weight(course_id, weight)
+    return {"course_id": course_id, "weight": weight}
+
 # --- ADMIN USER MANAGEMENT ---
 @app.get("/api/admin/users")
 async def list_users(user: dict = Depends(require_role("admin"))):
@@ -436,6 +595,3 @@ async def delete_user(email: str, user: dict = Depends(require_role("admin"))):
     except:
         raise HTTPException(404, "User not found")
 
-if __name__ == "__main__":
-    print("💎 LAUNCHING PRODUCTION SERVER 💎")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import pyarrow as pa
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from teacher_assistant.src.infrastructure.database import VectorDatabase
+
+def synthetic_table(n, dim, topics=200, subtopics=20, seed=7):
+    """
+    Topic -> subtopic -> chunk hierarchy (unit-normalized like real embeddings) rather than
+    uniform noise, so nearest neighbours are well separated and IVF partitions mean something.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    subs = centers.repeat(subtopics, axis=0) + 0.5 * rng.standard_normal((topics * subtopics, dim)).astype(np.float32)
+    vectors = subs[rng.integers(0, len(subs), n)] + 0.2 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    table = pa.table({
+        "vector": pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel()), dim),
+        "content": [f"chunk {i}" for i in range(n)],
+        "source": [f"lecture_{i % 40}.pdf" for i in range(n)],
+        "location": [f"Page {i % 30 + 1}" for i in range(n)],
+    })
+    return table, subs, rng
+
+def top_ids(db, vector, k):
+    return set(db.search(vector.tolist(), limit=k)["content"])
+
+def benchmark_ann_index(n=50_000, dim=768, queries=50, k=10):
+    workdir = tempfile.mkdtemp()
+    try:
+        print(f"Generating {n:,} x {dim} clustered vectors...")
+        table, centers, rng = synthetic_table(n, dim)
+        probes = centers[rng.integers(0, len(centers), queries)] + 0.2 * rng.standard_normal((queries, dim)).astype(np.float32)
+        probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+
+        db = VectorDatabase(db_path=workdir, index_min_rows=n)
+        db.db.create_table(db.table_name, data=table)
+
+        # 1. Ground truth + latency: exact flat scan
+        start = time.perf_counter()
+        truth = [top_ids(db, q, k) for q in probes]
+        flat_ms = (time.perf_counter() - start) / queries * 1000
+        print(f"\nFlat scan: {flat_ms:.1f} ms/query (recall 1.000 by definition)")
+
+        # 2. Build the ANN index the way ingestion does
+        start = time.perf_counter()
+        print(f"ensure_vector_index(): {db.ensure_vector_index()} in {time.perf_counter() - start:.1f}s")
+
+        # 3. Recall@k vs latency per setting
+        print(f"\n{'nprobes':>8} {'refine':>7} {'recall@' + str(k):>10} {'ms/query':>9} {'speedup':>8}")
+        for nprobes in (5, 10, 20, 50):
+            for refine in (None, 10):
+                db.nprobes, db.refine_factor = nprobes, refine
+                start = time.perf_counter()
+                found = [top_ids(db, q, k) for q in probes]
+                ms = (time.perf_counter() - start) / queries * 1000
+                recall = np.mean([len(f & t) / k for f, t in zip(found, truth)])
+                print(f"{nprobes:>8} {str(refine):>7} {recall:>10.3f} {ms:>9.1f} {flat_ms / ms:>7.1f}x")
+
+        print("\nIndex health:", db.index_health()["vector_index"])
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    benchmark_ann_index()
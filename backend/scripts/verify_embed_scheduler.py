@@ -0,0 +1,33 @@
+import os
+import sys
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from teacher_assistant.src.infrastructure.ollama_client import OllamaClient
+from teacher_assistant.src.use_cases.embedding_scheduler import EmbeddingScheduler
+
+# Compare embedding settings on this machine's Ollama (no embedding cache: every text is embedded)
+WORDS = ("requirements engineering software design pattern coupling cohesion agile scrum waterfall "
+         "testing defect stakeholder architecture uml diagram deployment interface lecture").split()
+SETTINGS = [(1, 4_000, False), (1, 16_000, True), (2, 16_000, True), (4, 16_000, True)]
+
+def make_chunks(n=600, seed=0):
+    rng = random.Random(seed)
+    # Slide-title to full-page lengths, like a mixed course folder
+    return [{"content": f"[Lecture {i % 12}] " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 120)))}
+            for i in range(n)]
+
+def benchmark():
+    llm = OllamaClient()
+    for concurrency, batch_chars, adaptive in SETTINGS:
+        chunks = make_chunks()
+        scheduler = EmbeddingScheduler(llm, concurrency=concurrency, batch_chars=batch_chars,
+                                       adapt_every=None if adaptive else 10 ** 9)
+        list(scheduler.embed_stream([chunks]))
+        report = scheduler.report()
+        print(f"concurrency={concurrency} start={batch_chars} chars adaptive={adaptive}: "
+              f"{report['chunks_per_sec']} chunks/s, {report['chars_per_sec']} chars/s, "
+              f"avg batch {report['avg_batch']}, settled at {report['batch_chars']} chars")
+
+if __name__ == "__main__":
+    benchmark()
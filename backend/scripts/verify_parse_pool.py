@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+from docx import Document
+from pptx import Presentation
+from pptx.util import Inches
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from teacher_assistant.src.infrastructure.document_parser import ParsePool, parse_document
+
+WORDS = ("requirements engineering software design pattern coupling cohesion agile scrum waterfall "
+         "testing defect stakeholder architecture uml diagram deployment interface lecture").split()
+
+def make_corpus(directory, files=16, slides=80, paragraphs=400):
+    for i in range(files):
+        text = lambda k: " ".join(WORDS[(i + j) % len(WORDS)] for j in range(k))
+        if i % 2:
+            prs = Presentation()
+            for s in range(slides):
+                slide = prs.slides.add_slide(prs.slide_layouts[5])
+                slide.shapes.title.text = f"Slide {s}: {text(4)}"
+                box = slide.shapes.add_textbox(Inches(1), Inches(2), Inches(8), Inches(4))
+                box.text_frame.text = text(120)
+            prs.save(os.path.join(directory, f"{i:02d} - Lecture {i}.pptx"))
+        else:
+            doc = Document()
+            for _ in range(paragraphs):
+                doc.add_paragraph(text(60))
+            doc.save(os.path.join(directory, f"{i:02d} - Notes {i}.docx"))
+
+def benchmark():
+    directory = tempfile.mkdtemp(prefix="parse_bench_")
+    try:
+        make_corpus(directory)
+        paths = sorted(os.path.join(directory, f) for f in os.listdir(directory))
+        print(f"{len(paths)} documents, {os.cpu_count()} cores")
+
+        start = time.perf_counter()
+        threaded = {p: parse_document(p) for p in paths}  # One core's worth: what the GIL allows threads
+        thread_time = time.perf_counter() - start
+
+        pool = ParsePool()
+        start = time.perf_counter()
+        pooled = {path: chunks for path, chunks, _ in pool.parse(paths)}
+        pool_time = time.perf_counter() - start  # Includes spawning the workers
+        pool.shutdown()
+
+        same = all(threaded[p] == pooled[p] for p in paths)
+        chunks = sum(len(c) for c in threaded.values())
+        print(f"serial: {thread_time:.2f}s | process pool: {pool_time:.2f}s "
+              f"(speedup {thread_time / pool_time:.1f}x) | {chunks} chunks, identical: {same}")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    benchmark()
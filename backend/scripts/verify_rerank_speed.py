@@ -0,0 +1,79 @@
+import os
+import re
+import sys
+import time
+import random
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from teacher_assistant.src.infrastructure.database import smart_scores, CONTENT_LOWER
+
+WORDS = ("requirements engineering software design pattern coupling cohesion agile scrum waterfall "
+         "testing defect stakeholder architecture uml diagram deployment interface lecture "
+         "требования проектирование тестирование архитектура").split()
+
+def legacy_smart_score(results, query):
+    """The original per-row scorer from VectorDatabase.smart_search (results.apply, axis=1)."""
+    query_lower = query.lower()
+    query_words = [w for w in re.split(r'\W+', query_lower) if len(w) > 2]
+
+    def smart_score(row):
+        content = row['content'].lower()
+        source = row['source'].lower()
+        score = 0
+        for word in query_words:
+            if word in content:
+                score += 3
+            if word in source:
+                score += 25
+        if query_lower[:20] in content:
+            score += 5
+        return score
+
+    return results.apply(smart_score, axis=1)
+
+def synthetic_chunks(n, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        source = f"{rng.randint(1, 15):02d} - {' '.join(rng.choices(WORDS, k=2)).title()}.pptx"
+        body = " ".join(rng.choices(WORDS, k=rng.randint(40, 120)))
+        rows.append({"content": f"[{source[:-5]}] {body}", "source": source,
+                     "location": f"Slide {i % 40 + 1}", "_distance": rng.random()})
+    return pd.DataFrame(rows)
+
+def ordering(frame, scores):
+    ranked = frame.assign(smart_score=scores)
+    return ranked.sort_values(by=['smart_score', '_distance'], ascending=[False, True]).index.tolist()
+
+def benchmark_rerank(n=100_000):
+    print(f"Generating synthetic table ({n:,} chunks)...")
+    frame = synthetic_chunks(n)
+    # As written by VectorDatabase at ingest time
+    indexed = frame.assign(**{CONTENT_LOWER: [c.lower() for c in frame['content']]})
+    queries = ["What is requirements engineering?", "Explain coupling and cohesion in software design",
+               "uml deployment diagram", "Что такое тестирование?"]
+
+    for query in queries:
+        start = time.perf_counter()
+        old = legacy_smart_score(frame, query)
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        legacy_table = smart_scores(frame, query)  # Table without content_lower (lowercases on the fly)
+        legacy_table_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = smart_scores(indexed, query)
+        new_time = time.perf_counter() - start
+
+        same = (np.array_equal(old.to_numpy(), new) and np.array_equal(legacy_table, new)
+                and ordering(frame, old.to_numpy()) == ordering(frame, new))
+        print(f"\nQuery: {query!r}")
+        print(f"  apply(axis=1): {old_time:.3f}s | vectorized (no content_lower): {legacy_table_time:.3f}s | "
+              f"vectorized + content_lower: {new_time:.3f}s")
+        print(f"  speedup {old_time / new_time:.1f}x | identical ordering: {same}")
+
+if __name__ == "__main__":
+    benchmark_rerank()
@@ -6,8 +6,8 @@ def verify_security():
     print("Initializing ResourceGuard...")
     # Set strict limits for testing
     guard = ResourceGuard(max_concurrent=10, max_cpu_percent=50.0) 
-    # Force max_requests_per_min to 5 for quick test
-    guard.max_requests_per_min = 5
+    # Force the guest limit to 5 (no burst beyond it) for quick test
+    guard.rate_limiter.set_limit("guest", 5, 5)
     
     ip = "192.168.1.100"
     
@@ -46,8 +46,10 @@ def verify_security():
     is_healthy, msg = guard.check_health()
     print(f"Status: {msg}")
     
-    # Simulate Overheat
-    guard.cool_down_until = time.time() + 10
+    # Simulate Overheat (sustained 100% CPU, as the background sampler would see it)
+    guard.load_monitor.sampler = lambda: {"cpu": 100.0}
+    for _ in range(10):
+        guard.load_monitor.sample()
     is_healthy, msg = guard.check_health()
     print(f"Simulate Overheat: {msg}")
     if not is_healthy:
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from teacher_assistant.src.infrastructure.smart_cache import SmartCache
+
+def benchmark_sqlite_pool(iterations=5000):
+    """Per-call overhead: connect/close per call (old) vs pooled per-thread connection (new)."""
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "smart_cache.db")
+    cache = SmartCache(db_path=db_path, l1_max_entries=0) # No L1 so lookups reach SQLite
+    for i in range(200):
+        cache.set(f"question {i}", f"answer {i}", ["a.pdf | Page 1"])
+    query_hash = cache._hash_query(cache._normalize_query("question 100"))
+
+    # 1. Old pattern: fresh connection per call
+    print(f"Connect-per-call: {iterations} exact lookups...")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        conn = sqlite3.connect(db_path)
+        conn.execute('SELECT response, references_json FROM qa_cache WHERE query_hash = ?', (query_hash,)).fetchone()
+        conn.close()
+    old_time = time.perf_counter() - start
+
+    # 2. New pattern: pooled connection + cached prepared statement
+    print(f"Pooled connection: {iterations} exact lookups...")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        conn = cache._pool.connection()
+        conn.execute('SELECT response, references_json FROM qa_cache WHERE query_hash = ?', (query_hash,)).fetchone()
+    new_time = time.perf_counter() - start
+
+    # 3. End-to-end SmartCache.get (L1 bypassed) with the pool
+    start = time.perf_counter()
+    for _ in range(iterations):
+        cache.get("question 100")
+    get_time = time.perf_counter() - start
+
+    print(f"\nConnect-per-call: {old_time / iterations * 1e6:.1f} us/call")
+    print(f"Pooled:           {new_time / iterations * 1e6:.1f} us/call")
+    print(f"SmartCache.get:   {get_time / iterations * 1e6:.1f} us/call (L2 hit incl. access_count UPDATE)")
+    print(f"\nSpeedup: {old_time / new_time:.1f}x Faster")
+
+    cache.close()
+
+if __name__ == "__main__":
+    benchmark_sqlite_pool()
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from teacher_assistant.src.infrastructure.workspace import WorkspaceManager
+
+def benchmark_health_count(workspaces=20, rows=2000, iterations=200):
+    """/health sums db.count() over every cached workspace; compare re-open-per-call with cached handles."""
+    workdir = tempfile.mkdtemp()
+    try:
+        manager = WorkspaceManager(base_dir=workdir)
+        rng = np.random.default_rng(0)
+        print(f"Creating {workspaces} workspaces x {rows} chunks...")
+        for w in range(workspaces):
+            manager.get_database(f"course{w}").insert_chunks([
+                {"vector": rng.standard_normal(64).tolist(), "content": f"chunk {i}",
+                 "source": f"s{i % 9}.pdf", "location": f"Page {i}"} for i in range(rows)])
+        dbs = list(manager._db_cache.values())
+        vector = rng.standard_normal(64).tolist()
+
+        # 1. Old pattern: table_names() + open_table() on every call
+        def legacy_count(db):
+            if db.table_name not in db.db.list_tables().tables:
+                return 0
+            return len(db.db.open_table(db.table_name))
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            old_total = sum(legacy_count(db) for db in dbs)
+        old_time = (time.perf_counter() - start) / iterations
+
+        # 2. New: cached handle + cached row count
+        start = time.perf_counter()
+        for _ in range(iterations):
+            new_total = sum(db.count() for db in dbs)
+        new_time = (time.perf_counter() - start) / iterations
+
+        # 3. Per-request search overhead (open per call vs cached handle)
+        db = dbs[0]
+        start = time.perf_counter()
+        for _ in range(iterations):
+            db.db.open_table(db.table_name).search(vector).limit(12).to_pandas()
+        old_search = (time.perf_counter() - start) / iterations
+        start = time.perf_counter()
+        for _ in range(iterations):
+            db.search(vector, limit=12)
+        new_search = (time.perf_counter() - start) / iterations
+
+        assert old_total == new_total
+        print(f"\n/health count over {workspaces} workspaces:")
+        print(f"  list+open per call: {old_time * 1000:.2f} ms | cached: {new_time * 1000:.3f} ms "
+              f"| speedup {old_time / new_time:.0f}x")
+        print(f"search(): open per call {old_search * 1000:.2f} ms | cached handle {new_search * 1000:.2f} ms")
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    benchmark_health_count()
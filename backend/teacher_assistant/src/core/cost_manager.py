@@ -1,6 +1,11 @@
 import re
 from typing import Tuple, Dict
 
+# Degraded mode (host under load): less prompt to evaluate, shorter answers to generate
+REDUCED_CONTEXT_SCALE = 0.5
+REDUCED_NUM_PREDICT = 512
+REDUCED_HISTORY_MESSAGES = 2
+
 class SmartCostManager:
     """
     Manages computational costs by dynamically routing queries and budgeting context.
@@ -46,15 +51,18 @@ class SmartCostManager:
             "cost_weight": 1.0
         }
 
-    def allocate_budget(self, results, is_voice: bool = False) -> Dict:
+    def allocate_budget(self, results, is_voice: bool = False, reduced: bool = False) -> Dict:
         """
         Adapts resource usage based on search confidence and input medium.
-        Returns: { 'max_context': int, 'mode': str }
+        `reduced` (system under load) halves the context and caps the answer length.
+        Returns: { 'max_context': int, 'mode': str, 'output': dict, 'num_predict': int | None, 'history': int }
         """
         output_budget = self.determine_output_budget(is_voice)
+        limits = {'num_predict': REDUCED_NUM_PREDICT if reduced else None,
+                  'history': REDUCED_HISTORY_MESSAGES if reduced else 4}
         
         if results.empty:
-            return {'max_context': 0, 'mode': 'no_results', 'output': output_budget}
+            return {'max_context': 0, 'mode': 'no_results', 'output': output_budget, **limits}
             
         # Get score of the best chunk
         best_score = results.iloc[0].get('smart_score', 0)
@@ -67,4 +75,6 @@ class SmartCostManager:
         else:
             config = {'max_context': 8000, 'mode': 'deep_dive'}
             
-        return {**config, 'output': output_budget}
+        if reduced:
+            config['max_context'] = int(config['max_context'] * REDUCED_CONTEXT_SCALE)
+        return {**config, 'output': output_budget, **limits}
@@ -0,0 +1,89 @@
+import time
+import threading
+import numpy as np
+from typing import Dict, Optional
+
+# Request paths with very different service times
+PATH_CACHE_HIT = "cache_hit"       # Exact/semantic cache, throttled replies
+PATH_SKIP_RAG = "skip_rag"         # Greetings etc.: short LLM call, no retrieval
+PATH_GENERATION = "rag_generation" # Retrieval + full LLM answer (incl. coalesced waits)
+PATHS = (PATH_CACHE_HIT, PATH_SKIP_RAG, PATH_GENERATION)
+
+
+def path_for_status(status: str) -> str:
+    """Map a ChatResponse.status to the latency path it measured."""
+    if status.startswith("generated_") or status == "coalesced":
+        return PATH_GENERATION
+    if status == "chat_simple":
+        return PATH_SKIP_RAG
+    return PATH_CACHE_HIT
+
+
+class LatencyWindow:
+    """
+    Moving-window latency samples in constant memory: a ring buffer of the last
+    `capacity` samples, of which only those younger than `window_seconds` count.
+    Percentiles are computed on demand (O(capacity)) and memoized until the next sample.
+    """
+    def __init__(self, capacity: int = 1024, window_seconds: float = 300.0):
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self._values = np.zeros(capacity, dtype=np.float64)
+        self._stamps = np.full(capacity, -np.inf, dtype=np.float64)
+        self._next = 0
+        self.total = 0  # Lifetime sample count
+        self._lock = threading.Lock()
+        self._summary = None
+        self._summary_at = 0.0
+
+    def record(self, seconds: float, now: Optional[float] = None):
+        with self._lock:
+            i = self._next
+            self._values[i] = seconds
+            self._stamps[i] = time.monotonic() if now is None else now
+            self._next = (i + 1) % self.capacity
+            self.total += 1
+            self._summary = None
+
+    def summary(self, now: Optional[float] = None, since: Optional[float] = None) -> Dict:
+        """
+        {count, mean, p50, p95, p99} over the live window (seconds; zeros when empty).
+        `since` (monotonic stamp) narrows it to newer samples, e.g. since the last tuning step.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # Memoized until a new sample lands or one second passes (samples age out)
+            if since is None and self._summary is not None and now - self._summary_at < 1.0:
+                return self._summary
+            cutoff = now - self.window_seconds if since is None else max(now - self.window_seconds, since)
+            live = self._values[self._stamps >= cutoff]
+            if live.size:
+                p50, p95, p99 = np.percentile(live, [50, 95, 99])
+                summary = {"count": int(live.size), "mean": round(float(live.mean()), 4),
+                           "p50": round(float(p50), 4), "p95": round(float(p95), 4), "p99": round(float(p99), 4)}
+            else:
+                summary = {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+            if since is None:
+                self._summary, self._summary_at = summary, now
+            return summary
+
+
+class LatencyModel:
+    """Per-path windows plus an all-paths window (what a slot is actually held for)."""
+    def __init__(self, capacity: int = 1024, window_seconds: float = 300.0):
+        self.windows = {path: LatencyWindow(capacity, window_seconds) for path in PATHS + ("all",)}
+
+    def record(self, path: str, seconds: float):
+        self.windows[path].record(seconds)
+        self.windows["all"].record(seconds)
+
+    def summary(self, path: str = "all", since: Optional[float] = None) -> Dict:
+        return self.windows[path].summary(since=since)
+
+    def service_time(self, stat: str = "mean", default: float = 2.0) -> float:
+        """How long an admitted request holds its slot (all paths), for queue ETAs."""
+        s = self.windows["all"].summary()
+        return s[stat] if s["count"] else default
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {path: window.summary() for path, window in self.windows.items()}
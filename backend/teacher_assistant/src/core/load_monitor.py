@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Graded degradation, mildest first
+LEVEL_NORMAL = 0
+LEVEL_REDUCED = 1     # Shorter answers (num_predict) and less retrieved context
+LEVEL_CACHE_ONLY = 2  # No generation at all: cache hits or the throttled reply
+LEVEL_NAMES = {LEVEL_NORMAL: "normal", LEVEL_REDUCED: "reduced", LEVEL_CACHE_ONLY: "cache_only"}
+
+# Per-signal (reduce, cache_only) thresholds in the signal's own units. A host that keeps a
+# model resident sits at high memory all day, so memory only counts near exhaustion; load
+# is runnable tasks per core (150 = 1.5 per core). CPU uses the monitor's reduce_at/cache_only_at.
+DEFAULT_SIGNAL_THRESHOLDS: Dict[str, Tuple[float, float]] = {
+    "memory": (92.0, 97.0),
+    "load": (150.0, 250.0),
+}
+
+
+def system_sample() -> Optional[Dict[str, float]]:
+    """Raw host load in percent: cpu, memory, and 1-minute load average per core."""
+    sample = {}
+    if psutil:
+        # interval=None: utilisation since the previous call, i.e. over one sampler period
+        sample["cpu"] = psutil.cpu_percent(interval=None)
+        sample["memory"] = psutil.virtual_memory().percent
+    if hasattr(os, "getloadavg"):
+        sample["load"] = os.getloadavg()[0] / (os.cpu_count() or 1) * 100.0
+    return sample or None
+
+
+class LoadMonitor:
+    """
+    Smoothed host load and the degradation level it implies.
+
+    - Sampled every `interval` seconds by a background thread (start()), or inline by
+      level() when the thread is not running, instead of per request: per-request
+      cpu_percent(interval=None) measures whatever happened since the previous request.
+    - Each signal is an EWMA, normalised against its own (reduce, cache_only) thresholds
+      onto the CPU scale (its reduce threshold maps to `reduce_at`, its cache-only one to
+      `cache_only_at`), and pressure is the worst of them. One spike does not trip
+      anything, and 80% resident memory on an idle host is not 80% CPU.
+    - Escalation is immediate once pressure crosses `reduce_at` / `cache_only_at`.
+      Recovery needs pressure `hysteresis` points below the threshold and at least
+      `min_dwell` seconds at the current level, one level at a time.
+    - Recent transitions are kept for /health.
+    """
+    def __init__(self, reduce_at: float = 75.0, cache_only_at: float = 90.0, hysteresis: float = 10.0,
+                 alpha: float = 0.3, interval: float = 1.0, min_dwell: float = 10.0, history: int = 20,
+                 sampler: Optional[Callable[[], Optional[Dict[str, float]]]] = None,
+                 thresholds: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.reduce_at = reduce_at
+        self.cache_only_at = cache_only_at
+        # signal -> (reduce, cache_only) in its own units; signals not listed use reduce_at/cache_only_at
+        self.thresholds = dict(DEFAULT_SIGNAL_THRESHOLDS if thresholds is None else thresholds)
+        self.hysteresis = hysteresis
+        self.alpha = alpha
+        self.interval = interval
+        self.min_dwell = min_dwell
+        self.sampler = sampler or system_sample
+        self.signals: Dict[str, float] = {}  # Smoothed, in each signal's own units
+        self.normalized: Dict[str, float] = {}  # Same, on the CPU threshold scale
+        self.pressure = 0.0
+        self.current = LEVEL_NORMAL
+        self.transitions = deque(maxlen=history)
+        self._changed_at = time.monotonic()
+        self._last_sample = float("-inf")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self, now: Optional[float] = None) -> int:
+        """Take one sample, update the smoothed signals and the level. Returns the level."""
+        now = time.monotonic() if now is None else now
+        raw = self.sampler()
+        with self._lock:
+            self._last_sample = now
+            if raw:
+                for name, value in raw.items():
+                    previous = self.signals.get(name)
+                    self.signals[name] = value if previous is None else previous + self.alpha * (value - previous)
+                    self.normalized[name] = self._normalize(name, self.signals[name])
+                self.pressure = max(self.normalized.values())
+                self._transition_locked(now)
+            return self.current
+
+    def level(self, now: Optional[float] = None) -> int:
+        """Current level; samples inline when the background thread is not running."""
+        now = time.monotonic() if now is None else now
+        if self._thread is None:
+            with self._lock:
+                due = now - self._last_sample >= self.interval
+                if due:
+                    self._last_sample = now  # One request samples, the rest read the level
+            if due:
+                return self.sample(now)
+        return self.current
+
+    def _normalize(self, name: str, value: float) -> float:
+        """Piecewise-linear map of a signal onto the CPU scale via its own thresholds."""
+        reduce, cache_only = self.thresholds.get(name, (self.reduce_at, self.cache_only_at))
+        if value <= reduce:
+            return value * self.reduce_at / reduce
+        return self.reduce_at + (value - reduce) * (self.cache_only_at - self.reduce_at) / (cache_only - reduce)
+
+    def _transition_locked(self, now: float):
+        pressure, level = self.pressure, self.current
+        if pressure >= self.cache_only_at:
+            target = LEVEL_CACHE_ONLY
+        elif pressure >= self.reduce_at:
+            target = LEVEL_REDUCED
+        else:
+            target = LEVEL_NORMAL
+        if target < level:
+            # Leaving needs a margin below the threshold that got us here, and some time
+            leave_at = (self.cache_only_at if level == LEVEL_CACHE_ONLY else self.reduce_at) - self.hysteresis
+            if pressure >= leave_at or now - self._changed_at < self.min_dwell:
+                return
+            target = level - 1
+        if target == level:
+            return
+        self.current = target
+        self._changed_at = now
+        self.transitions.append({
+            "at": round(time.time(), 3),
+            "from": LEVEL_NAMES[level],
+            "to": LEVEL_NAMES[target],
+            "pressure": round(pressure, 1),
+            "signals": {name: round(value, 1) for name, value in self.signals.items()},
+            "normalized": {name: round(value, 1) for name, value in self.normalized.items()},
+        })
+
+    # --- Background sampler ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="load-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "level": LEVEL_NAMES[self.current],
+                "since_seconds": round(time.monotonic() - self._changed_at, 1),
+                "pressure": round(self.pressure, 1),
+                "signals": {name: round(value, 1) for name, value in self.signals.items()},
+                "normalized": {name: round(value, 1) for name, value in self.normalized.items()},
+                "thresholds": {"reduced": self.reduce_at, "cache_only": self.cache_only_at,
+                               "hysteresis": self.hysteresis, "min_dwell_seconds": self.min_dwell,
+                               "per_signal": {name: list(pair) for name, pair in self.thresholds.items()}},
+                "transitions": list(self.transitions),
+            }
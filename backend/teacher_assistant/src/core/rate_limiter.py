@@ -0,0 +1,143 @@
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# role -> (requests per minute, burst), or None for no limit. Students keep the old 60 requests
+# per minute window; guests only hit the cheap forum search and are not limited. Roles without
+# an entry get the default role's limit.
+DEFAULT_RATE_LIMITS: Dict[str, Optional[Tuple[float, int]]] = {
+    "guest": None,
+    "student": (60, 60),
+    "teacher": (120, 40),
+    "admin": (600, 100),
+}
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [tokens, last_seen, full_at]: full_at is when the bucket will have refilled
+        self.buckets: Dict[str, List[float]] = {}
+
+
+class TokenBucketLimiter:
+    """
+    Per-key token buckets in bounded memory.
+
+    - A check is O(1): refill by elapsed time, spend one token. No per-request history.
+    - Keys are spread over `shards` dicts, each with its own lock, so concurrent checks
+      for different clients rarely contend.
+    - A bucket that has refilled completely carries no information (a new bucket starts
+      full), so sweep() drops those losslessly. Sweeps run every `sweep_interval` seconds,
+      from a background thread (start()) and inline on the request path as a fallback,
+      one shard at a time.
+    - `max_keys_per_shard` hard-caps memory under a flood of distinct keys (IP scan):
+      the oldest-inserted key of a full shard is dropped.
+    """
+    def __init__(self, limits: Optional[Dict[str, Optional[Tuple[float, int]]]] = None, default_role: str = "student",
+                 shards: int = 16, sweep_interval: float = 60.0, max_keys_per_shard: int = 65536):
+        self.limits = dict(DEFAULT_RATE_LIMITS if limits is None else limits)
+        self.default_role = default_role
+        self.sweep_interval = sweep_interval
+        self.max_keys_per_shard = max_keys_per_shard
+        self._shards = [_Shard() for _ in range(shards)]
+        self._last_sweep = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.allowed = 0
+        self.blocked = 0
+        self.evicted = 0
+
+    def set_limit(self, role: str, per_minute: float, burst: int):
+        self.limits[role] = (per_minute, burst)
+
+    def _limit(self, role: Optional[str]) -> Optional[Tuple[float, int]]:
+        """(tokens per second, burst) for `role`; None if the role is not rate limited."""
+        limit = self.limits[role if role in self.limits else self.default_role]
+        if limit is None:
+            return None
+        per_minute, burst = limit
+        return per_minute / 60.0, burst
+
+    def allow(self, key: str, role: Optional[str] = None, now: Optional[float] = None) -> bool:
+        """Spend one token from `key`'s bucket (limits of `role`). False when empty."""
+        limit = self._limit(role)
+        if limit is None:
+            self.allowed += 1
+            return True
+        rate, burst = limit
+        now = time.monotonic() if now is None else now
+        self._maybe_sweep(now)
+        shard = self._shards[hash(key) % len(self._shards)]
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                if len(shard.buckets) >= self.max_keys_per_shard:
+                    shard.buckets.pop(next(iter(shard.buckets)))
+                    self.evicted += 1
+                tokens = float(burst)
+            else:
+                tokens = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            shard.buckets[key] = [tokens, now, now + (burst - tokens) / rate if rate > 0 else float("inf")]
+        # Plain counters: an occasional lost increment under contention is fine for metrics
+        if allowed:
+            self.allowed += 1
+        else:
+            self.blocked += 1
+        return allowed
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop buckets that have refilled. Locks one shard at a time. Returns the number dropped."""
+        now = time.monotonic() if now is None else now
+        self._last_sweep = now
+        dropped = 0
+        for shard in self._shards:
+            with shard.lock:
+                idle = [key for key, bucket in shard.buckets.items() if bucket[2] <= now]
+                for key in idle:
+                    del shard.buckets[key]
+            dropped += len(idle)
+        self.evicted += dropped
+        return dropped
+
+    def _maybe_sweep(self, now: float):
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now  # Claim this sweep before doing it: one thread sweeps, the rest move on
+            self.sweep(now)
+
+    # --- Background sweeper ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rate-limit-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            self.sweep()
+
+    def __len__(self) -> int:
+        return sum(len(shard.buckets) for shard in self._shards)
+
+    def stats(self) -> Dict:
+        return {
+            "tracked_keys": len(self),
+            "allowed": self.allowed,
+            "blocked": self.blocked,
+            "evicted": self.evicted,
+            "limits": {role: {"per_minute": limit[0], "burst": limit[1]} if limit else None
+                       for role, limit in self.limits.items()},
+        }
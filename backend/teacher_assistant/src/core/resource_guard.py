@@ -1,133 +1,188 @@
 import time
 import threading
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Optional
 import logging
-
-try:
-    import psutil
-except ImportError:
-    psutil = None
+from .scheduler import AdmissionScheduler, GenerationGate, PRIORITY_STUDENT, gate_wait_seconds, reset_gate_wait
+from .latency import LatencyModel, PATH_GENERATION, path_for_status
+from .rate_limiter import TokenBucketLimiter
+from .load_monitor import LoadMonitor, LEVEL_CACHE_ONLY, LEVEL_NAMES
 
 class ResourceGuard:
     """
     PROTECTION LAYER:
     1. DDoS Shield (Rate Limiting)
-    2. Overheating Guard (CPU Load Throttling)
-    3. Concurrency Control (Slot Management)
+    2. Overheating Guard (smoothed CPU/memory/load, graded degradation, via LoadMonitor)
+    3. Concurrency Control (Slot Management, via AdmissionScheduler, fair across courses)
+    4. LLM Generation Cap (GenerationGate: far fewer generations than admitted requests)
     """
-    def __init__(self, max_concurrent=50, max_cpu_percent=90.0):
-        self.max_concurrent = max_concurrent
-        self.max_cpu_percent = max_cpu_percent
-        self.active_requests = 0
+    def __init__(self, max_concurrent=50, max_cpu_percent=90.0, adaptive: bool = True,
+                 min_concurrent: int = 8, target_generation_p95: float = 25.0,
+                 adapt_interval: float = 10.0, adapt_min_samples: int = 20,
+                 rate_limits: Optional[Dict[str, Optional[Tuple[float, int]]]] = None, max_generations: int = 4):
+        self.max_concurrent = max_concurrent  # Ceiling; the live limit is scheduler.capacity
+        self.max_cpu_percent = max_cpu_percent  # Cache-only threshold; answers shrink from 15 points below
         self.lock = threading.Lock()
         
-        # Rate Limiting (IP based) - Token Bucket equivalent
-        self.ip_requests: Dict[str, list] = {} 
-        self.rate_limit_window = 60 # 1 minute
-        self.max_requests_per_min = 60 # 1 req/sec per IP average
+        # Rate Limiting: sharded token buckets, limits per role (see rate_limiter.DEFAULT_RATE_LIMITS)
+        self.rate_limiter = TokenBucketLimiter(limits=rate_limits)
         
-        # Queue System
-        self.pending_queue = [] # List of ticket_ids
-        self.avg_processing_time = 2.0 # seconds
-        self.processed_count_window = 0
-        self.cool_down_until = 0
+        # Measured service times per path (moving window, p50/p95/p99)
+        self.latency = LatencyModel()
+
+        # Queue System: priority classes, awaitable admission, ETAs from measured service times
+        self.scheduler = AdmissionScheduler(capacity=max_concurrent,
+                                            service_time=lambda stat="mean": self.latency.service_time(stat))
+        # Concurrent Ollama generations (one host): waiting for one lends the admission slot back
+        self.generation = GenerationGate(capacity=max_generations, admission=self.scheduler)
+
+        # Load sampling (background thread once started) with hysteresis between levels
+        self.load_monitor = LoadMonitor(reduce_at=max_cpu_percent - 15.0, cache_only_at=max_cpu_percent)
+
+        # Adaptive concurrency: keep RAG generation p95 under target (AIMD on scheduler.capacity)
+        self.adaptive = adaptive
+        self.min_concurrent = min(min_concurrent, max_concurrent)
+        self.target_generation_p95 = target_generation_p95
+        self.adapt_interval = adapt_interval
+        self.adapt_min_samples = adapt_min_samples
+        self._last_adapt = time.monotonic()
+        self.capacity_changes = 0
+
+    @property
+    def active_requests(self) -> int:
+        return self.scheduler.active
+
+    @property
+    def avg_processing_time(self) -> float:
+        return self.latency.service_time("mean")
+
+    def degradation_level(self) -> int:
+        """load_monitor level: LEVEL_NORMAL, LEVEL_REDUCED (shorter answers) or LEVEL_CACHE_ONLY."""
+        return self.load_monitor.level()
 
     def check_health(self) -> Tuple[bool, str]:
         """
-        Returns (is_healthy, message). 
+        Returns (is_healthy, message).
         If unhealthy (Overheating), system should switch to CACHE-ONLY mode.
         """
-        
-        # 1. Check Cool Down Timer
-        if time.time() < self.cool_down_until:
-             return False, "System in Cool Down Mode (Overheating Protection)"
-
-        # 2. Check CPU Load (if psutil available)
-        if psutil:
-            # interval=None is non-blocking (returns last interval stats)
-            # We use a small Blocking call elsewhere or just rely on instant check
-            # For API speed, we don't want to block 1s. 
-            # psutil.cpu_percent() without interval returns immediately since last call.
-            cpu_usage = psutil.cpu_percent(interval=None)
-            
-            if cpu_usage > self.max_cpu_percent:
-                self.cool_down_until = time.time() + 10 # Cool down for 10s
-                return False, f"CPU Overheating ({cpu_usage}%). Engaged Cool Down."
-        
+        level = self.degradation_level()
+        pressure = self.load_monitor.pressure
+        if level == LEVEL_CACHE_ONLY:
+            return False, f"System Overloaded (load {pressure:.0f}%). Serving from cache only."
+        if level > 0:
+            return True, f"Degraded: {LEVEL_NAMES[level]} (load {pressure:.0f}%). Answers are shortened."
         return True, "Healthy"
 
     def get_queue_status(self, ticket_id: str) -> Dict:
-        with self.lock:
-            try:
-                pos = self.pending_queue.index(ticket_id)
-                return {
-                    "status": "queued",
-                    "position": pos + 1,
-                    "wait_time": (pos + 1) * self.avg_processing_time
-                }
-            except ValueError:
-                return {"status": "unknown", "position": -1, "wait_time": 0}
-
-    def join_queue(self) -> str:
+        return self.scheduler.status(ticket_id)
+
+    def join_queue(self, priority: int = PRIORITY_STUDENT) -> str:
         """User joins the waiting line. Returns a ticket ID."""
-        import uuid
-        ticket_id = str(uuid.uuid4())
-        with self.lock:
-            self.pending_queue.append(ticket_id)
-        return ticket_id
+        return self.scheduler.enqueue(priority).id
 
     def leave_queue(self, ticket_id: str):
-        with self.lock:
-            if ticket_id in self.pending_queue:
-                self.pending_queue.remove(ticket_id)
+        self.scheduler.cancel(ticket_id)
+
+    async def wait_for_slot(self, priority: int = PRIORITY_STUDENT, ticket_id: Optional[str] = None,
+                            timeout: Optional[float] = None, course_id: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+        """
+        Awaitable admission: waits server-side (up to `timeout`) for a slot.
+        Returns (True, _) when admitted - caller must release_slot() - or
+        (False, ticket_id) to hand back to the client for a later retry.
+        Waiting requests of one priority share slots fairly across course_id.
+        """
+        return await self.scheduler.acquire(priority, ticket_id, timeout, flow=course_id)
+
+    def set_course_weight(self, course_id: str, weight: float):
+        """Fair-share weight of a course, for admission and generation alike (default 1.0)."""
+        self.scheduler.set_weight(course_id, weight)
+        self.generation.scheduler.set_weight(course_id, weight)
 
     def acquire_slot(self, ticket_id: str = None) -> Tuple[bool, str]:
         """
-        Concurrency control with Queue Awareness.
+        Non-blocking concurrency control with Queue Awareness (polling protocol).
         Returns: (Success, Message)
         """
-        with self.lock:
-            # If system is full
-            if self.active_requests >= self.max_concurrent:
-                return False, "System Busy"
-
-            # If there is a queue, ONLY the head of the queue can enter
-            if self.pending_queue:
-                if not ticket_id: 
-                    # Newcomer trying to skip line? No.
-                    return False, "Queue Required"
-                
-                if ticket_id != self.pending_queue[0]:
-                    # User is in queue but not first
-                    return False, "Wait Your Turn"
-                
-                # User is first! Let them in.
-                self.pending_queue.pop(0)
-
-            # Grant Access
-            self.active_requests += 1
+        if ticket_id:
+            if self.scheduler.poll(ticket_id):
+                return True, "Access Granted"
+            status = self.scheduler.status(ticket_id)["status"]
+            return False, "Wait Your Turn" if status == "queued" else "Queue Required"
+        if self.scheduler.try_acquire():
             return True, "Access Granted"
+        return False, "Queue Required" if self.scheduler.queue_length() else "System Busy"
+
+    def begin_service(self) -> float:
+        """Start of a slot's service time (call once admitted); pass the result on to release_slot()."""
+        reset_gate_wait()
+        return time.monotonic()
 
-    def release_slot(self):
+    def release_slot(self, service_time: Optional[float] = None, status: Optional[str] = None):
+        """
+        Free the slot. service_time (seconds it was held) and the ChatResponse status
+        (which path was taken) feed the latency model, queue ETAs and adaptive concurrency.
+        Failed requests (no status) are not recorded. Time parked at the generation gate
+        is taken out of the sample: a saturated model queue must not shrink admission
+        (which would throttle cache hits and retrieval-only requests too).
+        """
+        self.scheduler.release()
+        if service_time is not None and status is not None:
+            self.latency.record(path_for_status(status), max(0.0, service_time - gate_wait_seconds()))
+            self._adapt_concurrency()
+
+    def _adapt_concurrency(self):
+        """
+        Every adapt_interval, judged only on generations finished since the last step:
+        p95 above target -> shrink capacity by 20%; well under target while requests are
+        queuing -> grow by one slot. Bounded by [min_concurrent, max_concurrent].
+        """
+        if not self.adaptive:
+            return
+        now = time.monotonic()
         with self.lock:
-            self.active_requests = max(0, self.active_requests - 1)
+            if now - self._last_adapt < self.adapt_interval:
+                return
+            generation = self.latency.summary(PATH_GENERATION, since=self._last_adapt)
+            if generation["count"] < self.adapt_min_samples:
+                return
+            capacity = self.scheduler.capacity
+            if generation["p95"] > self.target_generation_p95:
+                new_capacity = max(self.min_concurrent, int(capacity * 0.8))
+            elif generation["p95"] < 0.7 * self.target_generation_p95 and self.scheduler.queue_length():
+                new_capacity = min(self.max_concurrent, capacity + 1)
+            else:
+                new_capacity = capacity
+            self._last_adapt = now
+        if new_capacity != capacity:
+            self.capacity_changes += 1
+            logging.info(f"Adaptive concurrency: {capacity} -> {new_capacity} slots "
+                         f"(generation p95 {generation['p95']:.1f}s, target {self.target_generation_p95:.1f}s)")
+            self.scheduler.set_capacity(new_capacity)
+
+    def metrics(self) -> Dict:
+        """Admin view: latency per path, queue state, concurrency limits, rate limiting."""
+        return {
+            "latency": self.latency.snapshot(),
+            "queue": self.scheduler.stats(),
+            "generation": self.generation.stats(),
+            "concurrency": {
+                "capacity": self.scheduler.capacity,
+                "min": self.min_concurrent,
+                "max": self.max_concurrent,
+                "adaptive": self.adaptive,
+                "target_generation_p95": self.target_generation_p95,
+                "capacity_changes": self.capacity_changes,
+            },
+            "rate_limit": self.rate_limiter.stats(),
+        }
 
-    def check_rate_limit(self, ip: str) -> bool:
+    def check_rate_limit(self, ip: str, user: Optional[dict] = None) -> bool:
         """
-        Check if IP has exceeded rate limit.
+        Check if the client has exceeded its rate limit.
         Returns True if allowed, False if blocked.
+        `user` is the JWT payload (get_optional_user): signed-in users get their role's
+        limit and their own bucket, so a campus NAT does not pool a whole class on one IP.
+        Without it the IP gets the guest limit (none by default, see DEFAULT_RATE_LIMITS).
         """
-        now = time.time()
-        with self.lock:
-            if ip not in self.ip_requests:
-                self.ip_requests[ip] = []
-            
-            # Filter out old requests (Window slide)
-            # Efficiency: If list gets too long, this protects memory
-            self.ip_requests[ip] = [t for t in self.ip_requests[ip] if now - t < self.rate_limit_window]
-            
-            if len(self.ip_requests[ip]) >= self.max_requests_per_min:
-                return False # Block
-            
-            self.ip_requests[ip].append(now)
-            return True
+        if user and user.get("sub"):
+            return self.rate_limiter.allow(f"user:{user['sub']}", user.get("role"))
+        return self.rate_limiter.allow(f"ip:{ip}", "guest")
@@ -0,0 +1,451 @@
+import time
+import uuid
+import asyncio
+import threading
+import contextlib
+import contextvars
+import math
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Priority classes, highest first. Within a class: FIFO.
+PRIORITY_FAST_LANE = 0  # Exact answer already cached: holds a slot for milliseconds
+PRIORITY_TEACHER = 1    # Teachers/admins preparing material
+PRIORITY_VOICE = 2      # Voice mode: a user is waiting on audio, not reading
+PRIORITY_STUDENT = 3
+PRIORITY_NAMES = {
+    PRIORITY_FAST_LANE: "fast_lane",
+    PRIORITY_TEACHER: "teacher",
+    PRIORITY_VOICE: "voice",
+    PRIORITY_STUDENT: "student",
+}
+
+
+DEFAULT_FLOW = ""  # Requests without a course
+
+# Seconds the current request (asyncio task) spent parked at a GenerationGate. Admission
+# latency samples subtract it: that wait belongs to the generation queue, not to admission.
+_gate_wait: contextvars.ContextVar[float] = contextvars.ContextVar("generation_gate_wait", default=0.0)
+
+def reset_gate_wait():
+    _gate_wait.set(0.0)
+
+def gate_wait_seconds() -> float:
+    return _gate_wait.get()
+
+
+class Ticket:
+    __slots__ = ("id", "priority", "flow", "seq", "state", "enqueued_at", "granted_at", "waiting", "wakers")
+
+    def __init__(self, priority: int, flow: str, seq: int):
+        self.id = str(uuid.uuid4())
+        self.priority = priority
+        self.flow = flow  # Fair-share unit (course_id)
+        self.seq = seq  # Order within its flow (position estimate)
+        self.state = "queued"  # queued -> granted -> claimed | cancelled
+        self.enqueued_at = time.monotonic()
+        self.granted_at = 0.0
+        self.waiting = 0  # Requests currently awaiting this ticket server-side
+        # (loop, future) for async waiters, (None, threading.Event) for acquire_blocking()
+        self.wakers: List[Tuple[Optional[asyncio.AbstractEventLoop], object]] = []
+
+
+class AdmissionScheduler:
+    """
+    Slot scheduler behind ResourceGuard.
+
+    - Strict priority between classes. Within a class, weighted fair queuing across
+      flows (course_ids): each flow is a FIFO OrderedDict with a virtual finish tag
+      that advances by 1/weight per grant, and the flow with the lowest tag goes next.
+      One busy course therefore gets its weighted share, not the whole pool.
+      Enqueue and cancel are O(1), a grant is O(#waiting flows).
+    - acquire() is awaitable: the request waits server-side until a slot is handed
+      to it (release() passes the slot straight to the next ticket), instead of
+      clients re-POSTing to advance.
+    - Ticket protocol compatibility: a wait that times out keeps its ticket and place;
+      the client re-POSTs with ticket_id and resumes waiting (or claims the slot if it
+      was granted meanwhile). Granted-but-unclaimed slots go back after claim_ttl.
+    - ETAs come from `service_time(stat)`: measured slot hold times (ResourceGuard's
+      LatencyModel), not a constant.
+
+    Thread-safe: slots are released from request handlers and from Starlette's
+    background threadpool alike; waiters are woken on their own event loop.
+    """
+    def __init__(self, capacity: int, claim_ttl: float = 15.0, ewma_alpha: float = 0.2,
+                 service_time: Optional[Callable[[str], float]] = None):
+        self.capacity = capacity
+        self.claim_ttl = claim_ttl
+        self.ewma_alpha = ewma_alpha
+        # stat ("mean" / "p95") -> seconds a slot is held
+        self.service_time = service_time or (lambda stat="mean": 2.0)
+        self._lock = threading.Lock()
+        # priority -> flow -> FIFO of tickets. Empty flows are dropped (with their tag and seq).
+        self._queues: Dict[int, Dict[str, "OrderedDict[str, Ticket]"]] = {p: {} for p in PRIORITY_NAMES}
+        self._next_seq: Dict[Tuple[int, str], int] = {}
+        self._tags: Dict[Tuple[int, str], float] = {}  # Virtual finish tag per waiting flow
+        self._vclock = {p: 0.0 for p in PRIORITY_NAMES}  # Tag of the last grant per class
+        self.weights: Dict[str, float] = {}  # flow -> weight (default 1.0)
+        self._tickets: Dict[str, Ticket] = {}  # Queued or granted-unclaimed
+        self._granted: "OrderedDict[str, Ticket]" = OrderedDict()  # Granted-unclaimed, by grant time
+        self.active = 0
+        self.avg_wait_time = 0.0  # EWMA of time spent queued (seconds)
+        self.admitted = {p: 0 for p in PRIORITY_NAMES}
+        self.expired = 0
+
+    # --- Admission ---
+
+    def try_acquire(self, priority: Optional[int] = None) -> bool:
+        """Non-blocking: take a free slot only if nobody is waiting for one."""
+        with self._lock:
+            wake = self._grant_locked()
+            acquired = self.active < self.capacity  # After granting, a free slot means nobody is queued
+            if acquired:
+                self.active += 1
+                if priority is not None:
+                    self.admitted[priority] += 1
+        self._wake(wake)
+        return acquired
+
+    def enqueue(self, priority: int = PRIORITY_STUDENT, flow: Optional[str] = None) -> Ticket:
+        flow = DEFAULT_FLOW if flow is None else flow
+        with self._lock:
+            key = (priority, flow)
+            ticket = Ticket(priority, flow, self._next_seq.get(key, 0))
+            self._next_seq[key] = ticket.seq + 1
+            queue = self._queues[priority].get(flow)
+            if queue is None:
+                # A flow (re)joining starts at the current virtual time: idle time earns no credit
+                queue = self._queues[priority][flow] = OrderedDict()
+                self._tags[key] = self._vclock[priority]
+            queue[ticket.id] = ticket
+            self._tickets[ticket.id] = ticket
+            wake = self._grant_locked()
+        self._wake(wake)
+        return ticket
+
+    async def acquire(self, priority: int = PRIORITY_STUDENT, ticket_id: Optional[str] = None,
+                      timeout: Optional[float] = None, flow: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+        """
+        Wait for a slot. Returns (True, ticket_id or None) once admitted - the caller
+        must release(). On timeout returns (False, ticket_id); the ticket keeps its place.
+        A known ticket_id resumes that ticket; an unknown one is treated as a newcomer.
+        """
+        ticket = self._tickets.get(ticket_id) if ticket_id else None
+        if ticket is None:
+            if self.try_acquire(priority):
+                return True, None
+            ticket = self.enqueue(priority, flow)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if ticket.state == "granted":
+                self._claim_locked(ticket)
+                return True, ticket.id
+            if ticket.state != "queued":
+                return False, None
+            ticket.waiting += 1
+            ticket.wakers.append((loop, future))
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._detach(ticket, future)
+            self.cancel(ticket.id)  # Client went away: give the place (or slot) up
+            raise
+
+        self._detach(ticket, future)
+        with self._lock:
+            if ticket.state == "granted":  # Also covers a grant racing the timeout
+                self._claim_locked(ticket)
+                return True, ticket.id
+            return False, ticket.id
+
+    def acquire_blocking(self, priority: int = PRIORITY_STUDENT, timeout: Optional[float] = None,
+                         flow: Optional[str] = None) -> bool:
+        """acquire() for plain threads (sync callers). On timeout the ticket is given up."""
+        if self.try_acquire(priority):
+            return True
+        ticket = self.enqueue(priority, flow)
+        event = threading.Event()
+        with self._lock:
+            if ticket.state == "granted":
+                self._claim_locked(ticket)
+                return True
+            ticket.waiting += 1
+            ticket.wakers.append((None, event))
+        event.wait(timeout)
+        self._detach(ticket, event)
+        with self._lock:
+            if ticket.state == "granted":
+                self._claim_locked(ticket)
+                return True
+        self.cancel(ticket.id)
+        return False
+
+    def poll(self, ticket_id: str) -> bool:
+        """Non-blocking claim for the legacy polling protocol."""
+        with self._lock:
+            wake = self._grant_locked()
+            ticket = self._tickets.get(ticket_id)
+            claimed = ticket is not None and ticket.state == "granted"
+            if claimed:
+                self._claim_locked(ticket)
+        self._wake(wake)
+        return claimed
+
+    def release(self):
+        """Free a slot and hand it to the next ticket, if any."""
+        with self._lock:
+            self.active = max(0, self.active - 1)
+            wake = self._grant_locked()
+        self._wake(wake)
+
+    def reclaim(self):
+        """Take a slot back without waiting (after lending it with release()). May briefly exceed capacity."""
+        with self._lock:
+            self.active += 1
+
+    def set_weight(self, flow: str, weight: float):
+        """Relative share of `flow` within its priority class (e.g. 2.0 for a course with an exam tomorrow)."""
+        with self._lock:
+            if weight == 1.0:
+                self.weights.pop(flow, None)
+            else:
+                self.weights[flow] = max(weight, 0.01)
+
+    def set_capacity(self, capacity: int):
+        """Resize (adaptive concurrency). Shrinking never revokes slots; it just stops granting."""
+        with self._lock:
+            self.capacity = capacity
+            wake = self._grant_locked()
+        self._wake(wake)
+
+    def cancel(self, ticket_id: str):
+        """Leave the queue; a granted-but-unclaimed slot goes to the next ticket."""
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            if ticket is None:
+                return
+            was_granted = ticket.state == "granted"
+            self._forget_locked(ticket, "cancelled")
+            if was_granted:
+                self.active = max(0, self.active - 1)
+            wake = self._grant_locked()
+        self._wake(wake)
+
+    # --- Introspection ---
+
+    def status(self, ticket_id: str) -> Dict:
+        with self._lock:
+            wake = self._grant_locked()
+            ticket = self._tickets.get(ticket_id) if ticket_id else None
+            if ticket is None:
+                result = {"status": "unknown", "position": -1, "wait_time": 0}
+            elif ticket.state == "granted":
+                result = {"status": "ready", "position": 0, "wait_time": 0,
+                          "priority": PRIORITY_NAMES[ticket.priority]}
+            else:
+                position = self._position_locked(ticket)
+                result = {"status": "queued", "position": position,
+                          "wait_time": self._eta_locked(position, "mean"),
+                          "wait_time_p95": self._eta_locked(position, "p95"),
+                          "priority": PRIORITY_NAMES[ticket.priority]}
+        self._wake(wake)
+        return result
+
+    def queue_length(self) -> int:
+        return len(self._tickets) - len(self._granted)
+
+    def _class_length(self, priority: int) -> int:
+        return sum(len(q) for q in self._queues[priority].values())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "active": self.active,
+                "queued": {PRIORITY_NAMES[p]: self._class_length(p) for p in PRIORITY_NAMES},
+                "queued_by_flow": self._queued_by_flow_locked(),
+                "weights": dict(self.weights),
+                "granted_unclaimed": len(self._granted),
+                "admitted": {PRIORITY_NAMES[p]: n for p, n in self.admitted.items()},
+                "expired_grants": self.expired,
+                "service_time_estimate": round(self.service_time("mean"), 3),
+                "avg_wait_time": round(self.avg_wait_time, 3),
+            }
+
+    # --- Internals (call with self._lock held) ---
+
+    def _queued_by_flow_locked(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for flows in self._queues.values():
+            for flow, queue in flows.items():
+                counts[flow] = counts.get(flow, 0) + len(queue)
+        return counts
+
+    def _weight(self, flow: str) -> float:
+        return self.weights.get(flow, 1.0)
+
+    def _position_locked(self, ticket: Ticket) -> int:
+        """
+        1-based and O(#classes + #flows): everyone in higher classes, plus the distance to
+        the head of the ticket's flow, plus what the other flows of its class get served
+        meanwhile (their weighted share of as many grants). Cancellations ahead within the
+        flow are not subtracted, so it can only overestimate.
+        """
+        ahead = sum(self._class_length(p) for p in PRIORITY_NAMES if p < ticket.priority)
+        flows = self._queues[ticket.priority]
+        queue = flows[ticket.flow]
+        head = next(iter(queue.values()), ticket)
+        rank = min(ticket.seq - head.seq, len(queue) - 1) + 1  # Within its own flow
+        mine = self._weight(ticket.flow)
+        others = sum(min(len(q), math.ceil(rank * self._weight(f) / mine))
+                     for f, q in flows.items() if f != ticket.flow)
+        return ahead + rank + others
+
+    def _eta_locked(self, position: int, stat: str) -> float:
+        # `capacity` slots drain in parallel, each freeing every service_time seconds
+        return round(position * self.service_time(stat) / max(self.capacity, 1), 2)
+
+    def _grant_locked(self) -> List[Ticket]:
+        """Expire abandoned grants, then hand free slots to the head tickets. Returns tickets to wake."""
+        self._expire_unclaimed_locked()
+        granted = []
+        while self.active < self.capacity:
+            ticket = self._pop_next_locked()
+            if ticket is None:
+                break
+            ticket.state = "granted"
+            ticket.granted_at = time.monotonic()
+            self._granted[ticket.id] = ticket
+            self.active += 1
+            granted.append(ticket)
+        return granted
+
+    def _pop_next_locked(self) -> Optional[Ticket]:
+        for priority in sorted(self._queues):
+            flows = self._queues[priority]
+            if flows:
+                flow = min(flows, key=lambda f: self._tags[(priority, f)])
+                key = (priority, flow)
+                self._vclock[priority] = self._tags[key]
+                self._tags[key] += 1.0 / self._weight(flow)
+                ticket = flows[flow].popitem(last=False)[1]
+                if not flows[flow]:
+                    self._drop_flow_locked(priority, flow)
+                return ticket
+        return None
+
+    def _drop_flow_locked(self, priority: int, flow: str):
+        del self._queues[priority][flow]
+        self._tags.pop((priority, flow), None)
+        self._next_seq.pop((priority, flow), None)
+
+    def _claim_locked(self, ticket: Ticket):
+        wait = time.monotonic() - ticket.enqueued_at
+        self.avg_wait_time += self.ewma_alpha * (wait - self.avg_wait_time)
+        self.admitted[ticket.priority] += 1
+        self._forget_locked(ticket, "claimed")
+
+    def _forget_locked(self, ticket: Ticket, state: str):
+        ticket.state = state
+        self._tickets.pop(ticket.id, None)
+        self._granted.pop(ticket.id, None)
+        queue = self._queues[ticket.priority].get(ticket.flow)
+        if queue is not None and queue.pop(ticket.id, None) is not None and not queue:
+            self._drop_flow_locked(ticket.priority, ticket.flow)
+
+    def _expire_unclaimed_locked(self):
+        """Slots granted to tickets nobody is waiting on (client stopped polling) go back."""
+        deadline = time.monotonic() - self.claim_ttl
+        while self._granted:
+            ticket = next(iter(self._granted.values()))
+            if ticket.granted_at > deadline:
+                break
+            if ticket.waiting:
+                self._granted.move_to_end(ticket.id)  # A live waiter is about to claim it
+                break
+            self._forget_locked(ticket, "cancelled")
+            self.active = max(0, self.active - 1)
+            self.expired += 1
+
+    def _detach(self, ticket: Ticket, future):
+        with self._lock:
+            ticket.waiting -= 1
+            ticket.wakers = [(l, f) for l, f in ticket.wakers if f is not future]
+
+    @staticmethod
+    def _wake(tickets: List[Ticket]):
+        for ticket in tickets:
+            for loop, future in list(ticket.wakers):
+                if loop is None:
+                    future.set()  # Thread waiter
+                else:
+                    loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(True))
+
+
+class GenerationGate:
+    """
+    Separate, much smaller cap on concurrent LLM generations, fair across courses.
+
+    Layered under admission: a request that has to wait for a generation slot lends its
+    admission slot back for the duration of its generation stage (up to `max_parked`
+    requests at a time), so cache hits and retrieval keep being admitted while the model
+    is saturated. The slot is reclaimed without waiting once the generation is done, so
+    the caller's normal release() still balances.
+    """
+    def __init__(self, capacity: int = 4, admission: Optional[AdmissionScheduler] = None,
+                 max_parked: int = 64):
+        self.scheduler = AdmissionScheduler(capacity=capacity)
+        self.admission = admission
+        self.max_parked = max_parked
+        self.parked = 0
+        self._lock = threading.Lock()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, flow: Optional[str] = None, priority: int = PRIORITY_STUDENT):
+        """`async with gate.slot(course_id):` around one LLM call (or stream)."""
+        parked = False
+        if not self.scheduler.try_acquire(priority):
+            with self._lock:
+                parked = self.admission is not None and self.parked < self.max_parked
+                if parked:
+                    self.parked += 1
+            if parked:
+                self.admission.release()
+            started = time.monotonic()
+            try:
+                await self.scheduler.acquire(priority, flow=flow)  # No timeout: cancelled with the request
+            except BaseException:
+                self._unpark(parked)
+                raise
+            finally:
+                _gate_wait.set(_gate_wait.get() + time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self.scheduler.release()
+            self._unpark(parked)
+
+    @contextlib.contextmanager
+    def slot_blocking(self, flow: Optional[str] = None, priority: int = PRIORITY_STUDENT):
+        """`with gate.slot_blocking(course_id):` for sync callers (threads holding no admission slot)."""
+        self.scheduler.acquire_blocking(priority, flow=flow)
+        try:
+            yield
+        finally:
+            self.scheduler.release()
+
+    def _unpark(self, parked: bool):
+        if parked:
+            self.admission.reclaim()
+            with self._lock:
+                self.parked -= 1
+
+    def stats(self) -> Dict:
+        stats = self.scheduler.stats()
+        stats["parked_admission_slots"] = self.parked
+        return stats
@@ -0,0 +1,44 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class BlockingExecutor:
+    """
+    Bounded thread pool for the blocking calls left on the async path
+    (LanceDB search, SQLite). Size it to the ResourceGuard slot count so
+    admitted requests never queue behind each other for a thread, while
+    the event loop itself never blocks.
+    """
+    def __init__(self, max_workers: int = 32, name: str = "blocking-io"):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+_default_executor: Optional[BlockingExecutor] = None
+_default_lock = threading.Lock()
+
+def configure_blocking_executor(max_workers: int) -> BlockingExecutor:
+    """Replace the process-wide executor (call once at startup)."""
+    global _default_executor
+    with _default_lock:
+        if _default_executor is not None:
+            _default_executor.shutdown(wait=False)
+        _default_executor = BlockingExecutor(max_workers=max_workers)
+        return _default_executor
+
+def get_blocking_executor() -> BlockingExecutor:
+    global _default_executor
+    with _default_lock:
+        if _default_executor is None:
+            _default_executor = BlockingExecutor()
+        return _default_executor
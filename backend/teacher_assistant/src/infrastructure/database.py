@@ -1,23 +1,138 @@
 import lancedb
+from lancedb.index import FTS, IvfPq, HnswSq
 import pandas as pd
+import numpy as np
 import os
 import re
-from typing import List, Dict, Any
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional
 from functools import lru_cache
 
+
+# Supported ANN index types (distance must stay L2: _distance is compared with flat-scan values)
+VECTOR_INDEX_CONFIGS = {
+    "IVF_PQ": lambda: IvfPq(distance_type="l2"),
+    "IVF_HNSW_SQ": lambda: HnswSq(distance_type="l2"),
+}
+
+# Lowercased copy of `content` written at ingest time, so re-ranking never lowercases on the hot path
+CONTENT_LOWER = "content_lower"
+
+
+def smart_scores(results: pd.DataFrame, query: str) -> np.ndarray:
+    """
+    Vectorized SMART SCORING over a candidate frame (content/source columns):
+      +3  per query word found in content
+      +25 per query word found in source (filename match = HUGE boost)
+      +5  if the first 20 query chars appear in content (exact phrase)
+    Uses the precomputed `content_lower` column when the table has it; each
+    signal is one pass over a column into a numpy mask (no per-row apply).
+    """
+    query_lower = query.lower()
+    query_words = [w for w in re.split(r'\W+', query_lower) if len(w) > 2]
+    n = len(results)
+
+    if CONTENT_LOWER in results.columns:
+        content = results[CONTENT_LOWER].tolist()
+    else:
+        content = [c.lower() for c in results['content'].tolist()]
+    source = [s.lower() for s in results['source'].tolist()]
+
+    def mask(needle, column):
+        return np.fromiter((needle in text for text in column), dtype=bool, count=n)
+
+    score = np.zeros(n, dtype=np.int64)
+    for word in query_words:
+        score += 3 * mask(word, content)
+        score += 25 * mask(word, source)
+    score += 5 * mask(query_lower[:20], content)
+    return score
+
+
+def reciprocal_rank_fusion(vector_hits: pd.DataFrame, fts_hits: pd.DataFrame, k: int = 60) -> pd.DataFrame:
+    """
+    Merge ANN and FTS hits on `_rowid` with RRF: sum over signals of 1 / (k + rank).
+    Keeps each signal's own evidence: `_distance`/`vector_rank` and `fts_score`/`fts_rank`
+    (NaN where the chunk was not returned by that signal) plus the fused `rrf_score`.
+    """
+    vector_hits = vector_hits.reset_index(drop=True).assign(vector_rank=lambda f: f.index + 1)
+    fts_hits = fts_hits.reset_index(drop=True).rename(columns={'_score': 'fts_score'})
+    fts_hits = fts_hits.assign(fts_rank=fts_hits.index + 1)
+
+    fts_only = fts_hits[~fts_hits['_rowid'].isin(vector_hits['_rowid'])]
+    fused = pd.concat([vector_hits, fts_only.drop(columns=['fts_score', 'fts_rank'])], ignore_index=True)
+    fused = fused.merge(fts_hits[['_rowid', 'fts_score', 'fts_rank']], on='_rowid', how='left')
+
+    fused['rrf_score'] = (1.0 / (k + fused['vector_rank'])).fillna(0.0) + (1.0 / (k + fused['fts_rank'])).fillna(0.0)
+    return fused
+
+
 class VectorDatabase:
-    def __init__(self, db_path="./super_precise_db"):
+    def __init__(self, db_path="./super_precise_db", rrf_k: int = 60, candidate_factor: int = 2,
+                 index_min_rows: int = 50_000, index_type: str = "IVF_PQ",
+                 nprobes: int = 20, refine_factor: Optional[int] = 10, reindex_unindexed_ratio: float = 0.1,
+                 refresh_interval: float = 5.0):
         self.db_path = db_path
         self.table_name = "knowledge_base"
+        self.rrf_k = rrf_k
+        # Hybrid mode: each signal fetches limit * candidate_factor rows (vector-only mode used limit * 5)
+        self.candidate_factor = candidate_factor
+        # ANN index: below index_min_rows a flat scan is exact and fast enough
+        self.index_min_rows = index_min_rows
+        self.index_type = index_type
+        self.nprobes = nprobes  # IVF partitions probed per query (recall vs latency)
+        self.refine_factor = refine_factor  # Re-rank refine_factor * limit PQ hits with full vectors
+        # Fold appended rows into the index once they exceed this share of the table
+        self.reindex_unindexed_ratio = reindex_unindexed_ratio
         os.makedirs(db_path, exist_ok=True)
-        self.db = lancedb.connect(db_path)
+        # Seconds before a cached handle/count re-checks for versions written by other processes
+        self.refresh_interval = refresh_interval
+        self.db = lancedb.connect(db_path, read_consistency_interval=timedelta(seconds=refresh_interval))
         self._filename_cache = {}  # Cache for filename lookups
+        # Open table handle reused by every request (no table_names()/open_table() on the hot path)
+        self._table_lock = threading.Lock()
+        self._table = None
+        self._table_checked_at = float('-inf')  # Last existence check while there is no table
+        self._row_count: Optional[int] = None
+        self._fts_warned = False  # "FTS unavailable" already printed for the current table
+        self._row_count_at = 0.0
 
-    def insert_chunks(self, chunks: List[Dict[str, Any]]):
+    def _open_table(self, recheck: bool = False):
+        """
+        Cached handle of the knowledge_base table, or None if it does not exist.
+        Writes made through this object swap/refresh the handle directly; LanceDB
+        re-reads the manifest at most every refresh_interval seconds
+        (read_consistency_interval), so versions committed elsewhere are picked up too.
+        """
+        tbl = self._table
+        if tbl is not None:
+            return tbl
+        now = time.monotonic()
+        if not recheck and now - self._table_checked_at < self.refresh_interval:
+            return None
+        with self._table_lock:
+            if self._table is None:
+                self._table_checked_at = now
+                if self.table_name in self.db.list_tables().tables:
+                    self._table = self.db.open_table(self.table_name)
+            return self._table
+
+    def _table_written(self, tbl=None):
+        """Called after every write: adopt the new handle and drop the cached row count."""
+        if tbl is not None:
+            self._table = tbl
+        self._row_count = None
+
+    def insert_chunks(self, chunks: List[Dict[str, Any]], fts_index: bool = True):
+        """Replace the whole table with `chunks`. fts_index=False when more appends follow (rebuild_fts_index after)."""
         if not chunks:
             return
-        tbl = self.db.create_table(self.table_name, data=chunks, mode="overwrite")
-        tbl.create_fts_index("content", replace=True)
+        tbl = self.db.create_table(self.table_name, data=self._with_search_columns(chunks), mode="overwrite")
+        if fts_index:
+            self._create_fts_index(tbl)
+        self._table_written(tbl)
         # Build filename cache
         self._filename_cache = {}
         for c in chunks:
@@ -25,66 +140,188 @@ class VectorDatabase:
             if fname not in self._filename_cache:
                 self._filename_cache[fname] = []
 
+    def replace_sources(self, chunks: List[Dict[str, Any]], sources: List[str]):
+        """
+        Incremental upsert: drop every chunk of `sources`, then append `chunks`.
+        Unlike insert_chunks, the rest of the table is untouched. The FTS index
+        is NOT rebuilt here - call rebuild_fts_index() once per ingestion batch.
+        """
+        tbl = self._open_table(recheck=True)
+        if tbl is None:
+            if chunks:
+                self._table_written(self.db.create_table(self.table_name, data=self._with_search_columns(chunks)))
+            return
+        if sources:
+            tbl.delete(self._source_filter(sources))
+        if chunks:
+            # Tables created before content_lower existed keep their schema
+            if CONTENT_LOWER in tbl.schema.names:
+                chunks = self._with_search_columns(chunks)
+            tbl.add(chunks)
+        self._table_written()
+
+    def rebuild_fts_index(self):
+        tbl = self._open_table(recheck=True)
+        if tbl is None:
+            return
+        if len(tbl) > 0:
+            self._create_fts_index(tbl)
+
+    def _create_fts_index(self, tbl):
+        # create_index(config=FTS()) replaces the deprecated create_fts_index (same defaults)
+        tbl.create_index("content", config=FTS(), replace=True)
+        self._fts_warned = False  # A later failure is worth reporting again
+
+    def ensure_vector_index(self) -> str:
+        """
+        Creates the ANN index (IVF_PQ or IVF_HNSW_SQ) once the table reaches index_min_rows, and folds rows
+        appended since then into it (optimize) once they exceed reindex_unindexed_ratio.
+        Returns what was done: "missing_table", "below_threshold", "created", "optimized" or "ok".
+        """
+        tbl = self._open_table(recheck=True)
+        if tbl is None:
+            return "missing_table"
+        rows = tbl.count_rows()
+        index = self._vector_index(tbl)
+        if index is None:
+            if rows < self.index_min_rows:
+                return "below_threshold"
+            tbl.create_index("vector", config=VECTOR_INDEX_CONFIGS[self.index_type]())
+            print(f"🧭 Built {self.index_type} index over {rows} chunks ({self.db_path})")
+            return "created"
+        if index.num_unindexed_rows >= self.reindex_unindexed_ratio * max(rows, 1):
+            tbl.optimize()
+            return "optimized"
+        return "ok"
+
+    def index_health(self) -> Dict[str, Any]:
+        """Row counts, unindexed rows and index age for the vector and FTS indices."""
+        tbl = self._open_table()
+        if tbl is None:
+            return {"rows": 0, "index_min_rows": self.index_min_rows, "vector_index": None, "fts_index": None}
+        rows = tbl.count_rows()
+        now = datetime.now(timezone.utc)
+
+        def describe(index):
+            if index is None:
+                return None
+            return {
+                "name": index.name,
+                "type": index.index_type,
+                "indexed_rows": index.num_indexed_rows,
+                "unindexed_rows": index.num_unindexed_rows,
+                "created_at": index.created_at.isoformat() if index.created_at else None,
+                "age_seconds": round((now - index.created_at).total_seconds()) if index.created_at else None,
+            }
+
+        vector_index = self._vector_index(tbl)
+        return {
+            "rows": rows,
+            "index_min_rows": self.index_min_rows,
+            "needs_vector_index": vector_index is None and rows >= self.index_min_rows,
+            "search_params": {"nprobes": self.nprobes, "refine_factor": self.refine_factor},
+            "vector_index": describe(vector_index),
+            "fts_index": describe(self._index_on(tbl, "content")),
+        }
+
+    @staticmethod
+    def _index_on(tbl, column: str):
+        return next((i for i in tbl.list_indices() if list(i.columns) == [column]), None)
+
+    def _vector_index(self, tbl):
+        return self._index_on(tbl, "vector")
+
+    def _vector_query(self, tbl, vector: List[float]):
+        """ANN query with the configured IVF search parameters (ignored by flat scans)."""
+        query = tbl.search(vector).nprobes(self.nprobes)
+        if self.refine_factor:
+            query = query.refine_factor(self.refine_factor)
+        return query
+
+    @staticmethod
+    def _with_search_columns(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [{**c, CONTENT_LOWER: c['content'].lower()} for c in chunks]
+
+    @staticmethod
+    def _source_filter(sources: List[str]) -> str:
+        quoted = ", ".join("'" + s.replace("'", "''") + "'" for s in sources)
+        return f"source IN ({quoted})"
+
     def search(self, vector: List[float], limit: int = 10) -> pd.DataFrame:
-        if self.table_name not in self.db.table_names():
+        tbl = self._open_table()
+        if tbl is None:
             return pd.DataFrame()
-        tbl = self.db.open_table(self.table_name)
-        return tbl.search(vector).limit(limit).to_pandas()
+        return self._vector_query(tbl, vector).limit(limit).to_pandas()
 
-    def smart_search(self, vector: List[float], query: str, limit: int = 12) -> pd.DataFrame:
-        """ULTRA-SMART: Vector search + keyword boost + filename priority."""
-        if self.table_name not in self.db.table_names():
+    def smart_search(self, vector: List[float], query: str, limit: int = 12, mode: str = "hybrid") -> pd.DataFrame:
+        """
+        ULTRA-SMART: Vector search + keyword boost + filename priority.
+        mode="hybrid" also queries the FTS index and fuses both rankings (RRF), so a chunk
+        with the exact term but a weak embedding still becomes a candidate.
+        mode="vector" is the previous ANN-only behaviour.
+        """
+        tbl = self._open_table()
+        if tbl is None:
             return pd.DataFrame()
         
-        tbl = self.db.open_table(self.table_name)
-        
-        # 1. Get more candidates for re-ranking
-        results = tbl.search(vector).limit(limit * 5).to_pandas()
+        # 1. Get candidates for re-ranking
+        if mode == "hybrid":
+            results = self._hybrid_candidates(tbl, vector, query, limit * self.candidate_factor)
+            tiebreak, tiebreak_ascending = 'rrf_score', False
+        else:
+            results = self._vector_query(tbl, vector).limit(limit * 5).to_pandas()
+            tiebreak, tiebreak_ascending = '_distance', True
         
         if results.empty:
             return results
         
-        # 2. SMART SCORING: Combine multiple signals
-        query_lower = query.lower()
-        query_words = [w for w in re.split(r'\W+', query_lower) if len(w) > 2]
+        # 2. SMART SCORING: Combine multiple signals (vectorized)
+        results['smart_score'] = smart_scores(results, query)
+        results = results.drop(columns=[CONTENT_LOWER, '_rowid'], errors='ignore')
         
-        def smart_score(row):
-            content = row['content'].lower()
-            source = row['source'].lower()
-            score = 0
-            
-            # Keyword match bonus (highest priority)
-            for word in query_words:
-                if word in content:
-                    score += 3
-                if word in source:  # Filename match = HUGE boost
-                    score += 25
-            
-            # Exact phrase match
-            if query_lower[:20] in content:
-                score += 5
-            
-            return score
-        
-        results['smart_score'] = results.apply(smart_score, axis=1)
-        
-        # 3. Sort by smart score, then by vector distance
+        # 3. Sort by smart score, then by the fused rank (hybrid) or vector distance
         results = results.sort_values(
-            by=['smart_score', '_distance'],
-            ascending=[False, True]
+            by=['smart_score', tiebreak],
+            ascending=[False, tiebreak_ascending]
         )
         
         return results.head(limit)
 
+    def _hybrid_candidates(self, tbl, vector: List[float], query: str, candidates: int) -> pd.DataFrame:
+        vector_hits = self._vector_query(tbl, vector).with_row_id(True).limit(candidates).to_pandas()
+        try:
+            fts_hits = tbl.search(query, query_type="fts").with_row_id(True).limit(candidates).to_pandas()
+        except Exception as e:
+            # No FTS index yet (e.g. table written before the first rebuild): ANN only.
+            # Reported once, not on every search
+            if not self._fts_warned:
+                self._fts_warned = True
+                print(f"FTS unavailable, vector-only retrieval: {e}")
+            fts_hits = pd.DataFrame({'_rowid': pd.Series(dtype='uint64'), '_score': pd.Series(dtype='float32')})
+
+        fused = reciprocal_rank_fusion(vector_hits, fts_hits, k=self.rrf_k)
+        # FTS-only chunks have no ANN distance; compute it from their stored vectors (L2, as the ANN search)
+        missing = fused['_distance'].isna()
+        if missing.any():
+            stored = np.stack(fused.loc[missing, 'vector'].to_numpy())
+            fused.loc[missing, '_distance'] = ((stored - np.asarray(vector, dtype=stored.dtype)) ** 2).sum(axis=1)
+        return fused
+
     def count(self) -> int:
-        if self.table_name not in self.db.table_names():
+        """Row count from cached table metadata; re-read after our own writes or every refresh_interval."""
+        tbl = self._open_table()
+        if tbl is None:
             return 0
-        return len(self.db.open_table(self.table_name))
+        now = time.monotonic()
+        if self._row_count is None or now - self._row_count_at >= self.refresh_interval:
+            self._row_count = tbl.count_rows()
+            self._row_count_at = now
+        return self._row_count
 
     def delete_by_source(self, filename: str):
         """Neural Wipe: Delete all chunks associated with a specific file."""
-        if self.table_name not in self.db.table_names():
+        tbl = self._open_table()
+        if tbl is None:
             return
-        tbl = self.db.open_table(self.table_name)
-        # Use single quotes for the filename in the SQL-like filter
-        tbl.delete(f"source = '{filename}'")
+        tbl.delete(self._source_filter([filename]))
+        self._table_written()
@@ -0,0 +1,305 @@
+import os
+import re
+import threading
+import multiprocessing
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+import pdfplumber
+import pandas as pd
+from pptx import Presentation
+from docx import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from .ingest_manifest import hash_file
+from .page_text_store import PageTextStore
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.pptx', '.docx', '.txt', '.xlsx')
+# Formats whose text extraction is CPU-bound Python (worth a worker process)
+HEAVY_EXTENSIONS = ('.pdf', '.pptx', '.docx', '.xlsx')
+
+# OPTIMIZED: Larger chunks for better context preservation
+CHUNK_SIZE = 800      # Full paragraphs
+CHUNK_OVERLAP = 100   # Better continuity
+
+_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+def get_splitter() -> RecursiveCharacterTextSplitter:
+    """One splitter per process (worker processes build their own)."""
+    global _splitter
+    if _splitter is None:
+        _splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return _splitter
+
+ParseResult = Tuple[str, List[dict], Optional[str]]  # (path, chunks, error)
+
+# Per-process page text cache (worker processes open their own, see ParsePool)
+_page_cache_path: Optional[str] = None
+_page_cache: Optional[PageTextStore] = None
+
+def configure_page_cache(path: Optional[str]):
+    """Where extracted PDF page text is cached (None disables). Set before the parse pool starts."""
+    global _page_cache_path, _page_cache
+    _page_cache_path, _page_cache = path, None
+
+def get_page_cache() -> Optional[PageTextStore]:
+    global _page_cache
+    if _page_cache is None and _page_cache_path:
+        _page_cache = PageTextStore(_page_cache_path)
+    return _page_cache
+
+
+def iter_pdf_pages(path: str, cache: Optional[PageTextStore] = None,
+                   file_hash: Optional[str] = None) -> Iterator[Tuple[int, str]]:
+    """
+    (page number, text) one page at a time. Each page's layout objects are released as soon
+    as its text is out, so a 500-page scan never holds more than one page in memory.
+    With a cache, pages already extracted from this content are served from disk, and a
+    fully cached file is not even opened. Pass the content hash when the caller already has
+    it (ingestion manifest, upload); the file is only hashed here when none is given.
+    """
+    if cache and file_hash is None:
+        file_hash = hash_file(path)
+    cached: Dict[int, str] = cache.get_pages(file_hash) if cache else {}
+    count = cache.page_count(file_hash) if cache else None
+    if count is not None and all(i in cached for i in range(count)):
+        for i in range(count):
+            yield i, cached[i]
+        return
+    with pdfplumber.open(path) as pdf:
+        for i, page in enumerate(pdf.pages):
+            text = cached.get(i)
+            if text is None:
+                text = page.extract_text() or ""
+                if cache:
+                    cache.put_page(file_hash, i, text)  # Per page: an interrupted run keeps its progress
+            page.close()  # Drop parsed objects and layout caches
+            yield i, text
+        if cache:
+            cache.set_page_count(file_hash, len(pdf.pages))
+
+
+def iter_blocks(path: str, file_hash: Optional[str] = None) -> Iterator[dict]:
+    """{text, loc} blocks of one file, produced lazily (PDFs page by page)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pptx":
+        prs = Presentation(path)
+        for i, slide in enumerate(prs.slides):
+            # Get slide title if available
+            title = ""
+            for shape in slide.shapes:
+                if shape.has_text_frame and shape.text_frame.paragraphs:
+                    title = shape.text_frame.paragraphs[0].text[:50]
+                    break
+            text = " ".join([s.text for s in slide.shapes if hasattr(s, "text")])
+            if text.strip():
+                loc = f"Slide {i+1}" + (f": {title}" if title else "")
+                yield {"text": text, "loc": loc}
+    elif ext == ".pdf":
+        for i, text in iter_pdf_pages(path, get_page_cache(), file_hash):
+            if text:
+                yield {"text": text, "loc": f"Page {i+1}"}
+    elif ext == ".docx":
+        doc = Document(path)
+        # Group paragraphs for better context
+        current_text = ""
+        sections = 0
+        for p in doc.paragraphs:
+            if p.text.strip():
+                current_text += p.text + " "
+                if len(current_text) > 500:  # Group small paragraphs
+                    sections += 1
+                    yield {"text": current_text, "loc": f"Section {sections}"}
+                    current_text = ""
+        if current_text.strip():
+            yield {"text": current_text, "loc": f"Section {sections + 1}"}
+    elif ext == ".txt":
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+            if text.strip():
+                yield {"text": text, "loc": "Full Document"}
+    elif ext == ".xlsx":
+        # PANDAS MAGIC: Read all sheets
+        xls = pd.ExcelFile(path)
+        for sheet_name in xls.sheet_names:
+            df = pd.read_excel(xls, sheet_name=sheet_name)
+            # Convert to string representation
+            text = df.to_string(index=False)
+            if len(text) > 50: # Ignore empty sheets
+                print(f"📊 EXCEL DEBUG: Extracted {len(text)} chars from sheet '{sheet_name}'")
+                yield {"text": text, "loc": f"Sheet: {sheet_name}"}
+            else:
+                print(f"⚠️ EXCEL DEBUG: Sheet '{sheet_name}' was empty or too short.")
+
+
+def parse_document(path: str, file_hash: Optional[str] = None) -> List[dict]:
+    """
+    Extract text blocks from one file and split them into {content, source, location} chunks.
+    `file_hash` (sha256 of the content, if known) keys the PDF page cache. Extractor errors
+    propagate: a file that failed to parse must not look like an empty one.
+    """
+    print(f"DEBUG: Parsing file: {path}")
+    fname = os.path.basename(path)
+    # Clean filename for embedding (remove extension and numbers)
+    clean_name = fname
+    for e in [".pptx", ".docx", ".pdf", ".xlsx"]:
+        clean_name = clean_name.replace(e, "")
+    clean_name = re.sub(r'^\d+\s*[-–]\s*', '', clean_name).strip()
+
+    splitter = get_splitter()
+    final_chunks = []
+    # Split each block as it arrives: only chunks accumulate, never the raw page text
+    for b in iter_blocks(path, file_hash):
+        for s in splitter.split_text(b['text']):
+            # EMBED filename in content for FTS precision
+            final_chunks.append({
+                "content": f"[{clean_name}] {s}",
+                "source": fname,
+                "location": b['loc']
+            })
+    return final_chunks
+
+
+def parse_batch(paths: List[str], hashes: Optional[Dict[str, str]] = None) -> List[ParseResult]:
+    """Worker task: several files per round trip. One failing file does not sink the others."""
+    hashes = hashes or {}
+    results = []
+    for path in paths:
+        try:
+            results.append((path, parse_document(path, hashes.get(path)), None))
+        except Exception as exc:
+            results.append((path, [], str(exc)))
+    return results
+
+
+def plan_batches(paths: List[str], max_task_bytes: int, max_files_per_task: int) -> List[List[str]]:
+    """
+    Group files into worker tasks: largest first (long PDFs start early, so no straggler
+    at the end), small files packed together up to max_task_bytes to save round trips.
+    """
+    sized = sorted(((os.path.getsize(p) if os.path.exists(p) else 0, p) for p in paths), reverse=True)
+    batches, current, current_bytes = [], [], 0
+    for size, path in sized:
+        if current and (current_bytes + size > max_task_bytes or len(current) >= max_files_per_task):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(path)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+class ParsePool:
+    """
+    Process pool for document parsing: pdfplumber / python-pptx / python-docx extraction
+    is CPU-bound Python, so threads share one core under the GIL.
+
+    - Sized to the host's cores; workers are spawned (not forked from a threaded server)
+      and recycled after `max_tasks_per_child` tasks, which bounds pdfplumber's memory growth.
+      Spawned workers re-import the __main__ module, so the app must not be built there:
+      run it as `uvicorn main:app` (main.py re-launches itself that way).
+    - Tasks are submitted in a bounded window (`window_per_worker` per worker), each covering
+      a batch of files (plan_batches), and results stream back as tasks complete.
+    - Shared process-wide (get_parse_pool), so concurrent ingestions of several courses
+      queue for the same cores instead of each spawning a full pool.
+    """
+    task = staticmethod(parse_batch)  # What a worker runs per batch
+
+    def __init__(self, max_workers: Optional[int] = None, max_tasks_per_child: int = 8,
+                 max_task_bytes: int = 8 * 1024 * 1024, max_files_per_task: int = 16,
+                 window_per_worker: int = 2):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_tasks_per_child = max_tasks_per_child
+        self.max_task_bytes = max_task_bytes
+        self.max_files_per_task = max_files_per_task
+        self.window_per_worker = window_per_worker
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    max_tasks_per_child=self.max_tasks_per_child,
+                    initializer=configure_page_cache,
+                    initargs=(_page_cache_path,),
+                )
+            return self._executor
+
+    def _reset(self, broken: ProcessPoolExecutor):
+        """Drop `broken` if it is still the shared pool; a pool already replaced is left alone."""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, batch: List[str], hashes: Dict[str, str]) -> Tuple[Future, ProcessPoolExecutor]:
+        args = (batch, {p: hashes[p] for p in batch if p in hashes})
+        executor = self._get_executor()
+        try:
+            return executor.submit(self.task, *args), executor
+        except (BrokenProcessPool, RuntimeError):
+            self._reset(executor)  # Broke, or was shut down by another ingestion, since we fetched it
+            executor = self._get_executor()
+            return executor.submit(self.task, *args), executor
+
+    def parse(self, paths: List[str], hashes: Optional[Dict[str, str]] = None) -> Iterator[ParseResult]:
+        """Yields (path, chunks, error) per file, in completion order. `hashes`: path -> known sha256."""
+        hashes = hashes or {}
+        # Like Pool.map's chunksize: ~4 tasks per worker, so a handful of files still spreads out
+        files_per_task = max(1, min(self.max_files_per_task, len(paths) // (self.max_workers * 4)))
+        pending_batches = plan_batches(paths, self.max_task_bytes, files_per_task)
+        pending_batches.reverse()  # pop() from the end = largest first
+        in_flight = {}  # future -> (batch, executor it was submitted to)
+        retried = set()
+        window = self.max_workers * self.window_per_worker
+        while pending_batches or in_flight:
+            while pending_batches and len(in_flight) < window:
+                batch = pending_batches.pop()
+                future, executor = self._submit(batch, hashes)
+                in_flight[future] = (batch, executor)
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch, executor = in_flight.pop(future)
+                try:
+                    results = future.result()
+                except (BrokenProcessPool, CancelledError):
+                    # A worker died (e.g. OOM on a huge PDF) and took the pool's in-flight tasks
+                    # with it: retry those once in a fresh pool, one file per task. Only the first
+                    # failure from a pool replaces it; the shared pool may already be a new one
+                    # running our retries and other courses' tasks.
+                    self._reset(executor)
+                    retry = [p for p in batch if p not in retried]
+                    retried.update(retry)
+                    pending_batches.extend([p] for p in retry)
+                    results = [(p, [], "parser process died") for p in batch if p not in retry]
+                except Exception as exc:
+                    results = [(path, [], str(exc)) for path in batch]
+                for result in results:
+                    yield result
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_default_pool: Optional[ParsePool] = None
+_default_lock = threading.Lock()
+
+def get_parse_pool() -> ParsePool:
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = ParsePool()
+        return _default_pool
+
+def shutdown_parse_pool():
+    with _default_lock:
+        pool = _default_pool
+    if pool is not None:
+        pool.shutdown(wait=False)
@@ -0,0 +1,87 @@
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+from .sqlite_pool import SQLitePool
+
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+
+class EmbeddingStore:
+    """
+    Content-addressed, persistent embedding cache shared by every course.
+    Key = sha256(model name + chunk text); value = raw float32 vector.
+    Re-ingesting a file, duplicate lecture files across teachers and shared
+    slides all resolve to the same key, so each text is embedded once per model.
+    """
+    def __init__(self, db_path: str = "./embedding_cache.db", lookup_chunk: int = 500):
+        self.db_path = db_path
+        self.lookup_chunk = lookup_chunk  # Keys per SELECT ... IN (...) (SQLite variable limit)
+        self._pool = SQLitePool(db_path)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._init_db()
+
+    def _init_db(self):
+        conn = self._pool.connection()
+        conn.execute('PRAGMA journal_mode=WAL;')
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    dim INTEGER,
+                    vector BLOB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Vectors in input order; None where the text was never embedded with `model`."""
+        keys = [self.make_key(model, t) for t in texts]
+        found: Dict[str, bytes] = {}
+        conn = self._pool.connection()
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), self.lookup_chunk):
+            part = unique[i:i + self.lookup_chunk]
+            placeholders = ",".join("?" * len(part))
+            for key, blob in conn.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', part):
+                found[key] = blob
+
+        result = [np.frombuffer(found[k], dtype=EMBEDDING_DTYPE).tolist() if k in found else None for k in keys]
+        hits = sum(1 for r in result if r is not None)
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += len(result) - hits
+        return result
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        rows = []
+        for text, vec in zip(texts, vectors):
+            arr = np.asarray(vec, dtype=EMBEDDING_DTYPE)
+            rows.append((self.make_key(model, text), model, int(arr.shape[0]), arr.tobytes()))
+        if not rows:
+            return
+        conn = self._pool.connection()
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)', rows)
+
+    def put(self, model: str, text: str, vector: Sequence[float]):
+        self.put_many(model, [text], [vector])
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+    def close(self):
+        self._pool.close_all()
@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+
+def hash_file(path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's content, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ManifestDiff:
+    def __init__(self):
+        self.new: List[str] = []        # relpaths never ingested
+        self.changed: List[str] = []    # relpaths whose content hash differs
+        self.unchanged: List[str] = []
+        self.removed: List[str] = []    # relpaths in the manifest but gone from disk
+        self.hashes: Dict[str, dict] = {}  # relpath -> fresh {sha256, size, mtime_ns}
+
+    @property
+    def to_ingest(self) -> List[str]:
+        return self.new + self.changed
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.new or self.changed or self.removed)
+
+
+class IngestManifest:
+    """
+    Per-workspace record of what is already in the vector table:
+    relpath -> {sha256, size, mtime_ns, source, chunks}.
+
+    Lives next to the LanceDB files so wiping the vector DB wipes it too.
+    A file whose size and mtime match its entry is trusted without re-hashing.
+
+    Uploads hash their content while streaming it to disk and record it in a
+    side file (upload_hashes.json, written only by record_upload), so the first
+    ingestion of an uploaded file does not read it back just to hash it.
+    """
+    FILENAME = "ingest_manifest.json"
+    UPLOADS_FILENAME = "upload_hashes.json"
+    _uploads_lock = threading.Lock()  # Concurrent uploads rewrite the same side file
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, self.FILENAME)
+        self.uploads_path = os.path.join(directory, self.UPLOADS_FILENAME)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        self.uploads: Dict[str, dict] = self._load_uploads()  # relpath -> {sha256, size, mtime_ns}
+        self.exists = os.path.exists(self.path)
+        if self.exists:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f).get("files", {})
+            except (OSError, ValueError):
+                self.exists = False  # Corrupt manifest: treat as first run (full rebuild)
+                self.entries = {}
+
+    def diff(self, root: str, paths: List[str]) -> ManifestDiff:
+        """Classify files under `root` against the manifest."""
+        result = ManifestDiff()
+        seen = set()
+        for path in paths:
+            rel = os.path.relpath(path, root)
+            seen.add(rel)
+            st = os.stat(path)
+            entry = self.entries.get(rel)
+            known = self._trusted(entry, st) or self._trusted(self.uploads.get(rel), st)
+            digest = known or hash_file(path)
+            result.hashes[rel] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+            if entry is None:
+                result.new.append(rel)
+            elif entry["sha256"] != digest:
+                result.changed.append(rel)
+            else:
+                result.unchanged.append(rel)
+        result.removed = [rel for rel in self.entries if rel not in seen]
+        return result
+
+    @staticmethod
+    def _trusted(record: Optional[dict], st: os.stat_result) -> Optional[str]:
+        """The recorded hash, if the file still has the size and mtime it had when hashed."""
+        if record and record.get("size") == st.st_size and record.get("mtime_ns") == st.st_mtime_ns:
+            return record["sha256"]
+        return None
+
+    def find_by_hash(self, root: str, sha256: str) -> Optional[str]:
+        """Relpath of a file under `root` that already holds this content (ingested or uploaded)."""
+        for records in (self.entries, self.uploads):
+            for rel, record in records.items():
+                if record.get("sha256") != sha256:
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, rel))
+                except OSError:
+                    continue  # Deleted since
+                if self._trusted(record, st):
+                    return rel
+        return None
+
+    def record_upload(self, rel: str, file_hash: dict):
+        """Remember the hash computed while an upload was written (size and mtime as stored)."""
+        with self._uploads_lock:
+            uploads = self._load_uploads()
+            uploads[rel] = file_hash
+            tmp = self.uploads_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(uploads, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.uploads_path)
+            self.uploads = uploads
+
+    def _load_uploads(self) -> Dict[str, dict]:
+        try:
+            with open(self.uploads_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def source_of(self, rel: str) -> str:
+        """The `source` value the file's chunks were written under (its relpath)."""
+        entry = self.entries.get(rel)
+        return entry.get("source", os.path.basename(rel)) if entry else rel
+
+    @property
+    def has_basename_sources(self) -> bool:
+        """Entries written when chunks were keyed by basename, which collides across subdirectories."""
+        return any(self.source_of(rel) != rel for rel in self.entries)
+
+    def record(self, rel: str, file_hash: dict, chunks: int):
+        with self._lock:
+            self.entries[rel] = {**file_hash, "source": rel, "chunks": chunks}
+
+    def forget(self, rel: str):
+        with self._lock:
+            self.entries.pop(rel, None)
+
+    def save(self):
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "files": self.entries}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+            self.exists = True
@@ -1,51 +1,191 @@
 import ollama
-from typing import List
+import httpx
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, List, Optional
 import os
 import re
+from .embedding_store import EmbeddingStore
+from .blocking_executor import get_blocking_executor
+
+# SUPER RULE: Strip any Chinese/Japanese/Korean characters from the output
+CJK_PATTERN = re.compile(r'[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af\uff00-\uffef]+')
+
+class StreamCleaner:
+    """
+    Incremental version of OllamaClient._clean for token streams: strips CJK
+    characters per piece and reproduces the final .strip() by dropping
+    leading whitespace and holding trailing whitespace until more text arrives.
+    """
+    def __init__(self):
+        self._started = False
+        self._pending_ws = ""
+
+    def feed(self, piece: str) -> str:
+        text = CJK_PATTERN.sub('', piece)
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        body = text.rstrip()
+        if not body:
+            self._pending_ws += text
+            return ""
+        out = self._pending_ws + body
+        self._pending_ws = text[len(body):]
+        return out
 
 class OllamaClient:
-    def __init__(self, base_url="http://localhost:11434"):
+    def __init__(self, base_url="http://localhost:11434", max_connections: int = 64,
+                 embedding_store: Optional[EmbeddingStore] = None):
         self.base_url = base_url
+        # Content-addressed embedding cache consulted before every embed call
+        self.embedding_store = embedding_store
         # USER REQUESTED CPU OPTIMIZATION (2026-01-28)
         self.chat_model = "gemma3:4b"
         self.embed_model = "embeddinggemma:300m"
         self.timeout = 120.0 # Relaxed for CPU
+        # ASYNC PATH: one pooled HTTP client per event loop (created lazily)
+        self.max_connections = max_connections
+        self._async_clients: Dict[asyncio.AbstractEventLoop, ollama.AsyncClient] = {}
+        self._async_lock = threading.Lock()
 
-    def get_embedding(self, text: str) -> List[float]:
-        # BLAZING FAST: Using GPU for single embedding
-        response = ollama.embed(
-            model=self.embed_model,
-            input=text,
-            options={'num_gpu': -1}
-        )
-        return response.embeddings[0]
-
-    def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        # ADVANCED COMPUTING: Batch processing on GPU
-        response = ollama.embed(
-            model=self.embed_model,
-            input=texts,
-            options={'num_gpu': -1}
-        )
-        return response.embeddings
+    def _chat_options(self, num_predict: Optional[int] = None) -> dict:
+        return {
+            'num_gpu': -1,       # Enable GPU for BLAZING FAST speed
+            'num_ctx': 4096,     # Goldilocks zone: Fits all usage without memory overflow
+            'num_predict': num_predict or 2048, # Fixes "cut in middle" - allow HUGE answers (lower when degraded)
+            'temperature': 0.7,  # Balanced creativity
+            'num_thread': 8      # CPU fallback optimization
+        }
+
+    @staticmethod
+    def _messages(system_prompt: str, user_message: str) -> list:
+        return [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_message}
+        ]
+
+    @staticmethod
+    def _clean(content: str) -> str:
+        return CJK_PATTERN.sub('', content).strip()
+
+    @staticmethod
+    def _count(stats: Optional[Dict], hits: int, misses: int):
+        if stats is not None:
+            stats['hits'] = stats.get('hits', 0) + hits
+            stats['misses'] = stats.get('misses', 0) + misses
+
+    def _split_cached(self, texts: List[str]):
+        """Returns (vectors with None holes, unique texts still to embed)."""
+        if not self.embedding_store:
+            return [None] * len(texts), list(dict.fromkeys(texts))
+        vectors = self.embedding_store.get_many(self.embed_model, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        return vectors, missing
+
+    def _fill(self, texts: List[str], vectors: list, missing: List[str], embedded: List[List[float]],
+              persist: bool = True) -> List[List[float]]:
+        if self.embedding_store and missing and persist:
+            self.embedding_store.put_many(self.embed_model, missing, embedded)
+        fresh = dict(zip(missing, embedded))
+        return [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+
+    def get_embedding(self, text: str, stats: Optional[Dict] = None) -> List[float]:
+        # Query embeddings read the store but are not written to it: every distinct student
+        # question would otherwise be kept forever. Corpus chunks go through the batch call.
+        return self.get_embeddings_batch([text], stats=stats, persist=False)[0]
+
+    def get_embeddings_batch(self, texts: List[str], stats: Optional[Dict] = None,
+                             persist: bool = True) -> List[List[float]]:
+        vectors, missing = self._split_cached(texts)
+        uncached = sum(1 for v in vectors if v is None)
+        self._count(stats, len(texts) - uncached, uncached)
+        embedded = []
+        if missing:
+            # ADVANCED COMPUTING: Batch processing on GPU (only texts never embedded before)
+            response = ollama.embed(
+                model=self.embed_model,
+                input=missing,
+                options={'num_gpu': -1}
+            )
+            embedded = response.embeddings
+        return self._fill(texts, vectors, missing, embedded, persist)
 
-    def chat(self, system_prompt: str, user_message: str) -> str:
+    def chat(self, system_prompt: str, user_message: str, num_predict: Optional[int] = None) -> str:
         # BUDGET MODE: Keeping the LLM on CPU to save resources
         response = ollama.chat(
             model=self.chat_model,
-            messages=[
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_message}
-            ],
-            options={
-                'num_gpu': -1,       # Enable GPU for BLAZING FAST speed
-                'num_ctx': 4096,     # Goldilocks zone: Fits all usage without memory overflow
-                'num_predict': 2048, # Fixes "cut in middle" - allow HUGE answers
-                'temperature': 0.7,  # Balanced creativity
-                'num_thread': 8      # CPU fallback optimization
-            }
+            messages=self._messages(system_prompt, user_message),
+            options=self._chat_options(num_predict)
+        )
+        return self._clean(response.message.content)
+
+    # --- ASYNC VARIANTS (non-blocking for the FastAPI event loop) ---
+
+    def _get_async_client(self) -> ollama.AsyncClient:
+        """
+        This loop's client. Clients are kept per loop, so loops in other threads never replace
+        (or break) each other's pools. A client whose loop has closed can no longer be awaited
+        closed; it is dropped here and its sockets go with it.
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                for old in [l for l in self._async_clients if l.is_closed()]:
+                    del self._async_clients[old]
+                client = self._async_clients[loop] = ollama.AsyncClient(
+                    host=self.base_url,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                )
+        return client
+
+    async def aclose(self):
+        """Close the running loop's HTTP client (app shutdown); the next async call opens a new one."""
+        with self._async_lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    async def get_embedding_async(self, text: str) -> List[float]:
+        return (await self.get_embeddings_batch_async([text], persist=False))[0]  # Not stored, see get_embedding
+
+    async def get_embeddings_batch_async(self, texts: List[str], persist: bool = True) -> List[List[float]]:
+        executor = get_blocking_executor()
+        vectors, missing = await executor.run(self._split_cached, texts)
+        embedded = []
+        if missing:
+            response = await self._get_async_client().embed(
+                model=self.embed_model,
+                input=missing,
+                options={'num_gpu': -1}
+            )
+            embedded = response.embeddings
+        return await executor.run(self._fill, texts, vectors, missing, embedded, persist)
+
+    async def chat_async(self, system_prompt: str, user_message: str, num_predict: Optional[int] = None) -> str:
+        response = await self._get_async_client().chat(
+            model=self.chat_model,
+            messages=self._messages(system_prompt, user_message),
+            options=self._chat_options(num_predict)
+        )
+        return self._clean(response.message.content)
+
+    async def chat_stream_async(self, system_prompt: str, user_message: str,
+                                num_predict: Optional[int] = None) -> AsyncIterator[str]:
+        """Yields cleaned answer text as Ollama produces it. Joined pieces == chat() output."""
+        cleaner = StreamCleaner()
+        stream = await self._get_async_client().chat(
+            model=self.chat_model,
+            messages=self._messages(system_prompt, user_message),
+            options=self._chat_options(num_predict),
+            stream=True
         )
-        content = response.message.content
-        # SUPER RULE: Strip any Chinese/Japanese/Korean characters from the output
-        clean_content = re.sub(r'[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af\uff00-\uffef]+', '', content)
-        return clean_content.strip()
+        async for part in stream:
+            piece = cleaner.feed(part.message.content or "")
+            if piece:
+                yield piece
@@ -0,0 +1,74 @@
+from typing import Dict, Optional
+from .sqlite_pool import SQLitePool
+
+# Bump when the extraction itself changes (pdfplumber settings, post-processing):
+# older rows are then ignored instead of served
+PDF_TEXT_VERSION = 1
+
+
+class PageTextStore:
+    """
+    On-disk cache of extracted PDF page text, keyed by (file content hash, page number).
+
+    pdfplumber's layout analysis is the expensive part of ingesting a long PDF. Re-ingesting
+    the same file (a rebuilt course, the same textbook in another course, a retry after a
+    crash half-way through) reads pages from here instead. Pages are stored as they are
+    extracted; the page count is recorded once the whole file has been read, so a complete
+    hit never opens the PDF at all.
+    """
+    def __init__(self, db_path: str = "./page_text_cache.db", version: int = PDF_TEXT_VERSION):
+        self.db_path = db_path
+        self.version = version
+        self._pool = SQLitePool(db_path)
+        self._init_db()
+
+    def _init_db(self):
+        conn = self._pool.connection()
+        conn.execute('PRAGMA journal_mode=WAL;')
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS pdf_pages (
+                    file_hash TEXT,
+                    version INTEGER,
+                    page INTEGER,
+                    text TEXT,
+                    PRIMARY KEY (file_hash, version, page)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS pdf_documents (
+                    file_hash TEXT,
+                    version INTEGER,
+                    pages INTEGER,
+                    PRIMARY KEY (file_hash, version)
+                )
+            ''')
+
+    def get_pages(self, file_hash: str) -> Dict[int, str]:
+        """Every cached page of the file: page number (0-based) -> text ('' for blank pages)."""
+        conn = self._pool.connection()
+        rows = conn.execute('SELECT page, text FROM pdf_pages WHERE file_hash = ? AND version = ?',
+                            (file_hash, self.version))
+        return {page: text for page, text in rows}
+
+    def page_count(self, file_hash: str) -> Optional[int]:
+        """Pages in the file, once it has been read completely; None before that."""
+        conn = self._pool.connection()
+        row = conn.execute('SELECT pages FROM pdf_documents WHERE file_hash = ? AND version = ?',
+                           (file_hash, self.version)).fetchone()
+        return row[0] if row else None
+
+    def put_page(self, file_hash: str, page: int, text: str):
+        conn = self._pool.connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO pdf_pages (file_hash, version, page, text) VALUES (?, ?, ?, ?)',
+                         (file_hash, self.version, page, text))
+
+    def set_page_count(self, file_hash: str, pages: int):
+        conn = self._pool.connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO pdf_documents (file_hash, version, pages) VALUES (?, ?, ?)',
+                         (file_hash, self.version, pages))
+
+    def close(self):
+        self._pool.close_all()
@@ -3,6 +3,8 @@ import sqlite3
 import time
 from typing import List, Dict, Optional
 from threading import Lock
+from .sqlite_pool import SQLitePool
+from .write_behind import WriteBehindQueue
 
 class RelationalDatabase:
     """
@@ -18,16 +20,25 @@ class RelationalDatabase:
             if cls._instance is None:
                 cls._instance = super(RelationalDatabase, cls).__new__(cls)
                 cls._instance.db_path = db_path
+                cls._instance._pool = SQLitePool(
+                    db_path,
+                    row_factory=sqlite3.Row, # Dictionary-like access
+                    pragmas=("PRAGMA synchronous = NORMAL;", "PRAGMA foreign_keys = ON;"),
+                )
+                # Analytics rows are batched off the request path
+                cls._instance._usage_writer = WriteBehindQueue(
+                    cls._instance._write_usage_batch,
+                    batch_size=200, flush_interval=0.5, max_pending=10000,
+                    overflow="drop_oldest", name="usage-analytics-writer",
+                )
                 cls._instance._init_db()
         return cls._instance
 
     def _init_db(self):
         """Initialize schema with best-practice SQLite performance settings."""
-        with sqlite3.connect(self.db_path) as conn:
-            # Performance Tuning
+        with self.get_connection() as conn:
+            # Performance Tuning (synchronous/foreign_keys are applied per pooled connection)
             conn.execute("PRAGMA journal_mode = WAL;")  # Write-Ahead Logging for concurrency
-            conn.execute("PRAGMA synchronous = NORMAL;") # Faster writes, safe enough
-            conn.execute("PRAGMA foreign_keys = ON;")
             
             # Users Table
             conn.execute("""
@@ -67,10 +78,17 @@ class RelationalDatabase:
             """)
 
     def get_connection(self):
-        """Returns a connection for the caller context."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row # Dictionary-like access
-        return conn
+        """
+        Returns this thread's pooled connection.
+        Use as `with db.get_connection() as conn:` - the block commits or rolls back;
+        the connection itself stays open for the next call.
+        """
+        return self._pool.connection()
+
+    def close(self):
+        """Flush pending analytics and close pooled connections (shutdown)."""
+        self._usage_writer.close()
+        self._pool.close_all()
 
     # --- USER REPOSITORY ---
     def create_user(self, email: str, password_hash: str, name: str, role: str):
@@ -103,15 +121,27 @@ class RelationalDatabase:
 
     # --- ANALYTICS REPOSITORY ---
     def log_usage(self, course_id: str, query_type: str, time_ms: float, tokens_saved: int = 0):
-        """Log system efficiency metrics for cost analysis."""
+        """Log system efficiency metrics for cost analysis (queued; written in batches)."""
+        self._usage_writer.submit((course_id, query_type, time_ms, tokens_saved))
+
+    def _write_usage_batch(self, rows: List[tuple]):
+        """One transaction per batch of analytics rows (runs on the writer thread)."""
         with self.get_connection() as conn:
-            conn.execute(
+            conn.executemany(
                 "INSERT INTO usage_analytics (course_id, query_type, processing_time_ms, tokens_saved) VALUES (?, ?, ?, ?)",
-                (course_id, query_type, time_ms, tokens_saved)
+                rows
             )
-            conn.commit()
+
+    def flush_usage(self):
+        """Write all queued analytics rows now."""
+        self._usage_writer.flush()
+
+    def get_usage_writer_stats(self) -> Dict:
+        """Analytics write-behind queue counters: pending, written, dropped, failed."""
+        return self._usage_writer.stats()
             
     def get_cost_report(self):
+        self.flush_usage()
         with self.get_connection() as conn:
             cursor = conn.execute("""
                 SELECT 
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import numpy as np
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Neighbourhood:
+    """In-flight key -> unit query vector, so semantically equivalent questions can join a call."""
+    def __init__(self):
+        self._vectors: Dict[Hashable, np.ndarray] = {}
+
+    def attach(self, key: Hashable, vector):
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        if norm > 0:
+            self._vectors[key] = v / norm
+
+    def detach(self, key: Hashable):
+        self._vectors.pop(key, None)
+
+    def nearest(self, vector, threshold: float) -> Optional[Hashable]:
+        if not self._vectors:
+            return None
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm == 0:
+            return None
+        keys = list(self._vectors)
+        sims = np.stack([self._vectors[k] for k in keys]) @ (q / norm)
+        best = int(np.argmax(sims))
+        return keys[best] if sims[best] >= threshold else None
+
+
+class SingleFlight:
+    """
+    Thread version: concurrent calls with the same key run `fn` once; every
+    caller gets the leader's result (or exception). A key is forgotten as
+    soon as its call finishes, so this never serves stale results - that is
+    the cache's job.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._vectors = _Neighbourhood()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """Returns (result, shared); shared is True when another caller did the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = Future()
+                self.leaders += 1
+                leader = True
+            else:
+                self.followers += 1
+                leader = False
+        if not leader:
+            return call.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._end(key, call)
+            call.set_exception(e)
+            raise
+        self._end(key, call)
+        call.set_result(result)
+        return result, False
+
+    def follow_neighbour(self, key: Hashable, vector, threshold: float) -> Tuple[bool, Any]:
+        """
+        Called by the leader of `key` once its query vector is known. Waits for an
+        in-flight call within `threshold` cosine similarity and returns (True, result);
+        otherwise publishes `vector` for later arrivals and returns (False, None).
+        A key that published its vector never waits, so two calls cannot wait on each other.
+        """
+        with self._lock:
+            other = self._vectors.nearest(vector, threshold)
+            if other is None:
+                self._vectors.attach(key, vector)
+                return False, None
+            call = self._calls[other]
+            self.followers += 1
+        return True, call.result()
+
+    def _end(self, key: Hashable, call: Future):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            self._vectors.detach(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "followers": self.followers}
+
+
+class AsyncSingleFlight:
+    """
+    Event-loop version of SingleFlight. If a leader is cancelled (client went
+    away, stream closed) its followers do not fail: the first of them takes
+    over the key and runs the call itself.
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._vectors = _Neighbourhood()
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], *args, **kwargs) -> Tuple[Any, bool]:
+        """Returns (result, shared); shared is True when another caller did the work."""
+        found, result = await self.follow(key)
+        if found:
+            return result, True
+        call = self.begin(key)
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self.end(key, call, error=e)
+            raise
+        self.end(key, call, result=result)
+        return result, False
+
+    async def follow(self, key: Hashable) -> Tuple[bool, Any]:
+        """(True, result) after waiting on the in-flight call for `key`; (False, None) if there is none."""
+        while True:
+            call = self._calls.get(key)
+            if call is None:
+                return False, None
+            self.followers += 1
+            try:
+                return True, await asyncio.shield(call)
+            except asyncio.CancelledError:
+                if call.cancelled():
+                    self.followers -= 1
+                    continue  # Leader gave up: take over (or join whoever already did)
+                raise
+
+    async def follow_neighbour(self, key: Hashable, vector, threshold: float) -> Tuple[bool, Any]:
+        """Async counterpart of SingleFlight.follow_neighbour."""
+        other = self._vectors.nearest(vector, threshold)
+        if other is not None:
+            found, result = await self.follow(other)
+            if found:
+                return True, result
+        self._vectors.attach(key, vector)
+        return False, None
+
+    def begin(self, key: Hashable) -> asyncio.Future:
+        """Claim `key` (after follow() found nothing); resolve it with end()."""
+        call = asyncio.get_running_loop().create_future()
+        call.add_done_callback(lambda f: f.cancelled() or f.exception())  # No "exception never retrieved"
+        self._calls[key] = call
+        self.leaders += 1
+        return call
+
+    def end(self, key: Hashable, call: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        self._vectors.detach(key)
+        if call.done():
+            return
+        if error is None:
+            call.set_result(result)
+        elif isinstance(error, Exception):
+            call.set_exception(error)
+        else:
+            call.cancel()  # CancelledError / GeneratorExit: followers take over
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "followers": self.followers}
@@ -8,22 +8,89 @@ import hashlib
 import re
 import math
 import json
+import threading
 import numpy as np
-from typing import Optional, Dict, List
+from urllib.request import pathname2url
+from typing import Optional, Dict, List, Tuple
+from .bounded_lru import BoundedLRU
+from .sqlite_pool import SQLitePool
+
+# Schema version stored in PRAGMA user_version.
+# v1: embedding_blob holds raw little-endian float32 bytes (was a JSON list).
+SCHEMA_VERSION = 1
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+
+def _embedding_to_blob(embedding) -> Optional[bytes]:
+    """Pack an embedding into raw float32 bytes for the embedding_blob column."""
+    if embedding is None or len(embedding) == 0:
+        return None
+    return np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def _blob_to_embedding(blob) -> Optional[np.ndarray]:
+    """
+    Unpack an embedding_blob. The storage class decides the format: legacy rows hold a
+    JSON list as TEXT (sqlite3 returns str), v1 rows raw float32 bytes as BLOB.
+    Raises ValueError for anything else.
+    """
+    if blob is None:
+        return None
+    if isinstance(blob, str):
+        return np.asarray(json.loads(blob), dtype=EMBEDDING_DTYPE)
+    if len(blob) == 0 or len(blob) % EMBEDDING_DTYPE.itemsize:
+        raise ValueError(f"embedding blob of {len(blob)} bytes is not a float32 vector")
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query for fuzzy matching (shared by the cache key and the query-embedding memo)."""
+    q = query.lower().strip()
+    # Remove common question words
+    q = re.sub(r'^(what is|what are|explain|describe|tell me about|как|что такое)\s*', '', q)
+    # Remove punctuation
+    q = re.sub(r'[^\w\s]', '', q)
+    # Remove extra whitespace
+    q = re.sub(r'\s+', ' ', q).strip()
+    return q
+
+
+def _l1_entry_size(result: Dict) -> int:
+    """Approximate RAM footprint of one L1 entry (text payload + fixed overhead)."""
+    return 256 + len(result['response']) + sum(len(r) for r in result['references'])
+
 
 class SmartCache:
-    def __init__(self, db_path="./smart_cache.db"):
+    def __init__(self, db_path="./smart_cache.db", l1_max_entries: int = 1024,
+                 l1_max_bytes: int = 8 * 1024 * 1024, l1_ttl: Optional[float] = None):
         self.db_path = db_path
-        self._l1_cache = {} # L1 Memory Cache (Ram)
+        # L1 Memory Cache (Ram): LRU bounded by entries + bytes, optional TTL
+        self._l1_cache = BoundedLRU(max_entries=l1_max_entries, max_bytes=l1_max_bytes,
+                                    ttl=l1_ttl, sizeof=_l1_entry_size)
+
+        # TIER COUNTERS: which layer actually saved the LLM call
+        self._stats_lock = threading.Lock()
+        self._counters = {'l1_hits': 0, 'l2_exact_hits': 0, 'semantic_hits': 0, 'misses': 0}
+
+        # RESIDENT MATRIX: pre-normalized float32 embeddings for semantic lookup.
+        # Rows [0, _matrix_size) are live; capacity grows by doubling on set().
+        self._matrix_lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_size = 0
+        self._matrix_index: Dict[str, int] = {}    # query_hash -> row
+        self._matrix_payloads: List[Tuple[str, list]] = []  # (response, references) per row
+        self._matrix_loaded = False
+
+        # Persistent per-thread connections (no connect/close per call)
+        self._pool = SQLitePool(db_path)
         self._init_db()
     
     def _init_db(self):
         """Initialize SQLite database for persistent caching."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._pool.connection()
         
-        # WAL Mode for Concurrency (10+ users)
+        # WAL Mode for Concurrency (10+ users). synchronous=NORMAL is set per pooled connection.
         conn.execute('PRAGMA journal_mode=WAL;')
-        conn.execute('PRAGMA synchronous=NORMAL;')
         
         c = conn.cursor()
         c.execute('''
@@ -40,7 +107,27 @@ class SmartCache:
         ''')
         c.execute('CREATE INDEX IF NOT EXISTS idx_normalized ON qa_cache(normalized_query)')
         conn.commit()
-        conn.close()
+
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < SCHEMA_VERSION:
+            self._migrate_embeddings(conn)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.commit()
+
+    def _migrate_embeddings(self, conn: sqlite3.Connection):
+        """Rewrite legacy JSON embeddings as raw float32 blobs (schema v0 -> v1)."""
+        rows = conn.execute(
+            "SELECT rowid, embedding_blob FROM qa_cache "
+            "WHERE typeof(embedding_blob) = 'text'"
+        ).fetchall()
+        updates = []
+        for rid, blob in rows:
+            try:
+                updates.append((_embedding_to_blob(_blob_to_embedding(blob)), rid))
+            except (ValueError, TypeError):
+                updates.append((None, rid))  # Unreadable vector: keep the answer, drop the embedding
+        if updates:
+            conn.executemany('UPDATE qa_cache SET embedding_blob = ? WHERE rowid = ?', updates)
 
     def predict(self, vector: List[float], threshold: float = 0.82) -> Optional[Dict]:
         """
@@ -51,14 +138,7 @@ class SmartCache:
     
     def _normalize_query(self, query: str) -> str:
         """Normalize query for fuzzy matching."""
-        q = query.lower().strip()
-        # Remove common question words
-        q = re.sub(r'^(what is|what are|explain|describe|tell me about|как|что такое)\s*', '', q)
-        # Remove punctuation
-        q = re.sub(r'[^\w\s]', '', q)
-        # Remove extra whitespace
-        q = re.sub(r'\s+', ' ', q).strip()
-        return q
+        return normalize_query(query)
     
     def _hash_query(self, normalized: str) -> str:
         """Create hash of normalized query."""
@@ -88,21 +168,20 @@ class SmartCache:
         query_hash = self._hash_query(normalized)
         
         # 1. CHECK L1 RAM (Nanosecond speed)
-        if query_hash in self._l1_cache:
-            return self._l1_cache[query_hash]
+        l1_hit = self._l1_cache.get(query_hash)
+        if l1_hit is not None:
+            self._count('l1_hits')
+            return l1_hit
         
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+        conn = self._pool.connection()
         
         # Exact match
-        c.execute('SELECT response, references_json FROM qa_cache WHERE query_hash = ?', (query_hash,))
-        row = c.fetchone()
+        row = conn.execute('SELECT response, references_json FROM qa_cache WHERE query_hash = ?', (query_hash,)).fetchone()
         
         if row:
             # Update access count
-            c.execute('UPDATE qa_cache SET access_count = access_count + 1 WHERE query_hash = ?', (query_hash,))
-            conn.commit()
-            conn.close()
+            with conn:
+                conn.execute('UPDATE qa_cache SET access_count = access_count + 1 WHERE query_hash = ?', (query_hash,))
             
             result = {
                 'response': row[0],
@@ -111,121 +190,184 @@ class SmartCache:
                 'type': 'exact'
             }
             # Populate L1
-            self._l1_cache[query_hash] = result
+            self._l1_cache.set(query_hash, result)
+            self._count('l2_exact_hits')
             return result
         
-        conn.close()
         return None
 
+    def contains(self, query: str) -> bool:
+        """Exact-match presence check (admission fast lane): no stats, no access_count update."""
+        query_hash = self._hash_query(self._normalize_query(query))
+        if query_hash in self._l1_cache:
+            return True
+        row = self._pool.connection().execute('SELECT 1 FROM qa_cache WHERE query_hash = ?', (query_hash,)).fetchone()
+        return row is not None
+
+    def _load_matrix(self):
+        """Build the resident matrix from disk once; later updates come through set()."""
+        rows = self._pool.connection().execute(
+            'SELECT query_hash, response, references_json, embedding_blob FROM qa_cache WHERE embedding_blob IS NOT NULL'
+        ).fetchall()
+
+        skipped = 0
+        for query_hash, response, refs_json, blob in rows:
+            try:
+                vec = _blob_to_embedding(blob)
+                references = json.loads(refs_json)
+            except (ValueError, TypeError):
+                skipped += 1  # One unreadable row must not disable semantic lookup for the course
+                continue
+            if vec is not None:
+                self._matrix_put(query_hash, vec, response, references)
+        if skipped:
+            print(f"⚠️ SmartCache: skipped {skipped} undecodable embedding rows in {self.db_path}")
+        self._matrix_loaded = True
+
+    def _matrix_put(self, query_hash: str, vec: np.ndarray, response: str, references: list):
+        """Insert or replace one normalized row. Caller holds _matrix_lock."""
+        vec = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return
+        if self._matrix is not None and vec.shape[0] != self._matrix.shape[1]:
+            return  # Dimension mismatch (embedding model changed) - not comparable
+
+        row = self._matrix_index.get(query_hash)
+        if row is None:
+            if self._matrix is None:
+                self._matrix = np.empty((64, vec.shape[0]), dtype=np.float32)
+            elif self._matrix_size == self._matrix.shape[0]:
+                grown = np.empty((self._matrix.shape[0] * 2, self._matrix.shape[1]), dtype=np.float32)
+                grown[:self._matrix_size] = self._matrix[:self._matrix_size]
+                self._matrix = grown
+            row = self._matrix_size
+            self._matrix_size += 1
+            self._matrix_index[query_hash] = row
+            self._matrix_payloads.append((response, references))
+        else:
+            self._matrix_payloads[row] = (response, references)
+
+        self._matrix[row] = vec / norm
+
     def get_semantic(self, query_embedding: List[float], threshold: float = 0.92) -> Optional[Dict]:
         """
         Try to find a semantically similar question in the cache.
         Returns the best match if similarity > threshold.
+        Served from the resident pre-normalized matrix: one matvec, no DB round trip.
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        # Get all embeddings
-        # Optimization: Fetch ONLY what we need for the calc
-        c.execute('SELECT rowid, embedding_blob FROM qa_cache WHERE embedding_blob IS NOT NULL')
-        rows = c.fetchall()
-        
-        if not rows:
-            conn.close()
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        norm_query = np.linalg.norm(query_vec)
+        if norm_query == 0:
+            self._count('misses')
             return None
 
-        # 1. Build Matrix (Vectorization)
-        # This is where passing "list of lists" to numpy is 100x faster than python loops
-        ids = []
-        vectors = []
-        for rid, blob in rows:
-            ids.append(rid)
-            vectors.append(json.loads(blob))
-            
-        if not vectors:
-            conn.close()
-            return None
-            
-        matrix = np.array(vectors) # Shape: (N, 768)
-        query_vec = np.array(query_embedding) # Shape: (768,)
-        
-        # Normalize Matrix (if not already) & Query
-        norm_matrix = np.linalg.norm(matrix, axis=1, keepdims=True)
-        norm_query = np.linalg.norm(query_vec)
-        
-        # Avoid divide by zero
-        matrix_normalized = matrix / (norm_matrix + 1e-10)
-        query_normalized = query_vec / (norm_query + 1e-10)
-        
-        # 2. Matrix Dot Product (The "Single Handed" Magic)
-        # Calculates similarity for ALL questions in one CPU instruction set
-        scores = np.dot(matrix_normalized, query_normalized) # Shape: (N,)
-        
-        # 3. Find Best Match
-        best_idx = np.argmax(scores)
-        best_score = float(scores[best_idx])
-        
+        with self._matrix_lock:
+            if not self._matrix_loaded:
+                self._load_matrix()
+            if self._matrix_size == 0 or query_vec.shape[0] != self._matrix.shape[1]:
+                self._count('misses')
+                return None
+
+            # Matrix Dot Product: similarity for ALL cached questions at once
+            scores = self._matrix[:self._matrix_size] @ (query_vec / norm_query)
+            best_idx = int(np.argmax(scores))
+            best_score = float(scores[best_idx])
+            response, references = self._matrix_payloads[best_idx]
+
         if best_score >= threshold:
-            # Fetch full details only for the winner
-            winner_id = ids[best_idx]
-            c.execute('SELECT response, references_json FROM qa_cache WHERE rowid = ?', (winner_id,))
-            res_row = c.fetchone()
-            conn.close()
-            
-            if res_row:
-                return {
-                    'response': res_row[0],
-                    'references': json.loads(res_row[1]),
-                    'cached': True,
-                    'type': 'semantic',
-                    'score': best_score
-                }
-        
-        conn.close()
-        return None
-            
+            self._count('semantic_hits')
+            return {
+                'response': response,
+                'references': list(references),
+                'cached': True,
+                'type': 'semantic',
+                'score': best_score
+            }
+        self._count('misses')
         return None
-    
+
     def set(self, query: str, response: str, references: list, embedding: Optional[List[float]] = None):
         """Store Q&A pair in cache."""
         normalized = self._normalize_query(query)
         query_hash = self._hash_query(normalized)
         
         # Update L1
-        self._l1_cache[query_hash] = {
+        self._l1_cache.set(query_hash, {
             'response': response,
             'references': references,
             'cached': True,
             'type': 'exact' # Newly set is effectively exact for itself
-        }
+        })
         
-        embed_json = json.dumps(embedding) if embedding else None
+        embed_blob = _embedding_to_blob(embedding)
         
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''
-            INSERT OR REPLACE INTO qa_cache (query_hash, query_text, normalized_query, response, references_json, embedding_blob)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (query_hash, query, normalized, response, json.dumps(references), embed_json))
-        conn.commit()
-        conn.close()
+        conn = self._pool.connection()
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO qa_cache (query_hash, query_text, normalized_query, response, references_json, embedding_blob)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (query_hash, query, normalized, response, json.dumps(references), embed_blob))
+
+        # Keep the resident matrix in step (only once it has been loaded from disk)
+        if embed_blob is not None:
+            with self._matrix_lock:
+                if self._matrix_loaded:
+                    self._matrix_put(query_hash, np.frombuffer(embed_blob, dtype=EMBEDDING_DTYPE), response, references)
     
     def get_stats(self) -> Dict:
         """Get cache statistics."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT COUNT(*), SUM(access_count) FROM qa_cache')
-        row = c.fetchone()
-        conn.close()
+        row = self._pool.connection().execute('SELECT COUNT(*), SUM(access_count) FROM qa_cache').fetchone()
+        l1 = self._l1_cache.stats()
+        with self._stats_lock:
+            tiers = dict(self._counters)
+        tiers['l1_evictions'] = l1['evictions'] + l1['expirations']
         return {
             'total_cached': row[0] or 0,
-            'total_hits': row[1] or 0
+            'total_hits': row[1] or 0,
+            'tiers': tiers,
+            'l1': {k: l1[k] for k in ('entries', 'bytes', 'max_entries', 'max_bytes', 'ttl')},
+            'semantic_rows': self._matrix_size
         }
 
+    @staticmethod
+    def read_stats(db_path: str) -> Dict:
+        """
+        Row and hit totals of a cache file without building a SmartCache: one short-lived
+        read-only connection (no pool, no matrix, no schema migration).
+        """
+        if not os.path.exists(db_path):
+            return {'total_cached': 0, 'total_hits': 0}
+        conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro", uri=True, timeout=5.0)
+        try:
+            row = conn.execute('SELECT COUNT(*), SUM(access_count) FROM qa_cache').fetchone()
+        except sqlite3.OperationalError:
+            row = (0, 0)  # File exists but the table was never created
+        finally:
+            conn.close()
+        return {'total_cached': row[0] or 0, 'total_hits': row[1] or 0}
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            self._counters[counter] += 1
+
+    def invalidate_l1(self):
+        """Drop the RAM tier (e.g. after course materials changed). L2 on disk is kept."""
+        self._l1_cache.clear()
+
     def clear(self):
         """Clear all cache."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('DELETE FROM qa_cache')
-        conn.commit()
-        conn.close()
+        conn = self._pool.connection()
+        with conn:
+            conn.execute('DELETE FROM qa_cache')
+
+        self._l1_cache.clear()
+        with self._matrix_lock:
+            self._matrix = None
+            self._matrix_size = 0
+            self._matrix_index = {}
+            self._matrix_payloads = []
+
+    def close(self):
+        """Release pooled SQLite connections (they reopen lazily if the cache is used again)."""
+        self._pool.close_all()
@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+from typing import Dict, Optional, Sequence
+
+
+class SQLitePool:
+    """
+    Persistent per-thread SQLite connections for one database file.
+
+    Each worker thread (uvicorn's threadpool, background tasks) gets its own
+    long-lived connection, so a call costs neither a file open nor the WAL
+    mmap/schema parse, and the connection's prepared-statement cache
+    (`cached_statements`) is reused across calls. Connections are never
+    shared between threads.
+    """
+    def __init__(self, db_path: str, row_factory=None,
+                 pragmas: Sequence[str] = ("PRAGMA synchronous=NORMAL;",),
+                 cached_statements: int = 256, timeout: float = 30.0):
+        self.db_path = db_path
+        self.row_factory = row_factory
+        self.pragmas = tuple(pragmas)
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._connections: Dict[int, sqlite3.Connection] = {}  # thread ident -> conn (for close_all)
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection, opening it on first use (or after close_all)."""
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+        if conn is not None:
+            conn.close()  # Retired by close_all(): only its owner closes it, between queries
+
+        fresh = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,  # Only so dead threads' connections can be closed from another
+        )
+        if self.row_factory is not None:
+            fresh.row_factory = self.row_factory
+        for pragma in self.pragmas:
+            fresh.execute(pragma)
+
+        ident = threading.get_ident()
+        with self._lock:
+            self._prune_dead_threads()
+            previous = self._connections.get(ident)
+            if previous is not None and previous is not conn:
+                previous.close()  # Left by a dead thread whose ident was reused
+            self._connections[ident] = fresh
+            self._local.generation = self._generation
+        self._local.conn = fresh
+        return fresh
+
+    def _prune_dead_threads(self):
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [i for i in self._connections if i not in alive]:
+            self._connections.pop(ident).close()
+
+    def close_all(self):
+        """
+        Retire every pooled connection. The calling thread's and dead threads' connections
+        close now; a live thread's connection may be mid-query, so it is closed by that
+        thread on its next connection() call, which then reconnects.
+        """
+        with self._lock:
+            self._generation += 1
+            self._prune_dead_threads()
+            own = self._connections.pop(threading.get_ident(), None)
+        if own is not None:
+            own.close()
+            self._local.conn = None
@@ -0,0 +1,62 @@
+import os
+import hashlib
+import tempfile
+from typing import Optional, Tuple
+from .blocking_executor import BlockingExecutor, get_blocking_executor
+from .ingest_manifest import IngestManifest
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes read from the request per step
+TEMP_PREFIX = ".upload-"          # In-progress uploads (hidden; not a supported extension)
+
+
+def _write_and_hash(out, digest, data: bytes):
+    # Both release the GIL for large buffers, so one executor hop covers them
+    out.write(data)
+    digest.update(data)
+
+
+async def stream_to_disk(upload, directory: str, executor: Optional[BlockingExecutor] = None,
+                         chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[str, str]:
+    """
+    Copy an UploadFile into a temporary file in `directory`, chunk by chunk, hashing it in the
+    same pass. Disk writes run on the blocking executor, so a 200 MB PDF does not stall the
+    event loop. Returns (temp path, sha256).
+    """
+    executor = executor or get_blocking_executor()
+    fd, tmp = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=".part", dir=directory)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                data = await upload.read(chunk_size)
+                if not data:
+                    break
+                await executor.run(_write_and_hash, out, digest, data)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return tmp, digest.hexdigest()
+
+
+def _commit(tmp: str, directory: str, name: str, sha256: str, manifest: IngestManifest):
+    final = os.path.join(directory, name)
+    os.replace(tmp, final)  # Same directory: atomic, readers never see a half-written file
+    st = os.stat(final)
+    manifest.record_upload(name, {"sha256": sha256, "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+
+
+async def store_upload(upload, directory: str, manifest: IngestManifest,
+                       executor: Optional[BlockingExecutor] = None) -> Tuple[str, Optional[str]]:
+    """
+    Stream one upload into `directory` unless its content is already there.
+    Returns (filename, relpath of the identical file already stored, or None if it was saved).
+    """
+    executor = executor or get_blocking_executor()
+    name = os.path.basename(upload.filename or "") or "upload"
+    tmp, sha256 = await stream_to_disk(upload, directory, executor)
+    same_as = manifest.find_by_hash(directory, sha256)
+    if same_as is not None:
+        await executor.run(os.remove, tmp)
+        return name, same_as
+    await executor.run(_commit, tmp, directory, name, sha256, manifest)
+    return name, None
@@ -0,0 +1,123 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    In-process write-behind buffer for non-critical rows (analytics).
+
+    Producers `submit()` in O(1) and return immediately; a daemon thread
+    hands rows to `write_batch` in one call (one transaction) every
+    `flush_interval` seconds or as soon as `batch_size` rows are pending.
+
+    The buffer is bounded by `max_pending`. On overflow the policy is either
+    "drop_oldest" (default - analytics must never slow users down) or
+    "block" (backpressure: wait up to `block_timeout` for room, then drop).
+    """
+    def __init__(self, write_batch: Callable[[List[tuple]], None], batch_size: int = 200,
+                 flush_interval: float = 0.5, max_pending: int = 10000,
+                 overflow: str = "drop_oldest", block_timeout: float = 1.0,
+                 name: str = "write-behind"):
+        if overflow not in ("drop_oldest", "block"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.name = name
+
+        self._rows = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # Serializes batches (worker vs. explicit flush)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, row: tuple):
+        with self._cond:
+            if not self._closed:
+                if len(self._rows) >= self.max_pending:
+                    if self.overflow == "block":
+                        deadline = time.monotonic() + self.block_timeout
+                        while len(self._rows) >= self.max_pending and not self._closed:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                break
+                            self._cond.notify_all()
+                            self._cond.wait(remaining)
+                    while len(self._rows) >= self.max_pending:
+                        self._rows.popleft()
+                        self.dropped += 1
+                self._rows.append(row)
+                self._ensure_thread()
+                if len(self._rows) >= self.batch_size:
+                    self._cond.notify_all()
+                return
+        # Closed: write synchronously, outside _cond so other producers are not held up
+        self.write_now([row])
+
+    def _ensure_thread(self):
+        # Caller holds _cond. Started lazily so importing the DB layer spawns nothing.
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _take_batch(self) -> List[tuple]:
+        # Caller holds _cond.
+        n = min(len(self._rows), self.batch_size)
+        batch = [self._rows.popleft() for _ in range(n)]
+        self._cond.notify_all()  # Wake producers waiting for room
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._rows) < self.batch_size and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                if self._closed and not self._rows:
+                    return
+                batch = self._take_batch()
+            if batch:
+                self.write_now(batch)
+
+    def write_now(self, batch: List[tuple]):
+        with self._write_lock:
+            try:
+                self.write_batch(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.warning(f"{self.name}: dropped batch of {len(batch)} rows: {e}")
+
+    def flush(self):
+        """Synchronously write everything pending (shutdown / before reporting)."""
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self.write_now(batch)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the worker after draining the buffer. Later submits are written synchronously."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._rows)
+        return {"pending": pending, "written": self.written, "dropped": self.dropped, "failed": self.failed}
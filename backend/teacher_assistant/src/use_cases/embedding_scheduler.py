@@ -0,0 +1,168 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+
+class EmbeddingScheduler:
+    """
+    Feeds chunks to the embedding model in adaptively sized batches, several at a time.
+
+    - Batches are cut by characters (`batch_chars`), not a fixed count, so a batch of long
+      PDF pages and a batch of short slide titles cost the model about the same.
+    - `batch_chars` is tuned by hill climbing on measured throughput: every `adapt_every`
+      batches the chars/sec of the last window is compared with the one before; the step
+      keeps its direction while throughput holds and reverses when it drops. A failed
+      call halves it.
+    - Up to `concurrency` batch requests are in flight against Ollama, which keeps the
+      model busy while the previous response is decoded and cached.
+    - A failed batch is bisected: each half is retried on its own, down to single chunks,
+      so one bad chunk costs ~log2(n) extra calls instead of n sequential ones.
+    """
+    def __init__(self, llm, concurrency: int = 2, batch_chars: int = 16_000, min_chars: int = 2_000,
+                 max_chars: int = 128_000, max_batch: int = 256, adapt_every: Optional[int] = None,
+                 step: float = 1.5, tolerance: float = 0.05, cache_stats: Optional[Dict] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.llm = llm
+        self.clock = clock  # Throughput timing (injectable for tests)
+        self.concurrency = max(1, concurrency)
+        self.batch_chars = batch_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.max_batch = max_batch  # Hard cap on texts per call, whatever their length
+        self.adapt_every = adapt_every or 2 * self.concurrency
+        self.step = step
+        self.tolerance = tolerance  # Throughput drop (fraction) that counts as "worse"
+        self.cache_stats = cache_stats if cache_stats is not None else {"hits": 0, "misses": 0}
+        self.chunks = 0
+        self.chars = 0
+        self.batches = 0
+        self.failed_calls = 0
+        self.bisections = 0
+        self.in_flight = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._direction = 1
+        self._last_rate: Optional[float] = None
+        self._window_chars = 0
+        self._window_batches = 0
+        self._window_start: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def embed_stream(self, batches: Iterable[List[dict]]) -> Iterator[List[dict]]:
+        """Sets chunk['vector'] on every incoming chunk; yields embedded batches as they complete."""
+        chunks = (chunk for batch in batches for chunk in batch)
+        self.started = self.started or self.clock()
+        self.finished = None
+        in_flight = set()
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed") as pool:
+            try:
+                while True:
+                    while not exhausted and len(in_flight) < self.concurrency:
+                        batch = self._next_batch(chunks)
+                        if not batch:
+                            exhausted = True
+                            break
+                        in_flight.add(pool.submit(self._embed_timed, batch))
+                    self.in_flight = len(in_flight)
+                    if not in_flight:
+                        return
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            finally:
+                for future in in_flight:
+                    future.cancel()
+                self.in_flight = 0
+                self.finished = self.clock()
+
+    def _next_batch(self, chunks: Iterator[dict]) -> List[dict]:
+        batch, chars = [], 0
+        limit = self.batch_chars
+        for chunk in chunks:
+            batch.append(chunk)
+            chars += len(chunk['content'])
+            if chars >= limit or len(batch) >= self.max_batch:
+                break
+        return batch
+
+    def _embed_timed(self, batch: List[dict]) -> List[dict]:
+        with self._lock:
+            if self._window_start is None:
+                self._window_start = self.clock()
+        self._embed_split(batch)
+        self._record(batch)
+        return batch
+
+    def _embed_split(self, batch: List[dict]):
+        stats = {"hits": 0, "misses": 0}
+        try:
+            vectors = self.llm.get_embeddings_batch([c['content'] for c in batch], stats=stats)
+        except Exception as e:
+            self._on_failure()
+            if len(batch) == 1:
+                raise
+            print(f"⚠️ Embedding batch of {len(batch)} failed ({e}), bisecting")
+            with self._lock:
+                self.bisections += 1
+            middle = len(batch) // 2
+            self._embed_split(batch[:middle])
+            self._embed_split(batch[middle:])
+            return
+        with self._lock:  # Counted once, by the call that succeeded
+            for key, value in stats.items():
+                self.cache_stats[key] = self.cache_stats.get(key, 0) + value
+        for chunk, vector in zip(batch, vectors):
+            chunk['vector'] = vector
+
+    def _on_failure(self):
+        with self._lock:
+            self.failed_calls += 1
+            # Oversized requests are the usual culprit (timeouts, context limits): back off
+            self.batch_chars = max(self.min_chars, self.batch_chars // 2)
+            self._reset_window()
+
+    def _record(self, batch: List[dict]):
+        chars = sum(len(c['content']) for c in batch)
+        with self._lock:
+            self.chunks += len(batch)
+            self.chars += chars
+            self.batches += 1
+            self._window_chars += chars
+            self._window_batches += 1
+            if self._window_batches >= self.adapt_every:
+                self._adapt_locked(self.clock())
+
+    def _adapt_locked(self, now: float):
+        if self._window_start is None:  # A failure reset the window mid-flight
+            self._reset_window()
+            return
+        rate = self._window_chars / max(now - self._window_start, 1e-9)
+        if self._last_rate is not None and rate < self._last_rate * (1 - self.tolerance):
+            self._direction = -self._direction  # The last step hurt: go back the other way
+        self._last_rate = rate
+        factor = self.step if self._direction > 0 else 1 / self.step
+        self.batch_chars = int(min(self.max_chars, max(self.min_chars, self.batch_chars * factor)))
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_chars = 0
+        self._window_batches = 0
+        self._window_start = None
+
+    def report(self) -> Dict:
+        with self._lock:
+            elapsed = max((self.finished or self.clock()) - (self.started or self.clock()), 1e-9)
+            return {
+                "chunks": self.chunks,
+                "chunks_per_sec": round(self.chunks / elapsed, 2),
+                "chars_per_sec": round(self.chars / elapsed, 1),
+                "batches": self.batches,
+                "avg_batch": round(self.chunks / self.batches, 1) if self.batches else 0.0,
+                "batch_chars": self.batch_chars,
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "failed_calls": self.failed_calls,
+                "bisections": self.bisections,
+            }
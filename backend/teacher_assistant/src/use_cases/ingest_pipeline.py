@@ -0,0 +1,177 @@
+import time
+import queue
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_DONE = object()  # End-of-stream marker passed down the queues
+
+
+class StageMeter:
+    """Throughput of one pipeline stage, plus how long it sat blocked on its neighbours."""
+    def __init__(self, unit: str):
+        self.unit = unit
+        self.done = 0
+        self.waiting = 0.0  # Seconds blocked on an empty input or a full output queue
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    def report(self) -> Dict:
+        elapsed = max((self.finished or time.monotonic()) - self.started, 1e-9)
+        return {self.unit: self.done, "per_sec": round(self.done / elapsed, 2),
+                "waiting_s": round(self.waiting, 2), "running": self.finished is None}
+
+
+class IngestPipeline:
+    """
+    Streaming parse -> embed -> write.
+
+    Three threads joined by bounded queues (`queue_depth` batches each): parsed chunks are
+    cut into embedding batches as files finish, embedded batches are appended to the vector
+    table every `write_rows` rows. The stages overlap (the embedder works while later files
+    are still being parsed), a full queue blocks the stage feeding it (backpressure), and at
+    most ~2 * queue_depth batches, the embedder's in-flight requests and one write buffer
+    are in memory - not the corpus.
+
+    `embed` is either a per-batch callable that sets chunk['vector'], or an object with
+    embed_stream(batches) -> embedded batches (EmbeddingScheduler), which may re-cut the
+    batches and keep several model calls in flight.
+
+    The first failure stops every stage and is re-raised from run().
+    """
+    def __init__(self, embed, write: Callable[[List[dict]], None],
+                 embed_batch: int = 50, write_rows: int = 1000, queue_depth: int = 4,
+                 on_progress: Optional[Callable[[str], None]] = None):
+        self.embed_stream = getattr(embed, "embed_stream", None) or self._serial(embed)
+        self.write = write      # Persists a list of embedded chunks
+        self.embed_batch = embed_batch
+        self.write_rows = write_rows
+        self.on_progress = on_progress or (lambda current_file: None)
+        self.stages = {"parse": StageMeter("files"), "embed": StageMeter("chunks"), "write": StageMeter("rows")}
+        self.chunks_parsed = 0
+        self._to_embed = queue.Queue(maxsize=queue_depth)
+        self._to_write = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def run(self, parsed: Iterable[Tuple[str, List[dict]]]):
+        """Consume (path, chunks) per parsed file; returns once everything is written."""
+        threads = [threading.Thread(target=self._guard, args=(self._parse_stage, parsed), name="ingest-parse", daemon=True),
+                   threading.Thread(target=self._guard, args=(self._embed_stage,), name="ingest-embed", daemon=True)]
+        for t in threads:
+            t.start()
+        self._guard(self._write_stage)  # Writes stay on the caller's thread
+        for t in threads:
+            t.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def report(self) -> Dict:
+        return {
+            **{name: meter.report() for name, meter in self.stages.items()},
+            "chunks_parsed": self.chunks_parsed,
+            "queued_batches": {"embed": self._to_embed.qsize(), "write": self._to_write.qsize()},
+        }
+
+    # --- Stages ---
+
+    def _parse_stage(self, parsed: Iterable[Tuple[str, List[dict]]]):
+        meter = self.stages["parse"]
+        batch = []
+        try:
+            for path, chunks in parsed:
+                if self._stop.is_set():
+                    return
+                meter.done += 1
+                self.chunks_parsed += len(chunks)
+                for chunk in chunks:
+                    batch.append(chunk)
+                    if len(batch) >= self.embed_batch:
+                        self._put(self._to_embed, batch, meter)
+                        batch = []
+                self.on_progress(path)
+            if batch:
+                self._put(self._to_embed, batch, meter)
+        finally:
+            meter.finished = time.monotonic()
+            self._put(self._to_embed, _DONE, meter)
+
+    def _embed_stage(self):
+        meter = self.stages["embed"]
+        try:
+            for batch in self.embed_stream(self._drain(self._to_embed, meter)):
+                meter.done += len(batch)
+                self._put(self._to_write, batch, meter)
+        finally:
+            meter.finished = time.monotonic()
+            self._put(self._to_write, _DONE, meter)
+
+    def _write_stage(self):
+        meter = self.stages["write"]
+        pending: List[dict] = []
+        try:
+            while True:
+                batch = self._get(self._to_write, meter)
+                if batch is _DONE:
+                    break
+                pending.extend(batch)
+                if len(pending) >= self.write_rows:
+                    self.write(pending)
+                    meter.done += len(pending)
+                    pending = []
+                    self.on_progress("")
+            if pending and not self._stop.is_set():
+                self.write(pending)
+                meter.done += len(pending)
+        finally:
+            meter.finished = time.monotonic()
+
+    # --- Plumbing ---
+
+    @staticmethod
+    def _serial(embed: Callable[[List[dict]], None]) -> Callable[[Iterable[List[dict]]], Iterator[List[dict]]]:
+        def embed_stream(batches):
+            for batch in batches:
+                embed(batch)
+                yield batch
+        return embed_stream
+
+    def _drain(self, q: queue.Queue, meter: StageMeter) -> Iterator[List[dict]]:
+        while True:
+            batch = self._get(q, meter)
+            if batch is _DONE:
+                return
+            yield batch
+
+    def _guard(self, stage: Callable, *args):
+        try:
+            stage(*args)
+        except BaseException as e:
+            self._fail(e)
+
+    def _fail(self, error: BaseException):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item, meter: StageMeter):
+        """Blocking put that gives up once the pipeline is stopping (nobody will drain the queue)."""
+        start = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        meter.waiting += time.monotonic() - start
+
+    def _get(self, q: queue.Queue, meter: StageMeter):
+        """Blocking get; a stopping pipeline reads as end-of-stream."""
+        start = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+        finally:
+            meter.waiting += time.monotonic() - start
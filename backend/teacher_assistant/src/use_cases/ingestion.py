@@ -1,107 +1,200 @@
 import os
-import pdfplumber
-from pptx import Presentation
-from docx import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import threading
+import contextlib
 from ..infrastructure.database import VectorDatabase
 from ..infrastructure.ollama_client import OllamaClient
-import pandas as pd
+from ..infrastructure.ingest_manifest import IngestManifest
+from ..infrastructure.document_parser import (
+    SUPPORTED_EXTENSIONS, HEAVY_EXTENSIONS, ParseResult, get_parse_pool, get_splitter, parse_document
+)
+from .ingest_pipeline import IngestPipeline
+from .embedding_scheduler import EmbeddingScheduler
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
 import multiprocessing
+import random
 
 class IngestionService:
     # GLOBAL PROGRESS TRACKER (CourseID -> Status)
     _progress_map = {}
+    # Streaming pipeline sizes: chunks per hand-off to the embedder, rows per LanceDB append
+    embed_batch_size = 50
+    write_rows = 1000
+    # Embedding calls: concurrent batch requests to Ollama, starting batch size in characters
+    # (then tuned by measured throughput, see EmbeddingScheduler)
+    embed_concurrency = 2
+    embed_batch_chars = 16_000
+    # One ingestion per vector DB at a time: each diffs, rewrites the same sources and saves
+    # the same manifest. A run that waited diffs against what the previous one saved.
+    _db_locks: Dict[str, threading.Lock] = {}
+    _db_locks_guard = threading.Lock()
 
-    def __init__(self, db: VectorDatabase, llm: OllamaClient, rag_service=None, course_id: str = "default"):
+    def __init__(self, db: VectorDatabase, llm: OllamaClient, rag_service=None, course_id: str = "default",
+                 parse_mode: str = "auto"):
         self.db = db
         self.llm = llm
         self.rag_service = rag_service
         self.course_id = course_id
+        # "process" (CPU-bound extractors on every core), "thread", or "auto": processes
+        # once there are at least two PDF/PPTX/DOCX/XLSX files to parse
+        self.parse_mode = parse_mode
         # Initialize progress for this session
         IngestionService._progress_map[self.course_id] = {"status": "starting", "progress": 0, "current_file": ""}
         
-        # OPTIMIZED: Larger chunks for better context preservation
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,      # Full paragraphs
-            chunk_overlap=100    # Better continuity
-        )
+        # OPTIMIZED: Larger chunks for better context preservation (see document_parser)
+        self.splitter = get_splitter()
 
     def process_directory(self, directory: str):
+        with IngestionService._db_locks_guard:
+            lock = IngestionService._db_locks.setdefault(self.db.db_path, threading.Lock())
+        if not lock.acquire(blocking=False):
+            print(f"⏳ Ingestion for {self.course_id} waits for the one already running...")
+            IngestionService._progress_map[self.course_id] = {"status": "waiting", "progress": 0, "current_file": ""}
+            lock.acquire()
+        try:
+            self._process_directory(directory)
+        finally:
+            lock.release()
+
+    def _process_directory(self, directory: str):
         print(f"💎 KNOWLEDGE INGESTION STARTING for {self.course_id}...")
         IngestionService._progress_map[self.course_id] = {"status": "scanning", "progress": 5, "current_file": ""}
         
         all_files = []
         for root, _, files in os.walk(directory):
             for file in files:
-                if file.lower().endswith(('.pdf', '.pptx', '.docx', '.txt', '.xlsx')):
+                if file.lower().endswith(SUPPORTED_EXTENSIONS):
                    all_files.append(os.path.join(root, file))
 
-        if not all_files:
+        # INCREMENTAL: only new/changed files are parsed and embedded
+        manifest = IngestManifest(self.db.db_path)
+        diff = manifest.diff(directory, all_files)
+        # First run (or pre-manifest table, or chunks keyed by basename): rebuild everything once
+        full_rebuild = not manifest.exists or manifest.has_basename_sources
+        to_ingest = list(diff.hashes.keys()) if full_rebuild else diff.to_ingest
+        file_stats = {"files_new": len(diff.new), "files_changed": len(diff.changed),
+                      "files_removed": len(diff.removed), "files_unchanged": len(diff.unchanged)}
+
+        if not full_rebuild and not diff.has_changes:
+             print(f"✅ Knowledge base for {self.course_id} already up to date ({len(diff.unchanged)} files).")
+             IngestionService._progress_map[self.course_id] = {"status": "ready", "progress": 100, "current_file": "", **file_stats}
+             return
+
+        if not all_files and full_rebuild:
              print("⚠️ No supported files found!")
              IngestionService._progress_map[self.course_id] = {"status": "ready", "progress": 100, "current_file": ""}
              return
 
-        print(f"🚀 PARALLEL PARSING: Processing {len(all_files)} files on {multiprocessing.cpu_count()} cores...")
-        IngestionService._progress_map[self.course_id] = {"status": "parsing", "progress": 10, "current_file": f"Parallel Batch ({len(all_files)} docs)"}
+        paths = [os.path.join(directory, rel) for rel in to_ingest]
+        # Hashed once by the manifest diff (or at upload): the PDF page cache reuses them
+        known_hashes = {os.path.join(directory, rel): diff.hashes[rel]["sha256"] for rel in to_ingest}
+        mode = self._resolve_parse_mode(paths)
+        file_stats["parse_mode"] = mode
+        print(f"🚀 PARALLEL PARSING: Processing {len(paths)} new/changed files ({len(diff.unchanged)} unchanged, {len(diff.removed)} removed) "
+              f"with {'processes' if mode == 'process' else 'threads'} on {multiprocessing.cpu_count()} cores...")
+        IngestionService._progress_map[self.course_id] = {"status": "ingesting", "progress": 10, "current_file": f"Parallel Batch ({len(paths)} docs)", **file_stats}
 
-        all_chunks = [] # Fix: Initialize collector
-        # BEST PARALLEL COMPUTING: ThreadPool for I/O bound parsing
-        with ThreadPoolExecutor(max_workers=min(len(all_files), 10)) as executor:
-            future_to_file = {executor.submit(self._parse_file, path): path for path in all_files}
-            
-            completed_count = 0
-            for future in as_completed(future_to_file):
-                path = future_to_file[future]
-                try:
-                    chunks = future.result()
-                    all_chunks.extend(chunks)
-                    completed_count += 1
-                    # Live Update
-                    IngestionService._progress_map[self.course_id] = {
-                        "status": "parsing", 
-                        "progress": 10 + int((completed_count/len(all_files))*10), 
-                        "current_file": os.path.basename(path)
-                    }
-                except Exception as exc:
-                    print(f"❌ Error parsing {path}: {exc}")
+        chunk_counts = {}  # relpath -> chunks produced (manifest)
+        embed_stats = {"hits": 0, "misses": 0}  # Shared embedding-cache effectiveness for this run
+        warm_up_chunks, seen = [], 0  # Reservoir sample of written chunks for the cache warm-up
+        written_sources = set()
+        stale_removed = [manifest.source_of(rel) for rel in diff.removed]
 
-        print(f"🧠 Embedding {len(all_chunks)} chunks on GPU...")
-        IngestionService._progress_map[self.course_id] = {"status": "embedding", "progress": 20, "current_file": "GPU Indexing Core"}
-        
-        batch_size = 50 
-        total_batches = (len(all_chunks) + batch_size - 1) // batch_size
-        
-        for i in range(0, len(all_chunks), batch_size):
-            batch_idx = i // batch_size
-            progress_val = 20 + int((batch_idx / total_batches) * 60)
-            IngestionService._progress_map[self.course_id] = {"status": "embedding", "progress": progress_val, "current_file": f"Batch {batch_idx+1}/{total_batches}"}
-            
-            batch = all_chunks[i : i + batch_size]
-            texts = [c['content'] for c in batch]
-            try:
-                vectors = self.llm.get_embeddings_batch(texts)
-                for j, v in enumerate(vectors):
-                    batch[j]['vector'] = v
-            except Exception as e:
-                print(f"⚠️ Batch failed: {e}")
-                for c in batch:
-                    c['vector'] = self.llm.get_embedding(c['content'])
-            
-        IngestionService._progress_map[self.course_id] = {"status": "saving", "progress": 85, "current_file": "Vector Space"}
-        self.db.insert_chunks(all_chunks)
+        def parsed():
+            for path, chunks, error in self._parse_files(paths, mode, known_hashes):
+                if error is not None:
+                    print(f"❌ Error parsing {path}: {error}")
+                    continue
+                rel = os.path.relpath(path, directory)
+                for chunk in chunks:
+                    chunk['source'] = rel  # Same key as the manifest: same-named files in subfolders stay apart
+                chunk_counts[rel] = len(chunks)
+                yield path, chunks
+
+        def write(rows):
+            nonlocal seen
+            new_sources = list(dict.fromkeys(c['source'] for c in rows if c['source'] not in written_sources))
+            if full_rebuild:
+                if not written_sources:
+                    self.db.insert_chunks(rows, fts_index=False)  # Overwrites the table; FTS once at the end
+                else:
+                    self.db.replace_sources(rows, [])
+            else:
+                # Upsert by source: a file's old chunks go with the first batch of its new ones
+                self.db.replace_sources(rows, new_sources)
+            written_sources.update(new_sources)
+            for chunk in rows:
+                seen += 1
+                if len(warm_up_chunks) < 10:
+                    warm_up_chunks.append(chunk)
+                else:
+                    slot = random.randrange(seen)
+                    if slot < 10:
+                        warm_up_chunks[slot] = chunk
+
+        def progress(current_file):
+            report = pipeline.report()
+            parsed_fraction = report["parse"]["files"] / max(len(paths), 1)
+            written_fraction = report["write"]["rows"] / max(report["chunks_parsed"], 1)
+            IngestionService._progress_map[self.course_id] = {
+                "status": "ingesting",
+                "progress": 10 + int(75 * parsed_fraction * written_fraction),
+                "current_file": os.path.basename(current_file) if current_file else "Vector Space",
+                "pipeline": report,
+                "embedding": embedder.report(),
+                "embedding_cache": self._embed_cache_report(embed_stats),
+                **file_stats
+            }
+
+        # STREAMING PIPELINE: parse, embed and write overlap; memory holds a few batches, not the corpus
+        embedder = EmbeddingScheduler(self.llm, concurrency=self.embed_concurrency,
+                                      batch_chars=self.embed_batch_chars, cache_stats=embed_stats)
+        pipeline = IngestPipeline(embed=embedder, write=write,
+                                  embed_batch=self.embed_batch_size, write_rows=self.write_rows, on_progress=progress)
+        pipeline.run(parsed())
+
+        file_stats["embedding_cache"] = self._embed_cache_report(embed_stats)
+        file_stats["pipeline"] = pipeline.report()
+        file_stats["embedding"] = embedder.report()
+        print(f"🧮 Embedded {file_stats['embedding']['chunks']} chunks at {file_stats['embedding']['chunks_per_sec']} chunks/s "
+              f"(concurrency {self.embed_concurrency}, batch ~{file_stats['embedding']['batch_chars']} chars)")
+        IngestionService._progress_map[self.course_id] = {"status": "saving", "progress": 85, "current_file": "Vector Space", **file_stats}
+        if full_rebuild:
+            manifest.entries = {}
+        else:
+            # Removed files, and parsed files that produced no chunks, still have old chunks to drop
+            leftovers = [rel for rel in chunk_counts if rel not in written_sources]
+            stale = list(dict.fromkeys(stale_removed + leftovers))
+            if stale:
+                self.db.replace_sources([], stale)
+        self.db.rebuild_fts_index()  # Once per run, not per write
+        file_stats["vector_index"] = self.db.ensure_vector_index()
+
+        for rel in diff.removed:
+            manifest.forget(rel)
+        for rel, count in chunk_counts.items():
+            manifest.record(rel, diff.hashes[rel], count)
+        manifest.save()
+
+        # Materials changed: answers held in RAM may reference stale content
+        if self.rag_service:
+            self.rag_service.cache.invalidate_l1()
         
         # TRIGGER SYNTHETIC WARMING
-        if self.rag_service:
+        if self.rag_service and warm_up_chunks:
             IngestionService._progress_map[self.course_id] = {"status": "caching", "progress": 90, "current_file": "Smart Warm-up"}
-            self._warm_up_cache(all_chunks)
+            self._warm_up_cache(warm_up_chunks)
             
-        IngestionService._progress_map[self.course_id] = {"status": "ready", "progress": 100, "current_file": ""}
-        print(f"✅ Indexed {len(all_chunks)} chunks for {self.course_id}")
+        IngestionService._progress_map[self.course_id] = {"status": "ready", "progress": 100, "current_file": "", **file_stats}
+        print(f"✅ Indexed {seen} chunks for {self.course_id}")
+
+    @staticmethod
+    def _embed_cache_report(stats: dict) -> dict:
+        total = stats["hits"] + stats["misses"]
+        return {**stats, "hit_rate": round(stats["hits"] / total, 4) if total else 0.0}
 
     def _warm_up_cache(self, chunks):
         print("\n🚀 STARTING PERFORMANCE PRE-FETCH...")
-        import random
         
         # Pick 10 random chunks for critical pre-fetch
         samples = random.sample(chunks, min(len(chunks), 10))
@@ -115,7 +208,8 @@ class IngestionService:
                 "FORMAT: Questions only, one per line."
             )
             try:
-                resp = self.llm.chat("You are a knowledge-extraction tool.", prompt)
+                with self._generation_slot():
+                    resp = self.llm.chat("You are a knowledge-extraction tool.", prompt)
                 qs = [q.strip() for q in resp.split('\n') if '?' in q]
                 generated_qs.extend(qs)
             except Exception:
@@ -131,81 +225,33 @@ class IngestionService:
                 
         print(f"✅ PRE-FETCH COMPLETE: {len(generated_qs)} entries stabilized.")
 
-    def _parse_file(self, path: str):
-        print(f"DEBUG: Parsing file: {path}")
-        ext = os.path.splitext(path)[1].lower()
-        fname = os.path.basename(path)
-        # Clean filename for embedding (remove extension and numbers)
-        import re
-        clean_name = fname
-        for e in [".pptx", ".docx", ".pdf", ".xlsx"]:
-            clean_name = clean_name.replace(e, "")
-        clean_name = re.sub(r'^\d+\s*[-–]\s*', '', clean_name).strip()
-        
-        blocks = []
-        try:
-            if ext == ".pptx":
-                prs = Presentation(path)
-                for i, slide in enumerate(prs.slides):
-                    # Get slide title if available
-                    title = ""
-                    for shape in slide.shapes:
-                        if shape.has_text_frame and shape.text_frame.paragraphs:
-                            title = shape.text_frame.paragraphs[0].text[:50]
-                            break
-                    text = " ".join([s.text for s in slide.shapes if hasattr(s, "text")])
-                    if text.strip():
-                        loc = f"Slide {i+1}" + (f": {title}" if title else "")
-                        blocks.append({"text": text, "loc": loc})
-            elif ext == ".pdf":
-                with pdfplumber.open(path) as pdf:
-                    for i, page in enumerate(pdf.pages):
-                        text = page.extract_text()
-                        if text:
-                            blocks.append({"text": text, "loc": f"Page {i+1}"})
-            elif ext == ".docx":
-                doc = Document(path)
-                # Group paragraphs for better context
-                current_text = ""
-                for i, p in enumerate(doc.paragraphs):
-                    if p.text.strip():
-                        current_text += p.text + " "
-                        if len(current_text) > 500:  # Group small paragraphs
-                            blocks.append({"text": current_text, "loc": f"Section {len(blocks)+1}"})
-                            current_text = ""
-                if current_text.strip():
-                    blocks.append({"text": current_text, "loc": f"Section {len(blocks)+1}"})
-            elif ext == ".txt":
-                with open(path, "r", encoding="utf-8") as f:
-                    text = f.read()
-                    if text.strip():
-                        blocks.append({"text": text, "loc": "Full Document"})
-            elif ext == ".xlsx":
-                # PANDAS MAGIC: Read all sheets
-                xls = pd.ExcelFile(path)
-                for sheet_name in xls.sheet_names:
-                    df = pd.read_excel(xls, sheet_name=sheet_name)
-                    # Convert to string representation
-                    text = df.to_string(index=False)
-                    if len(text) > 50: # Ignore empty sheets
-                        blocks.append({"text": text, "loc": f"Sheet: {sheet_name}"})
-                        print(f"📊 EXCEL DEBUG: Extracted {len(text)} chars from sheet '{sheet_name}'")
-                    else:
-                        print(f"⚠️ EXCEL DEBUG: Sheet '{sheet_name}' was empty or too short.")
-        except Exception as e:
-            print(f"⚠️ Error parsing {fname}: {e}")
-            import traceback
-            traceback.print_exc()
-
-        final_chunks = []
-        for b in blocks:
-            splits = self.splitter.split_text(b['text'])
-            for s in splits:
-                # EMBED filename in content for FTS precision
-                enriched_content = f"[{clean_name}] {s}"
-                final_chunks.append({
-                    "content": enriched_content,
-                    "source": fname,
-                    "location": b['loc']
-                })
-        return final_chunks
+    def _generation_slot(self):
+        """Warm-up generations count against the course's share of the generation cap."""
+        gate = getattr(self.rag_service, "generation_gate", None)
+        return gate.slot_blocking(self.course_id) if gate is not None else contextlib.nullcontext()
+
+    def _resolve_parse_mode(self, paths: List[str]) -> str:
+        if self.parse_mode != "auto":
+            return self.parse_mode
+        heavy = sum(1 for p in paths if p.lower().endswith(HEAVY_EXTENSIONS))
+        # Spawning workers costs ~a second: only worth it when two extractions can overlap
+        return "process" if heavy >= 2 and (os.cpu_count() or 1) > 1 else "thread"
+
+    def _parse_files(self, paths: List[str], mode: str, hashes: Optional[Dict[str, str]] = None) -> Iterator[ParseResult]:
+        """Yields (path, chunks, error) per file as parsing completes. `hashes`: path -> sha256 from the manifest."""
+        hashes = hashes or {}
+        if mode == "process":
+            yield from get_parse_pool().parse(paths, hashes)
+            return
+        # Light files (plain text) or a single document: threads, no process start-up
+        with ThreadPoolExecutor(max_workers=max(1, min(len(paths), 10))) as executor:
+            future_to_file = {executor.submit(self._parse_file, path, hashes.get(path)): path for path in paths}
+            for future in as_completed(future_to_file):
+                path = future_to_file[future]
+                try:
+                    yield path, future.result(), None
+                except Exception as exc:
+                    yield path, [], str(exc)
+
+    def _parse_file(self, path: str, file_hash: Optional[str] = None):
+        return parse_document(path, file_hash)
@@ -1,56 +1,294 @@
 from ..infrastructure.ollama_client import OllamaClient
 from ..infrastructure.database import VectorDatabase
-from ..infrastructure.smart_cache import SmartCache
+from ..infrastructure.smart_cache import SmartCache, normalize_query
+from ..infrastructure.bounded_lru import BoundedLRU
+from ..infrastructure.blocking_executor import BlockingExecutor, get_blocking_executor
+from ..infrastructure.single_flight import SingleFlight, AsyncSingleFlight
 from ..core.models import ChatResponse
 from ..core.cost_manager import SmartCostManager
+from ..core.scheduler import GenerationGate, PRIORITY_STUDENT, PRIORITY_VOICE
+from typing import AsyncIterator, Optional, Tuple
+import pandas as pd
+import contextlib
 import re
 
 class RAGService:
-    def __init__(self, db: VectorDatabase, llm: OllamaClient, cache: SmartCache):
+    def __init__(self, db: VectorDatabase, llm: OllamaClient, cache: SmartCache,
+                 executor: Optional[BlockingExecutor] = None, query_embedding_memo: int = 2048,
+                 coalesce_threshold: Optional[float] = 0.82,
+                 generation_gate: Optional[GenerationGate] = None, course_id: Optional[str] = None):
         self.db = db
         self.llm = llm
         self.cache = cache  # Injected persistent cache
         self.cost_manager = SmartCostManager() # Brain for efficiency
+        self._executor = executor  # Async path: where blocking LanceDB/SQLite calls run
+        # Normalized query text -> embedding, so repeated questions never hit the embedding model
+        self._query_vectors = BoundedLRU(max_entries=query_embedding_memo)
+        # Single-flight: duplicates of an in-flight question wait for its answer instead of
+        # generating again. One RAGService per course, so keys are implicitly course-scoped.
+        # coalesce_threshold also joins semantic neighbours (same bar as the semantic cache); None = exact only.
+        self.coalesce_threshold = coalesce_threshold
+        self._flights = SingleFlight()
+        self._async_flights = AsyncSingleFlight()
+        # Async path: every LLM call waits for a (course-fair) generation slot; None = ungated
+        self.generation_gate = generation_gate
+        self.course_id = course_id
 
-    def answer_question(self, query: str, history: list = [], force_cache_only: bool = False, is_voice: bool = False) -> ChatResponse:
+    @property
+    def executor(self) -> BlockingExecutor:
+        return self._executor or get_blocking_executor()
+
+    def answer_question(self, query: str, history: list = [], force_cache_only: bool = False, is_voice: bool = False,
+                        reduced: bool = False) -> ChatResponse:
         # 0. ALLOCATE BUDGET
-        # ... (rest of logic) ...
         # We need this early to determine if we skip RAG or optimize for voice
         output_budget = self.cost_manager.determine_output_budget(is_voice)
 
         # 1. OPTIMIZED SKIP: Simple greetings/tests (Cost = ~0)
         if self.cost_manager.should_skip_rag(query):
-            simple_system = f"You are a helpful academic assistant. Answer briefly in the SAME language as the user. CONSTRANT: Max {output_budget['max_sentences']} sentences."
-            simple_response = self.llm.chat(simple_system, query)
-            return ChatResponse(
-                response=simple_response,
-                references=[],
-                status="chat_simple"
-            )
-
-        # 2. Embed query (GPU - fast)
-        vector = self.llm.get_embedding(query)
-
-        # 3. CHECK SMART CACHE (Semantic & Exact)
-        cached = self.cache.get(query) or self.cache.get_semantic(vector, threshold=0.82)
+            with self._generation_slot_blocking(is_voice):
+                simple_response = self.llm.chat(self._simple_system_prompt(output_budget), query)
+            return self._simple_response(simple_response)
+
+        # 2. EXACT CACHE FIRST (no embedding needed)
+        cached = self.cache.get(query)
+        if cached:
+            return self._cached_response(cached)
+
+        # GUARD: Overheat Protection (cache-only requests never generate, nothing to coalesce)
+        if force_cache_only:
+            return self._answer_uncached(None, query, history, is_voice, force_cache_only=True)
+
+        # SINGLE-FLIGHT: identical in-flight questions share one generation
+        key = self._flight_key(query, is_voice)
+        response, shared = self._flights.do(key, self._answer_uncached, key, query, history, is_voice, reduced=reduced)
+        return self._coalesced(response) if shared else response
+
+    def _answer_uncached(self, key, query: str, history: list, is_voice: bool, force_cache_only: bool = False,
+                         reduced: bool = False) -> ChatResponse:
+        # 3. Embed query (memoized) + SEMANTIC CACHE
+        vector = self._embed_query(query)
+        cached = self.cache.get_semantic(vector, threshold=0.82)
             
         if cached:
-            msg_prefix = "\n\n_[Cached response]_" if cached.get('type') == 'exact' else f"\n\n_[Cached (Semantic)]_"
-            return ChatResponse(
-                response=cached['response'] + msg_prefix,
-                references=cached['references'],
-                status="cached"
-            )
+            return self._cached_response(cached)
         
         # GUARD: Overheat Protection
         if force_cache_only:
-             return ChatResponse(
-                response="⚠️ System cooling active. Please try again in 10s.",
-                references=[],
-                status="throttled_cpu_hot"
-            )
+            return self._throttled_response()
+
+        # 3.5 SEMANTIC SINGLE-FLIGHT: join a near-identical question that is already generating
+        if self.coalesce_threshold is not None:
+            found, shared = self._flights.follow_neighbour(key, vector, self.coalesce_threshold)
+            if found:
+                return self._coalesced(shared)
         
         # 4. SMART RETRIEVE
+        results = self._retrieve(vector, query)
+
+        # 5-6. BUDGET + PROMPT
+        system_prompt, user_msg, references, budget = self._build_prompt(query, results, history, is_voice, reduced)
+        with self._generation_slot_blocking(is_voice):
+            answer = self.llm.chat(system_prompt, user_msg, **self._llm_limits(budget))
+        
+        # 7. SAVE TO CACHE
+        return self._finalize(query, answer, references, vector, budget)
+
+    async def answer_question_async(self, query: str, history: list = [], force_cache_only: bool = False, is_voice: bool = False,
+                                    reduced: bool = False) -> ChatResponse:
+        """
+        Same pipeline as answer_question, without blocking the event loop:
+        Ollama calls go through the async client, LanceDB/SQLite calls run
+        on the bounded blocking executor.
+        `reduced` (host under load): half the context, capped answer length.
+        """
+        output_budget = self.cost_manager.determine_output_budget(is_voice)
+
+        if self.cost_manager.should_skip_rag(query):
+            async with self._generation_slot(is_voice):
+                simple_response = await self.llm.chat_async(self._simple_system_prompt(output_budget), query)
+            return self._simple_response(simple_response)
+
+        cached = await self.executor.run(self.cache.get, query)
+        if cached:
+            return self._cached_response(cached)
+
+        if force_cache_only:
+            return await self._answer_uncached_async(None, query, history, is_voice, force_cache_only=True)
+
+        key = self._flight_key(query, is_voice)
+        response, shared = await self._async_flights.do(key, self._answer_uncached_async, key, query, history, is_voice,
+                                                        reduced=reduced)
+        return self._coalesced(response) if shared else response
+
+    async def _answer_uncached_async(self, key, query: str, history: list, is_voice: bool,
+                                     force_cache_only: bool = False, reduced: bool = False) -> ChatResponse:
+        vector = await self._embed_query_async(query)
+        cached = await self.executor.run(self.cache.get_semantic, vector, 0.82)
+        if cached:
+            return self._cached_response(cached)
+
+        if force_cache_only:
+            return self._throttled_response()
+
+        if self.coalesce_threshold is not None:
+            found, shared = await self._async_flights.follow_neighbour(key, vector, self.coalesce_threshold)
+            if found:
+                return self._coalesced(shared)
+
+        results = await self.executor.run(self._retrieve, vector, query)
+        system_prompt, user_msg, references, budget = self._build_prompt(query, results, history, is_voice, reduced)
+        async with self._generation_slot(is_voice):
+            answer = await self.llm.chat_async(system_prompt, user_msg, **self._llm_limits(budget))
+
+        return await self.executor.run(self._finalize, query, answer, references, vector, budget)
+
+    async def stream_answer_async(self, query: str, history: list = [], force_cache_only: bool = False,
+                                  is_voice: bool = False, reduced: bool = False) -> AsyncIterator[Tuple[str, object]]:
+        """
+        Streaming variant of answer_question_async.
+        Yields ("token", text) pieces while the LLM generates, then exactly one
+        ("done", ChatResponse). Cache hits / throttling / coalesced duplicates
+        yield only "done". The assembled answer is written to SmartCache before
+        "done" is sent.
+        """
+        output_budget = self.cost_manager.determine_output_budget(is_voice)
+
+        if self.cost_manager.should_skip_rag(query):
+            pieces = []
+            async with self._generation_slot(is_voice):
+                async for piece in self.llm.chat_stream_async(self._simple_system_prompt(output_budget), query):
+                    pieces.append(piece)
+                    yield "token", piece
+            yield "done", self._simple_response("".join(pieces))
+            return
+
+        cached = await self.executor.run(self.cache.get, query)
+        if cached:
+            yield "done", self._cached_response(cached)
+            return
+
+        if force_cache_only:
+            async for event in self._stream_uncached(None, query, history, is_voice, force_cache_only=True):
+                yield event
+            return
+
+        # Duplicate of a question already generating (streamed or not): wait for its answer
+        key = self._flight_key(query, is_voice)
+        found, shared = await self._async_flights.follow(key)
+        if found:
+            yield "done", self._coalesced(shared)
+            return
+
+        call = self._async_flights.begin(key)
+        try:
+            async for kind, payload in self._stream_uncached(key, query, history, is_voice, reduced=reduced):
+                if kind == "done":
+                    self._async_flights.end(key, call, result=payload)  # Release followers before the consumer resumes us
+                yield kind, payload
+        except BaseException as e:
+            self._async_flights.end(key, call, error=e)
+            raise
+
+    async def _stream_uncached(self, key, query: str, history: list, is_voice: bool,
+                               force_cache_only: bool = False, reduced: bool = False) -> AsyncIterator[Tuple[str, object]]:
+        vector = await self._embed_query_async(query)
+        cached = await self.executor.run(self.cache.get_semantic, vector, 0.82)
+        if cached:
+            yield "done", self._cached_response(cached)
+            return
+
+        if force_cache_only:
+            yield "done", self._throttled_response()
+            return
+
+        if self.coalesce_threshold is not None:
+            found, shared = await self._async_flights.follow_neighbour(key, vector, self.coalesce_threshold)
+            if found:
+                yield "done", self._coalesced(shared)
+                return
+
+        results = await self.executor.run(self._retrieve, vector, query)
+        system_prompt, user_msg, references, budget = self._build_prompt(query, results, history, is_voice, reduced)
+
+        pieces = []
+        async with self._generation_slot(is_voice):
+            async for piece in self.llm.chat_stream_async(system_prompt, user_msg, **self._llm_limits(budget)):
+                pieces.append(piece)
+                yield "token", piece
+
+        yield "done", await self.executor.run(self._finalize, query, "".join(pieces), references, vector, budget)
+
+    # --- PIPELINE STAGES (shared by the sync and async paths) ---
+
+    def _simple_system_prompt(self, output_budget: dict) -> str:
+        return f"You are a helpful academic assistant. Answer briefly in the SAME language as the user. CONSTRANT: Max {output_budget['max_sentences']} sentences."
+
+    def _simple_response(self, simple_response: str) -> ChatResponse:
+        return ChatResponse(
+            response=simple_response,
+            references=[],
+            status="chat_simple"
+        )
+
+    def _embed_query(self, query: str):
+        key = normalize_query(query)
+        vector = self._query_vectors.get(key)
+        if vector is None:
+            vector = self.llm.get_embedding(query)
+            self._query_vectors.set(key, vector)
+        return vector
+
+    async def _embed_query_async(self, query: str):
+        key = normalize_query(query)
+        vector = self._query_vectors.get(key)
+        if vector is None:
+            vector = await self.llm.get_embedding_async(query)
+            self._query_vectors.set(key, vector)
+        return vector
+
+    @staticmethod
+    def _llm_limits(budget: dict) -> dict:
+        """Generation overrides from the budget (only when degraded: default options otherwise)."""
+        return {'num_predict': budget['num_predict']} if budget.get('num_predict') else {}
+
+    def _generation_slot(self, is_voice: bool):
+        if self.generation_gate is None:
+            return contextlib.nullcontext()
+        return self.generation_gate.slot(self.course_id, PRIORITY_VOICE if is_voice else PRIORITY_STUDENT)
+
+    def _generation_slot_blocking(self, is_voice: bool):
+        """Sync path (scripts, ingestion warm-up): same cap, waited for on this thread."""
+        if self.generation_gate is None:
+            return contextlib.nullcontext()
+        return self.generation_gate.slot_blocking(self.course_id, PRIORITY_VOICE if is_voice else PRIORITY_STUDENT)
+
+    def _flight_key(self, query: str, is_voice: bool):
+        # Voice answers use a different budget/prompt, so they never share a generation with text ones
+        return normalize_query(query), is_voice
+
+    def _coalesced(self, response: ChatResponse) -> ChatResponse:
+        """A follower's copy of the leader's answer (own object: callers append notes to it)."""
+        if response.status.startswith("generated_"):
+            return response.model_copy(update={"status": "coalesced"})
+        return response.model_copy()
+
+    def _cached_response(self, cached: dict) -> ChatResponse:
+        msg_prefix = "\n\n_[Cached response]_" if cached.get('type') == 'exact' else f"\n\n_[Cached (Semantic)]_"
+        return ChatResponse(
+            response=cached['response'] + msg_prefix,
+            references=cached['references'],
+            status="cached"
+        )
+
+    def _throttled_response(self) -> ChatResponse:
+        return ChatResponse(
+            response="⚠️ System cooling active. Please try again in 10s.",
+            references=[],
+            status="throttled_cpu_hot"
+        )
+
+    def _retrieve(self, vector, query: str) -> pd.DataFrame:
         results = self.db.smart_search(vector, query, limit=12)
         
         # 4.1 NOISE FILTER (Anti-Hallucination)
@@ -67,9 +305,12 @@ class RAGService:
             # Fallback to pure chat if no relevant docs found
             # But we still want to pass history for context!
             pass 
+        return results
 
+    def _build_prompt(self, query: str, results: pd.DataFrame, history: list, is_voice: bool, reduced: bool = False):
+        """Returns (system_prompt, user_msg, references, budget)."""
         # 5. DYNAMIC BUDGET ALLOCATION
-        budget = self.cost_manager.allocate_budget(results, is_voice=is_voice)
+        budget = self.cost_manager.allocate_budget(results, is_voice=is_voice, reduced=reduced)
         MAX_CONTEXT = budget['max_context']
         
         context_blocks = []
@@ -132,10 +373,10 @@ class RAGService:
         
         
         # 6.5 INJECT CONVERSATION MEMORY (Smart Sliding Window)
-        # We only take the last 4 messages to keep it CPU/Memory efficient.
+        # We only take the last 4 messages (2 when degraded) to keep it CPU/Memory efficient.
         memory_block = ""
         if history:
-            recent_history = history[-4:] 
+            recent_history = history[-budget['history']:]
             memory_block = "PREVIOUS CONVERSATION (Use for context, but prioritize [CONTEXT] above):\n"
             for msg in recent_history:
                 role = "User" if msg['role'] == 'user' else "AI"
@@ -143,8 +384,9 @@ class RAGService:
             memory_block += "\n"
 
         user_msg = f"{memory_block}{context}\n\nQ: {query}"
-        answer = self.llm.chat(system_prompt, user_msg)
-        
+        return system_prompt, user_msg, references, budget
+
+    def _finalize(self, query: str, answer: str, references: list, vector, budget: dict) -> ChatResponse:
         # 7. SAVE TO CACHE
         unique_refs = list(dict.fromkeys(references))
         self.cache.set(query, answer, unique_refs, embedding=vector)
@@ -158,3 +400,7 @@ class RAGService:
     def get_cache_stats(self):
         """Get cache statistics for monitoring."""
         return self.cache.get_stats()
+
+    def get_coalescing_stats(self):
+        """Get request-coalescing statistics (sync and async single-flight) for monitoring."""
+        return {"sync": self._flights.stats(), "async": self._async_flights.stats()}
@@ -0,0 +1,110 @@
+import os
+import time
+import threading
+from typing import Dict, List, Optional
+from ..infrastructure.workspace import WorkspaceManager
+from ..infrastructure.ollama_client import OllamaClient
+from ..infrastructure.smart_cache import SmartCache
+from ..core.scheduler import GenerationGate
+from .rag_engine import RAGService
+
+
+class _Entry:
+    __slots__ = ("cache", "rag", "last_used")
+
+    def __init__(self, cache: SmartCache, rag: RAGService):
+        self.cache = cache
+        self.rag = rag
+        self.last_used = time.monotonic()
+
+
+class ServiceRegistry:
+    """
+    Process-wide home for per-course SmartCache / RAGService instances.
+    One cache per course survives across requests, so its L1 tier and
+    resident embedding matrix stay warm. Courses idle longer than
+    `idle_ttl` seconds are dropped on the next sweep.
+    """
+    def __init__(self, workspace_manager: WorkspaceManager, llm: OllamaClient,
+                 idle_ttl: float = 1800.0, sweep_interval: float = 60.0,
+                 generation_gate: Optional[GenerationGate] = None):
+        self.workspace_manager = workspace_manager
+        self.llm = llm
+        self.generation_gate = generation_gate  # Shared by every course's RAGService
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _get_entry(self, course_id: str) -> _Entry:
+        self._maybe_evict_idle()
+        with self._lock:
+            entry = self._entries.get(course_id)
+            if entry is None:
+                db = self.workspace_manager.get_database(course_id)
+                cache = SmartCache(db_path=self.workspace_manager.get_cache_path(course_id))
+                rag = RAGService(db, self.llm, cache, generation_gate=self.generation_gate, course_id=course_id)
+                entry = _Entry(cache, rag)
+                self._entries[course_id] = entry
+            entry.last_used = time.monotonic()
+            return entry
+
+    def get_cache(self, course_id: str) -> SmartCache:
+        return self._get_entry(course_id).cache
+
+    def get_rag_service(self, course_id: str) -> RAGService:
+        return self._get_entry(course_id).rag
+
+    def invalidate(self, course_id: str):
+        """Forget a course (e.g. after its workspace was wiped)."""
+        with self._lock:
+            entry = self._entries.pop(course_id, None)
+        if entry is not None:
+            entry.cache.close()
+
+    def evict_idle(self, now: Optional[float] = None) -> List[str]:
+        """Drop courses not used within idle_ttl. Returns the evicted course ids."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            evicted = [cid for cid, e in self._entries.items() if now - e.last_used > self.idle_ttl]
+            dropped = [self._entries.pop(cid) for cid in evicted]
+            self._last_sweep = now
+        for entry in dropped:
+            entry.cache.close()
+        return evicted
+
+    def close(self):
+        """Release every course's pooled connections (shutdown)."""
+        with self._lock:
+            entries = list(self._entries.values())
+        for entry in entries:
+            entry.cache.close()
+
+    def _maybe_evict_idle(self):
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self.evict_idle()
+
+    def cache_hits_by_course(self) -> Dict[str, int]:
+        """
+        Cache hits of every course workspace on disk. Registered courses report from their
+        live cache; the rest are read through SmartCache.read_stats and NOT registered, so
+        an analytics scan does not load (and pin) every workspace.
+        """
+        base_dir = self.workspace_manager.base_dir
+        hits = {}
+        for name in os.listdir(base_dir):
+            if not name.startswith("teacher_"):
+                continue
+            course_id = name[len("teacher_"):]
+            with self._lock:
+                entry = self._entries.get(course_id)
+            if entry is not None:
+                hits[course_id] = entry.cache.get_stats()['total_hits']
+            else:
+                hits[course_id] = SmartCache.read_stats(os.path.join(base_dir, name, "smart_cache.db"))['total_hits']
+        return hits
+
+    def active_courses(self) -> List[str]:
+        with self._lock:
+            return list(self._entries.keys())
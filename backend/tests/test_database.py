@@ -0,0 +1,168 @@
+import pytest
+import os
+import re
+import time
+import shutil
+import numpy as np
+import pandas as pd
+from teacher_assistant.src.infrastructure.database import VectorDatabase, smart_scores, reciprocal_rank_fusion, CONTENT_LOWER
+
+# Test Configuration
+TEST_BASE_DIR = "./test_vector_storage"
+
+@pytest.fixture
+def db():
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+    yield VectorDatabase(db_path=TEST_BASE_DIR)
+    shutil.rmtree(TEST_BASE_DIR)
+
+def _legacy_score(content, source, query):
+    """The original per-row scorer, kept as the reference."""
+    query_lower = query.lower()
+    score = 0
+    for word in [w for w in re.split(r'\W+', query_lower) if len(w) > 2]:
+        score += 3 if word in content.lower() else 0
+        score += 25 if word in source.lower() else 0
+    return score + (5 if query_lower[:20] in content.lower() else 0)
+
+def _chunk(i, content, source):
+    return {"vector": np.random.default_rng(i).standard_normal(8).tolist(),
+            "content": content, "source": source, "location": f"Page {i}"}
+
+ROWS = [("Requirements ENGINEERING basics", "01 - Requirements.pptx"),
+        ("Тестирование программного обеспечения", "Лекция ТЕСТИРОВАНИЕ.pdf"),
+        ("İstanbul case study on ΣΊΣΥΦΟΣ scheduling", "case.docx"),
+        ("Coupling and cohesion", "design.pdf")]
+
+@pytest.mark.parametrize("query", ["What is requirements engineering?", "тестирование", "istanbul σίσυφος", "cohesion"])
+def test_scores_match_the_row_wise_reference(query):
+    frame = pd.DataFrame([{"content": c, "source": s} for c, s in ROWS])
+    expected = [_legacy_score(c, s, query) for c, s in ROWS]
+    assert smart_scores(frame, query).tolist() == expected
+    indexed = frame.assign(**{CONTENT_LOWER: [c.lower() for c in frame['content']]})
+    assert smart_scores(indexed, query).tolist() == expected
+
+def test_content_lower_is_written_and_not_returned(db):
+    db.insert_chunks([_chunk(i, c, s) for i, (c, s) in enumerate(ROWS)])
+    tbl = db.db.open_table(db.table_name)
+    assert CONTENT_LOWER in tbl.schema.names
+
+    results = db.smart_search(np.random.default_rng(1).standard_normal(8).tolist(), "requirements engineering")
+    assert CONTENT_LOWER not in results.columns
+    assert results.iloc[0]['source'] == "01 - Requirements.pptx"
+
+def test_tables_without_content_lower_keep_working(db):
+    # Table written before the column existed
+    db.db.create_table(db.table_name, data=[_chunk(i, c, s) for i, (c, s) in enumerate(ROWS)])
+    db.replace_sources([_chunk(9, "Agile and Scrum", "agile.pdf")], ["agile.pdf"])
+    assert CONTENT_LOWER not in db.db.open_table(db.table_name).schema.names
+
+    results = db.smart_search(np.random.default_rng(1).standard_normal(8).tolist(), "scrum")
+    assert results.iloc[0]['source'] == "agile.pdf"
+
+def test_hybrid_finds_exact_term_with_a_poor_embedding(db):
+    query_vec = np.zeros(8)
+    rows = [{"vector": (query_vec + np.random.default_rng(i).normal(0, 0.1, 8)).tolist(),
+             "content": f"Generic lecture filler {i}", "source": f"l{i}.pdf", "location": f"Page {i}"} for i in range(40)]
+    rows.append({"vector": np.full(8, 50.0).tolist(), "content": "Idempotency of PUT requests",
+                 "source": "http.pdf", "location": "Page 3"})
+    db.insert_chunks(rows)
+
+    vector_only = db.smart_search(query_vec.tolist(), "idempotency", limit=3, mode="vector")
+    assert "http.pdf" not in vector_only['source'].tolist()
+
+    hybrid = db.smart_search(query_vec.tolist(), "idempotency", limit=3)
+    top = hybrid.iloc[0]
+    assert top['source'] == "http.pdf"
+    assert top['fts_rank'] == 1 and pd.isna(top['vector_rank'])
+    assert top['_distance'] == pytest.approx(8 * 50.0 ** 2)  # Filled in from the stored vector
+    assert {'fts_score', 'rrf_score', 'smart_score'} <= set(hybrid.columns)
+    assert '_rowid' not in hybrid.columns
+
+def test_rrf_rewards_agreement_between_signals():
+    vector_hits = pd.DataFrame({'_rowid': [1, 2, 3], '_distance': [0.1, 0.2, 0.3]})
+    fts_hits = pd.DataFrame({'_rowid': [3, 4], '_score': [2.5, 1.0]})
+    fused = reciprocal_rank_fusion(vector_hits, fts_hits, k=60).set_index('_rowid')
+    assert fused.loc[3, 'rrf_score'] == pytest.approx(1 / 63 + 1 / 61)
+    assert fused.loc[4, 'rrf_score'] == pytest.approx(1 / 62)
+    assert fused['rrf_score'].idxmax() == 3
+
+def _random_chunks(n, start=0, dim=16):
+    rng = np.random.default_rng(start)
+    return [{"vector": rng.standard_normal(dim).tolist(), "content": f"chunk {i}",
+             "source": f"s{i % 7}.pdf", "location": f"Page {i}"} for i in range(start, start + n)]
+
+def test_vector_index_is_created_past_the_threshold():
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+    db = VectorDatabase(db_path=TEST_BASE_DIR, index_min_rows=600, reindex_unindexed_ratio=0.2)
+    try:
+        db.insert_chunks(_random_chunks(300))
+        assert db.ensure_vector_index() == "below_threshold"
+        assert db.index_health()["vector_index"] is None
+
+        db.insert_chunks(_random_chunks(600))
+        assert db.ensure_vector_index() == "created"
+        health = db.index_health()
+        assert health["vector_index"]["indexed_rows"] == 600
+        assert health["vector_index"]["age_seconds"] >= 0
+        assert health["fts_index"] is not None
+
+        # Appended rows stay searchable (flat-scanned) until they are folded in
+        db.replace_sources(_random_chunks(50, start=600), [])
+        assert db.index_health()["vector_index"]["unindexed_rows"] == 50
+        assert db.ensure_vector_index() == "ok"
+        appended = _random_chunks(100, start=650)
+        db.replace_sources(appended, [])
+        assert db.ensure_vector_index() == "optimized"
+        assert db.index_health()["vector_index"]["unindexed_rows"] == 0
+
+        hit = db.search(appended[50]["vector"], limit=1).iloc[0]
+        assert hit["content"] == "chunk 700"  # refine_factor re-ranks with full vectors
+        assert hit["_distance"] == pytest.approx(0.0, abs=1e-5)
+    finally:
+        shutil.rmtree(TEST_BASE_DIR)
+
+def test_table_handle_and_count_are_cached(db, monkeypatch):
+    db.insert_chunks(_random_chunks(20, dim=8))
+    assert db.count() == 20
+
+    # Hot path must not list or re-open tables
+    def fail(*args, **kwargs):
+        raise AssertionError("manifest lookup on the hot path")
+    monkeypatch.setattr(db.db, "list_tables", fail)
+    monkeypatch.setattr(db.db, "open_table", fail)
+    assert db.count() == 20
+    assert not db.search(np.zeros(8).tolist(), limit=3).empty
+
+    # Our own writes refresh the count immediately
+    db.replace_sources(_random_chunks(5, start=20, dim=8), [])
+    assert db.count() == 25
+    db.delete_by_source("s0.pdf")
+    assert db.count() == 25 - sum(1 for i in range(25) if i % 7 == 0)
+
+def test_versions_written_elsewhere_are_picked_up():
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+    db = VectorDatabase(db_path=TEST_BASE_DIR, refresh_interval=0.2)
+    try:
+        db.insert_chunks(_random_chunks(10, dim=8))
+        assert db.count() == 10
+        VectorDatabase(db_path=TEST_BASE_DIR).replace_sources(_random_chunks(3, start=10, dim=8), [])
+        assert db.count() == 10  # Served from cache within the interval
+        time.sleep(0.3)
+        assert db.count() == 13
+    finally:
+        shutil.rmtree(TEST_BASE_DIR)
+
+def test_missing_fts_index_is_reported_once(db, capsys):
+    db.insert_chunks([_chunk(i, c, s) for i, (c, s) in enumerate(ROWS)], fts_index=False)
+    for _ in range(3):
+        results = db.smart_search(np.random.default_rng(1).standard_normal(8).tolist(), "cohesion")
+        assert len(results) == len(ROWS)  # Vector-only candidates
+    assert capsys.readouterr().out.count("FTS unavailable") == 1
+
+    db.rebuild_fts_index()
+    results = db.smart_search(np.random.default_rng(1).standard_normal(8).tolist(), "cohesion")
+    assert results.iloc[0]['fts_rank'] == 1
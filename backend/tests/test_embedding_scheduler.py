@@ -0,0 +1,102 @@
+import time
+import threading
+import pytest
+from teacher_assistant.src.use_cases.embedding_scheduler import EmbeddingScheduler
+from teacher_assistant.src.use_cases.ingest_pipeline import IngestPipeline
+
+class FakeOllama:
+    """Fixed cost per call plus a small cost per character; texts containing 'poison' fail."""
+    def __init__(self, per_call=0.01, per_char=0.0, max_chars=None, clock=None):
+        self.per_call = per_call
+        self.clock = clock  # FakeClock: advance it instead of sleeping (deterministic timing)
+        self.per_char = per_char
+        self.max_chars = max_chars
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def get_embeddings_batch(self, texts, stats=None):
+        with self._lock:
+            self.calls.append(len(texts))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            cost = self.per_call + self.per_char * sum(len(t) for t in texts)
+            if self.clock is not None:
+                self.clock.advance(cost)
+            else:
+                time.sleep(cost)
+            if any("poison" in t for t in texts):
+                raise RuntimeError("model rejected input")
+            if self.max_chars and sum(len(t) for t in texts) > self.max_chars:
+                raise RuntimeError("context length exceeded")
+            if stats is not None:
+                stats["misses"] = stats.get("misses", 0) + len(texts)
+            return [[float(len(t))] for t in texts]
+        finally:
+            with self._lock:
+                self.active -= 1
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+def _chunks(n, size=100):
+    return [{"content": f"{i:04d}" + "x" * (size - 4)} for i in range(n)]
+
+def _batches(chunks, n=10):
+    return [chunks[i:i + n] for i in range(0, len(chunks), n)]
+
+def test_batches_are_cut_by_characters_and_run_concurrently():
+    llm = FakeOllama(per_call=0.02)
+    scheduler = EmbeddingScheduler(llm, concurrency=3, batch_chars=1000, adapt_every=1000)
+    chunks = _chunks(60, size=100)
+    out = [c for batch in scheduler.embed_stream(_batches(chunks)) for c in batch]
+    assert sorted(c["content"] for c in out) == sorted(c["content"] for c in chunks)
+    assert all(c["vector"] == [100.0] for c in chunks)
+    assert set(llm.calls) == {10} and llm.peak == 3
+    report = scheduler.report()
+    assert report["chunks"] == 60 and report["batches"] == 6 and report["chunks_per_sec"] > 0
+    assert scheduler.cache_stats["misses"] == 60
+
+def test_failed_batch_is_bisected_and_a_bad_chunk_still_fails():
+    llm = FakeOllama(per_call=0.0, max_chars=2000)
+    scheduler = EmbeddingScheduler(llm, concurrency=1, batch_chars=3200, min_chars=500, adapt_every=1000)
+    chunks = _chunks(32, size=100)
+    list(scheduler.embed_stream(_batches(chunks)))
+    assert all("vector" in c for c in chunks)
+    # 3200 chars failed and was split in two; later batches start at the halved budget
+    assert llm.calls[:3] == [32, 16, 16]
+    assert scheduler.report()["bisections"] == 1 and scheduler.batch_chars == 1600
+
+    poisoned = _chunks(16)
+    poisoned[5]["content"] += " poison"
+    with pytest.raises(RuntimeError, match="rejected"):
+        list(EmbeddingScheduler(FakeOllama(per_call=0.0), concurrency=1, batch_chars=10_000).embed_stream([poisoned]))
+
+def test_batch_size_climbs_while_throughput_improves():
+    # Per-call overhead dominates: bigger batches are strictly faster, so the budget grows
+    clock = FakeClock()
+    llm = FakeOllama(per_call=0.01, per_char=1e-6, clock=clock)
+    scheduler = EmbeddingScheduler(llm, concurrency=1, batch_chars=500, max_chars=8000, adapt_every=2,
+                                   clock=clock)
+    list(scheduler.embed_stream(_batches(_chunks(2000))))
+    assert llm.calls[0] == 5 and max(llm.calls) == 80
+    assert scheduler.batch_chars >= int(8000 / 1.5)  # At the cap, give or take one probing step
+
+def test_pipeline_drives_the_scheduler():
+    llm = FakeOllama(per_call=0.005)
+    scheduler = EmbeddingScheduler(llm, concurrency=2, batch_chars=700)
+    written = []
+    files = ((f"file{i}.txt", _chunks(25)) for i in range(8))
+    pipeline = IngestPipeline(scheduler, written.extend, embed_batch=10, write_rows=50)
+    pipeline.run(files)
+    assert len(written) == 200 and all("vector" in c for c in written)
+    assert pipeline.report()["embed"]["chunks"] == 200 and llm.peak == 2
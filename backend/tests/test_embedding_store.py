@@ -0,0 +1,75 @@
+import pytest
+import os
+import shutil
+import asyncio
+from types import SimpleNamespace
+from teacher_assistant.src.infrastructure import ollama_client
+from teacher_assistant.src.infrastructure.embedding_store import EmbeddingStore
+from teacher_assistant.src.infrastructure.ollama_client import OllamaClient
+
+# Test Configuration
+TEST_BASE_DIR = "./test_embedding_storage"
+
+@pytest.fixture
+def store():
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+    os.makedirs(TEST_BASE_DIR)
+    store = EmbeddingStore(db_path=os.path.join(TEST_BASE_DIR, "embedding_cache.db"))
+    yield store
+    store.close()
+    shutil.rmtree(TEST_BASE_DIR)
+
+@pytest.fixture
+def fake_ollama(monkeypatch):
+    """Replaces ollama.embed; records which inputs actually reached the model."""
+    calls = []
+
+    def embed(model, input, options=None):
+        texts = [input] if isinstance(input, str) else list(input)
+        calls.append(texts)
+        return SimpleNamespace(embeddings=[[float(len(t)), 1.0, 0.5] for t in texts])
+
+    monkeypatch.setattr(ollama_client.ollama, "embed", embed)
+    return calls
+
+def test_store_roundtrip_is_keyed_by_model_and_text(store):
+    store.put("model-a", "hello", [0.25, 0.5, 1.0])
+    assert store.get("model-a", "hello") == [0.25, 0.5, 1.0]
+    assert store.get("model-b", "hello") is None
+    assert store.get_many("model-a", ["hello", "other", "hello"])[1] is None
+    assert store.stats()['hits'] == 3
+
+def test_batch_only_embeds_unseen_texts(store, fake_ollama):
+    llm = OllamaClient(embedding_store=store)
+    stats = {}
+    first = llm.get_embeddings_batch(["slide one", "slide two", "slide one"], stats=stats)
+    assert fake_ollama == [["slide one", "slide two"]]  # Duplicates collapse too
+    assert first[0] == first[2]
+    assert stats == {'hits': 0, 'misses': 3}
+
+    second = llm.get_embeddings_batch(["slide two", "slide three"], stats=stats)
+    assert fake_ollama[-1] == ["slide three"]
+    assert second[0] == first[1]
+    assert stats == {'hits': 1, 'misses': 4}
+
+def test_query_embedding_reuses_the_store(store, fake_ollama):
+    llm = OllamaClient(embedding_store=store)
+    llm.get_embeddings_batch(["What is UML?"])
+    assert llm.get_embedding("What is UML?") == [12.0, 1.0, 0.5]
+    assert asyncio.run(llm.get_embedding_async("What is UML?")) == [12.0, 1.0, 0.5]
+    assert len(fake_ollama) == 1
+
+def test_query_embeddings_are_not_persisted(store, fake_ollama):
+    llm = OllamaClient(embedding_store=store)
+
+    async def embed_async(model, input, options=None):
+        return ollama_client.ollama.embed(model, input, options)
+    llm._get_async_client = lambda: SimpleNamespace(embed=embed_async)
+
+    llm.get_embedding("Is the exam open book?")
+    asyncio.run(llm.get_embedding_async("When is the deadline?"))
+    assert store.get(llm.embed_model, "Is the exam open book?") is None
+    assert store.get(llm.embed_model, "When is the deadline?") is None
+    llm.get_embeddings_batch(["Chapter 3: requirements"])  # Ingestion still fills the store
+    assert store.get(llm.embed_model, "Chapter 3: requirements") == [23.0, 1.0, 0.5]
@@ -0,0 +1,44 @@
+import time
+import pytest
+from teacher_assistant.src.use_cases.ingest_pipeline import IngestPipeline
+
+def _files(n, chunks_per_file, log):
+    for i in range(n):
+        log.append(("parsed", i))
+        yield f"file{i}.txt", [{"content": f"{i}-{j}", "source": f"file{i}.txt"} for j in range(chunks_per_file)]
+
+def test_stages_overlap_and_memory_stays_bounded():
+    log, written, in_flight = [], [], []
+
+    def embed(batch):
+        time.sleep(0.005)
+        for chunk in batch:
+            chunk["vector"] = [1.0]
+
+    def write(rows):
+        written.extend(rows)
+        in_flight.append(pipeline.chunks_parsed - len(written))
+        log.append(("write", len(written)))
+
+    pipeline = IngestPipeline(embed, write, embed_batch=10, write_rows=20, queue_depth=2)
+    pipeline.run(_files(40, 10, log))
+
+    assert len(written) == 400 and all(c["vector"] == [1.0] for c in written)
+    # Writing started long before the last file was parsed
+    assert log.index(("write", 20)) < log.index(("parsed", 39))
+    # Parsed-but-unwritten chunks: two queues of 2 batches, one batch per stage, one write buffer, one file
+    assert max(in_flight) <= (2 + 2 + 2) * 10 + 20 + 10
+    report = pipeline.report()
+    assert report["parse"]["files"] == 40 and report["write"]["rows"] == 400
+    assert report["embed"]["per_sec"] > 0 and not report["write"]["running"]
+
+def test_a_failing_stage_stops_the_pipeline():
+    def embed(batch):
+        raise RuntimeError("embedding model unavailable")
+
+    written = []
+    pipeline = IngestPipeline(embed, written.extend, embed_batch=5, queue_depth=1)
+    with pytest.raises(RuntimeError, match="unavailable"):
+        pipeline.run(_files(1000, 5, []))
+    assert written == []
+    assert pipeline.report()["parse"]["files"] < 1000  # The parser was not left running
@@ -0,0 +1,271 @@
+import pytest
+import os
+import shutil
+import numpy as np
+from teacher_assistant.src.infrastructure.workspace import WorkspaceManager
+from teacher_assistant.src.infrastructure.ingest_manifest import IngestManifest
+from teacher_assistant.src.use_cases.ingestion import IngestionService
+
+# Test Configuration
+TEST_BASE_DIR = "./test_ingest_storage"
+
+class FakeEmbedder:
+    """Counts embedded texts instead of calling Ollama."""
+    def __init__(self):
+        self.embedded = []
+
+    def get_embedding(self, text, stats=None):
+        self.embedded.append(text)
+        return np.random.default_rng(len(text)).standard_normal(768).tolist()
+
+    def get_embeddings_batch(self, texts, stats=None):
+        return [self.get_embedding(t) for t in texts]
+
+@pytest.fixture
+def workspace():
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+    manager = WorkspaceManager(base_dir=TEST_BASE_DIR)
+    doc_dir = os.path.join(manager.get_teacher_path("course"), "documents")
+    os.makedirs(doc_dir)
+    yield manager, doc_dir
+    shutil.rmtree(TEST_BASE_DIR)
+
+def _write(doc_dir, name, text):
+    with open(os.path.join(doc_dir, name), "w", encoding="utf-8") as f:
+        f.write(text)
+
+def _sources(db):
+    return sorted(set(db.db.open_table(db.table_name).to_pandas()['source']))
+
+def test_only_new_or_changed_files_are_embedded(workspace):
+    manager, doc_dir = workspace
+    db = manager.get_database("course")
+    llm = FakeEmbedder()
+
+    _write(doc_dir, "a.txt", "Lecture A covers coupling and cohesion.")
+    _write(doc_dir, "b.txt", "Lecture B covers the waterfall model.")
+    IngestionService(db, llm, course_id="course").process_directory(doc_dir)
+    assert len(llm.embedded) == 2
+    assert _sources(db) == ["a.txt", "b.txt"]
+
+    # Nothing changed: nothing is parsed or embedded
+    llm.embedded.clear()
+    IngestionService(db, llm, course_id="course").process_directory(doc_dir)
+    assert llm.embedded == []
+    assert IngestionService._progress_map["course"]["files_unchanged"] == 2
+
+    # One new file, one edited file
+    _write(doc_dir, "c.txt", "Lecture C covers agile methods.")
+    _write(doc_dir, "a.txt", "Lecture A, revised: design patterns.")
+    IngestionService(db, llm, course_id="course").process_directory(doc_dir)
+    assert sorted(llm.embedded) == sorted(["[a.txt] Lecture A, revised: design patterns.",
+                                           "[c.txt] Lecture C covers agile methods."])
+    contents = db.db.open_table(db.table_name).to_pandas()['content'].tolist()
+    assert not any("coupling" in c for c in contents)  # Old chunks of a.txt are gone
+    assert db.count() == 3
+
+def test_removed_files_lose_their_chunks(workspace):
+    manager, doc_dir = workspace
+    db = manager.get_database("course")
+    llm = FakeEmbedder()
+
+    _write(doc_dir, "a.txt", "Lecture A covers coupling and cohesion.")
+    _write(doc_dir, "b's notes.txt", "Notes with a quote in the filename.")
+    IngestionService(db, llm, course_id="course").process_directory(doc_dir)
+
+    os.remove(os.path.join(doc_dir, "b's notes.txt"))
+    llm.embedded.clear()
+    IngestionService(db, llm, course_id="course").process_directory(doc_dir)
+    assert llm.embedded == []
+    assert _sources(db) == ["a.txt"]
+
+def test_process_pool_parsing_matches_threads_and_reports_progress(workspace):
+    manager, doc_dir = workspace
+    for i in range(6):
+        _write(doc_dir, f"{i:02d} - Lecture {i}.txt", f"Lecture {i} covers topic number {i}. " * 40)
+
+    threaded_db = manager.get_database("course_threads")
+    IngestionService(threaded_db, FakeEmbedder(), course_id="course_threads", parse_mode="thread").process_directory(doc_dir)
+    threaded = threaded_db.db.open_table(threaded_db.table_name).to_pandas()
+
+    db = manager.get_database("course")
+    IngestionService(db, FakeEmbedder(), course_id="course", parse_mode="process").process_directory(doc_dir)
+    status = IngestionService._progress_map["course"]
+    assert status["status"] == "ready" and status["parse_mode"] == "process"
+
+    pooled = db.db.open_table(db.table_name).to_pandas()
+    key = ["source", "location", "content"]
+    assert (pooled[key].sort_values(key).reset_index(drop=True)
+            .equals(threaded[key].sort_values(key).reset_index(drop=True)))
+
+def test_batches_put_large_files_first_and_pack_small_ones(tmp_path):
+    from teacher_assistant.src.infrastructure.document_parser import plan_batches
+    sizes = {"big.pdf": 5000, "mid.pdf": 3000, "a.txt": 100, "b.txt": 100, "c.txt": 100}
+    for name, size in sizes.items():
+        (tmp_path / name).write_bytes(b"x" * size)
+    batches = plan_batches([str(tmp_path / n) for n in sizes], max_task_bytes=4000, max_files_per_task=2)
+    names = [[os.path.basename(p) for p in batch] for batch in batches]
+    assert names[0] == ["big.pdf"]
+    assert names[1] == ["mid.pdf", "c.txt"]
+    assert sorted(sum(names, [])) == sorted(sizes)
+
+def test_streamed_writes_upsert_each_file_once(workspace):
+    manager, doc_dir = workspace
+    db = manager.get_database("course")
+    for i in range(5):
+        _write(doc_dir, f"lecture{i}.txt", f"Lecture {i} version one.")
+
+    def ingest():
+        service = IngestionService(db, FakeEmbedder(), course_id="course")
+        service.embed_batch_size, service.write_rows = 1, 2  # Several appends per run
+        service.process_directory(doc_dir)
+
+    ingest()
+    assert db.count() == 5
+    _write(doc_dir, "lecture1.txt", "Lecture 1 version two.")
+    _write(doc_dir, "lecture3.txt", "")  # Emptied: no chunks left for it
+    _write(doc_dir, "lecture5.txt", "Lecture 5 is new.")
+    ingest()
+    contents = sorted(db.db.open_table(db.table_name).to_pandas()['content'])
+    assert contents == ["[lecture0.txt] Lecture 0 version one.", "[lecture1.txt] Lecture 1 version two.",
+                        "[lecture2.txt] Lecture 2 version one.", "[lecture4.txt] Lecture 4 version one.",
+                        "[lecture5.txt] Lecture 5 is new."]
+    assert IngestionService._progress_map["course"]["pipeline"]["write"]["rows"] == 2
+
+def test_same_named_files_in_subfolders_keep_their_own_chunks(workspace):
+    manager, doc_dir = workspace
+    db = manager.get_database("course")
+    for week in ("week1", "week2"):
+        os.makedirs(os.path.join(doc_dir, week))
+        _write(doc_dir, os.path.join(week, "notes.txt"), f"Notes for {week}: requirements.")
+    IngestionService(db, FakeEmbedder(), course_id="course").process_directory(doc_dir)
+    assert _sources(db) == ["week1/notes.txt", "week2/notes.txt"]
+
+    _write(doc_dir, os.path.join("week1", "notes.txt"), "Notes for week1, revised: use cases.")
+    IngestionService(db, FakeEmbedder(), course_id="course").process_directory(doc_dir)
+    os.remove(os.path.join(doc_dir, "week2", "notes.txt"))
+    llm = FakeEmbedder()
+    IngestionService(db, llm, course_id="course").process_directory(doc_dir)
+    assert llm.embedded == []
+    assert db.db.open_table(db.table_name).to_pandas()['content'].tolist() == [
+        "[notes.txt] Notes for week1, revised: use cases."]
+
+def test_manifest_with_basename_sources_is_rebuilt_once(workspace):
+    manager, doc_dir = workspace
+    db = manager.get_database("course")
+    os.makedirs(os.path.join(doc_dir, "week1"))
+    _write(doc_dir, os.path.join("week1", "notes.txt"), "Notes for week1.")
+    IngestionService(db, FakeEmbedder(), course_id="course").process_directory(doc_dir)
+
+    manifest = IngestManifest(db.db_path)
+    manifest.entries["week1/notes.txt"]["source"] = "notes.txt"  # Written before sources were relpaths
+    manifest.save()
+    llm = FakeEmbedder()
+    IngestionService(db, llm, course_id="course").process_directory(doc_dir)
+    assert len(llm.embedded) == 1 and _sources(db) == ["week1/notes.txt"]
+    assert not IngestManifest(db.db_path).has_basename_sources
+
+def test_overlapping_ingestions_of_a_course_run_one_at_a_time(workspace):
+    import threading
+    import time
+    manager, doc_dir = workspace
+    db = manager.get_database("course")
+    _write(doc_dir, "a.txt", "Lecture A covers coupling and cohesion.")
+    IngestionService(db, FakeEmbedder(), course_id="course").process_directory(doc_dir)
+
+    class SlowEmbedder(FakeEmbedder):
+        def get_embeddings_batch(self, texts, stats=None):
+            time.sleep(0.5)  # The second upload's ingestion starts (and could finish) meanwhile
+            return super().get_embeddings_batch(texts, stats)
+
+    _write(doc_dir, "b.txt", "Lecture B covers the waterfall model.")
+    first = threading.Thread(target=IngestionService(db, SlowEmbedder(), course_id="course").process_directory,
+                             args=(doc_dir,))
+    first.start()
+    time.sleep(0.1)
+    _write(doc_dir, "c.txt", "Lecture C covers agile methods.")
+    second = IngestionService(db, FakeEmbedder(), course_id="course")
+    second.process_directory(doc_dir)
+    first.join()
+
+    assert db.count() == 3  # No file's chunks written twice
+    assert _sources(db) == ["a.txt", "b.txt", "c.txt"]
+    assert sorted(IngestManifest(db.db_path).entries) == ["a.txt", "b.txt", "c.txt"]
+
+def test_failed_parse_keeps_old_chunks_and_is_retried(workspace, monkeypatch):
+    from teacher_assistant.src.infrastructure import document_parser
+    manager, doc_dir = workspace
+    db = manager.get_database("course")
+    _write(doc_dir, "a.txt", "Lecture A covers coupling and cohesion.")
+    IngestionService(db, FakeEmbedder(), course_id="course").process_directory(doc_dir)
+    recorded = IngestManifest(db.db_path).entries["a.txt"]
+
+    _write(doc_dir, "a.txt", "Lecture A, revised: design patterns.")
+    real_iter_blocks = document_parser.iter_blocks
+    def flaky(path, file_hash=None):
+        raise OSError("file locked by another process")
+    monkeypatch.setattr(document_parser, "iter_blocks", flaky)
+    IngestionService(db, FakeEmbedder(), course_id="course", parse_mode="thread").process_directory(doc_dir)
+    assert db.db.open_table(db.table_name).to_pandas()['content'].tolist() == [
+        "[a.txt] Lecture A covers coupling and cohesion."]  # Not dropped as an empty file
+    assert IngestManifest(db.db_path).entries["a.txt"] == recorded  # Not marked as ingested
+
+    monkeypatch.setattr(document_parser, "iter_blocks", real_iter_blocks)
+    llm = FakeEmbedder()
+    IngestionService(db, llm, course_id="course", parse_mode="thread").process_directory(doc_dir)
+    assert llm.embedded == ["[a.txt] Lecture A, revised: design patterns."]
+
+def _crash_once(paths, hashes=None):
+    """Worker task that kills its process the first time it meets a 'crash' file."""
+    import time
+    from teacher_assistant.src.infrastructure.document_parser import parse_batch
+    for path in paths:
+        marker = path + ".crashed"
+        if "crash" in os.path.basename(path) and not os.path.exists(marker):
+            open(marker, "w").close()
+            time.sleep(0.5)  # Let the other tasks get in flight first
+            os._exit(1)
+    time.sleep(0.2)
+    return parse_batch(paths, hashes)
+
+def test_dead_worker_retries_its_files_once_without_breaking_other_ingestions(tmp_path):
+    import threading
+    from teacher_assistant.src.infrastructure.document_parser import ParsePool
+
+    class CrashingPool(ParsePool):
+        task = staticmethod(_crash_once)
+        spawned = []
+
+        def _get_executor(self):
+            executor = super()._get_executor()
+            if executor not in self.spawned:
+                self.spawned.append(executor)
+            return executor
+
+    courses = {"a": [f"lecture{i}.txt" for i in range(6)] + ["crash.txt"],
+               "b": [f"slides{i}.txt" for i in range(6)]}
+    paths = {}
+    for course, names in courses.items():
+        (tmp_path / course).mkdir()
+        for name in names:
+            (tmp_path / course / name).write_text(f"{name} covers software testing.", encoding="utf-8")
+        paths[course] = [str(tmp_path / course / n) for n in names]
+
+    pool = CrashingPool(max_workers=2, max_files_per_task=1, window_per_worker=4)
+    results = {}
+    threads = [threading.Thread(target=lambda c=c: results.__setitem__(c, list(pool.parse(paths[c]))))
+               for c in courses]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        pool.shutdown()
+    for course, names in courses.items():
+        # Every file exactly once, parsed: none lost with the dead pool or cancelled by the other
+        # course's recovery replacing the pool that holds this course's retries
+        assert sorted(os.path.basename(p) for p, _, _ in results[course]) == sorted(names)
+        assert all(chunks and error is None for _, chunks, error in results[course]), results[course]
+    assert len(CrashingPool.spawned) == 2  # One replacement pool, not one per broken future
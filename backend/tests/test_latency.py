@@ -0,0 +1,59 @@
+import pytest
+from teacher_assistant.src.core.latency import LatencyWindow, PATH_GENERATION, PATH_CACHE_HIT, path_for_status
+from teacher_assistant.src.core.resource_guard import ResourceGuard
+
+def test_window_percentiles_use_constant_memory_and_age_out():
+    window = LatencyWindow(capacity=100, window_seconds=60)
+    for i in range(1000):  # Only the last 100 samples are kept
+        window.record(float(i % 100), now=0.0)
+    s = window.summary(now=1.0)
+    assert s["count"] == 100
+    assert s["p50"] == pytest.approx(49.5)
+    assert s["p99"] == pytest.approx(98.01)
+    assert window._values.size == 100
+
+    window.record(5.0, now=100.0)
+    assert window.summary(now=100.0)["count"] == 1  # Older samples left the 60s window
+
+def test_statuses_map_to_paths():
+    assert path_for_status("generated_standard") == PATH_GENERATION
+    assert path_for_status("coalesced") == PATH_GENERATION
+    assert path_for_status("chat_simple") == "skip_rag"
+    assert path_for_status("cached") == PATH_CACHE_HIT
+
+def _fill(guard, seconds, n=20):
+    for _ in range(n):
+        guard.scheduler.try_acquire()
+        guard.release_slot(seconds, "generated_standard")
+
+def test_slow_generations_shrink_capacity_and_fast_ones_grow_it_back():
+    guard = ResourceGuard(max_concurrent=20, min_concurrent=4, target_generation_p95=10.0,
+                          adapt_interval=0.0, adapt_min_samples=20)
+    _fill(guard, 30.0)
+    assert guard.scheduler.capacity == 16  # -20%
+    _fill(guard, 30.0)
+    assert guard.scheduler.capacity == 12
+
+    # Fast again, but nobody waiting: no reason to grow
+    _fill(guard, 1.0)
+    assert guard.scheduler.capacity == 12
+
+    # Fast and requests are queuing: one more slot
+    while guard.scheduler.try_acquire():
+        pass
+    ticket_id = guard.join_queue()
+    for _ in range(25):
+        guard.latency.record(PATH_GENERATION, 1.0)
+    guard._adapt_concurrency()
+    assert guard.scheduler.capacity == 13
+    assert guard.get_queue_status(ticket_id)["status"] == "ready"  # The new slot went to the queue
+
+def test_metrics_report_paths_and_limits():
+    guard = ResourceGuard(max_concurrent=5, adaptive=False)
+    guard.scheduler.try_acquire()
+    guard.release_slot(0.02, "cached")
+    metrics = guard.metrics()
+    assert metrics["latency"][PATH_CACHE_HIT]["count"] == 1
+    assert metrics["latency"]["all"]["p50"] == pytest.approx(0.02)
+    assert metrics["concurrency"]["capacity"] == 5
+    assert metrics["queue"]["active"] == 0
@@ -0,0 +1,86 @@
+from teacher_assistant.src.core.load_monitor import (
+    LoadMonitor, LEVEL_NORMAL, LEVEL_REDUCED, LEVEL_CACHE_ONLY
+)
+from teacher_assistant.src.core.resource_guard import ResourceGuard
+
+class FakeHost:
+    def __init__(self):
+        self.cpu = 10.0
+
+    def __call__(self):
+        return {"cpu": self.cpu, "memory": 40.0}
+
+def _run(monitor, host, cpu, seconds, start):
+    host.cpu = cpu
+    for t in range(seconds):
+        monitor.sample(now=start + t)
+    return start + seconds
+
+def test_single_spike_does_not_degrade():
+    host = FakeHost()
+    monitor = LoadMonitor(sampler=host, alpha=0.3)
+    t = _run(monitor, host, 10.0, 5, 0)
+    t = _run(monitor, host, 100.0, 1, t)  # One 100% sample
+    assert monitor.current == LEVEL_NORMAL
+    assert monitor.pressure < 75.0
+    _run(monitor, host, 10.0, 5, t)
+    assert not monitor.transitions
+
+def test_sustained_load_escalates_then_recovers_one_level_at_a_time():
+    host = FakeHost()
+    monitor = LoadMonitor(sampler=host, reduce_at=75, cache_only_at=90, hysteresis=10, min_dwell=10)
+    t = _run(monitor, host, 10.0, 5, 0)
+    t = _run(monitor, host, 100.0, 10, t)
+    assert monitor.current == LEVEL_CACHE_ONLY
+    assert [tr["to"] for tr in monitor.transitions] == ["reduced", "cache_only"]
+
+    # Just under the threshold: hysteresis keeps cache-only
+    t = _run(monitor, host, 85.0, 30, t)
+    assert monitor.current == LEVEL_CACHE_ONLY
+
+    # Calm: steps down to reduced, and only after min_dwell to normal
+    t = _run(monitor, host, 20.0, 1, t)
+    assert monitor.current == LEVEL_REDUCED
+    t = _run(monitor, host, 20.0, 9, t)
+    assert monitor.current == LEVEL_REDUCED and monitor.pressure < 65
+    _run(monitor, host, 20.0, 1, t)
+    assert monitor.current == LEVEL_NORMAL
+    assert [tr["to"] for tr in monitor.transitions][-2:] == ["reduced", "normal"]
+
+def test_memory_near_exhaustion_counts_too_and_snapshot_reports_it():
+    monitor = LoadMonitor(sampler=lambda: {"cpu": 5.0, "memory": 98.0})
+    for t in range(10):
+        monitor.sample(now=t)
+    snapshot = monitor.snapshot()
+    assert snapshot["level"] == "cache_only"
+    assert snapshot["signals"]["memory"] > 97 and snapshot["normalized"]["memory"] >= 90
+    assert snapshot["transitions"][-1]["to"] == "cache_only"
+
+def test_resident_model_memory_with_idle_cpu_stays_normal():
+    # A model kept in RAM: memory high all day, CPU idle - judged on memory's own thresholds
+    host = {"cpu": 5.0, "memory": 80.0}
+    monitor = LoadMonitor(sampler=lambda: dict(host))
+    for t in range(30):
+        monitor.sample(now=t)
+    assert monitor.current == LEVEL_NORMAL and monitor.pressure < 75
+    host["memory"] = 90.0
+    for t in range(30, 60):
+        monitor.sample(now=t)
+    assert monitor.current == LEVEL_NORMAL
+    host["memory"] = 95.0  # Close to exhaustion: shorter answers, but still generating
+    for t in range(60, 90):
+        monitor.sample(now=t)
+    assert monitor.current == LEVEL_REDUCED
+
+def test_guard_health_follows_the_level():
+    guard = ResourceGuard(max_cpu_percent=90.0)
+    host = FakeHost()
+    guard.load_monitor.sampler = host
+    guard.load_monitor.interval = 0.0  # Sample inline on every check
+    assert guard.check_health() == (True, "Healthy")
+    host.cpu = 80.0
+    for _ in range(10):
+        guard.check_health()
+    assert guard.degradation_level() == LEVEL_REDUCED
+    healthy, message = guard.check_health()
+    assert healthy and "reduced" in message
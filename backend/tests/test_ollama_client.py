@@ -0,0 +1,56 @@
+import pytest
+from teacher_assistant.src.infrastructure.ollama_client import OllamaClient, StreamCleaner
+
+SAMPLES = [
+    "Coupling measures how much modules depend on each other.",
+    "  \n Cohesion 是 measures focus.\n\n",
+    "中文 Agile values people 한국어 over processes. ",
+    "\t\nUML has   13 diagram types:\n- class\n- sequence\n \t",
+    "答案",
+    "   ",
+    "A　B ｆｕｌｌ width\n中",
+]
+
+def _stream(pieces):
+    cleaner = StreamCleaner()
+    return "".join(cleaner.feed(p) for p in pieces)
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_stream_cleaner_matches_clean_at_every_split(text):
+    expected = OllamaClient._clean(text)
+    assert _stream(list(text)) == expected  # One character per token
+    for i in range(len(text) + 1):
+        assert _stream([text[:i], text[i:]]) == expected, i
+        for j in range(i, len(text) + 1):
+            assert _stream([text[:i], text[i:j], text[j:]]) == expected, (i, j)
+
+def test_async_clients_are_kept_per_loop_and_closed():
+    import asyncio
+    import threading
+    llm = OllamaClient()
+
+    async def client_twice():
+        return llm._get_async_client(), llm._get_async_client()
+
+    first, again = asyncio.run(client_twice())
+    assert first is again  # One pool per loop
+
+    # A loop running in another thread gets its own client and does not replace this one
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever)
+    thread.start()
+    try:
+        async def run_both():
+            mine = llm._get_async_client()
+            theirs = asyncio.run_coroutine_threadsafe(client_twice(), other_loop).result()[0]
+            assert mine is not theirs and llm._get_async_client() is mine
+            assert len(llm._async_clients) == 2  # The closed first loop's client was dropped
+            await llm.aclose()
+            return mine
+        mine = asyncio.run(run_both())
+    finally:
+        other_loop.call_soon_threadsafe(other_loop.stop)
+        thread.join()
+        other_loop.close()
+    assert mine._client.is_closed
+    assert first not in llm._async_clients.values()
@@ -0,0 +1,82 @@
+import pdfplumber
+from teacher_assistant.src.infrastructure import document_parser
+from teacher_assistant.src.infrastructure.document_parser import iter_pdf_pages, parse_document
+from teacher_assistant.src.infrastructure.page_text_store import PageTextStore
+
+def _write_pdf(path, pages):
+    """Minimal valid PDF, one line of Helvetica text per page."""
+    n = len(pages)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{3 + 2 * i} 0 R" for i in range(n)), n)]
+    for i, text in enumerate(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                       f"/Resources << /Font << /F1 {3 + 2 * n} 0 R >> >> >>")
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    out, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+def _count_extractions(monkeypatch):
+    calls = []
+    original = pdfplumber.page.Page.extract_text
+    def counting(page, *args, **kwargs):
+        calls.append(page.page_number)
+        return original(page, *args, **kwargs)
+    monkeypatch.setattr(pdfplumber.page.Page, "extract_text", counting)
+    return calls
+
+def test_pages_stream_and_are_cached_by_content(tmp_path, monkeypatch):
+    path = tmp_path / "textbook.pdf"
+    _write_pdf(path, [f"Chapter {i} coupling and cohesion" for i in range(5)])
+    cache = PageTextStore(str(tmp_path / "pages.db"))
+    calls = _count_extractions(monkeypatch)
+
+    pages = iter_pdf_pages(str(path), cache)
+    assert next(pages) == (0, "Chapter 0 coupling and cohesion")
+    assert calls == [1]  # Lazy: nothing beyond the first page yet
+    assert [i for i, _ in pages] == [1, 2, 3, 4]
+    assert len(calls) == 5
+
+    # Same content under another name: served from the cache, the PDF is not opened
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes(path.read_bytes())
+    monkeypatch.setattr(pdfplumber, "open", lambda *a, **k: (_ for _ in ()).throw(AssertionError("opened")))
+    assert [t for _, t in iter_pdf_pages(str(copy), cache)][4] == "Chapter 4 coupling and cohesion"
+    assert len(calls) == 5
+
+def test_interrupted_extraction_resumes_from_cached_pages(tmp_path, monkeypatch):
+    path = tmp_path / "scan.pdf"
+    _write_pdf(path, [f"Page text {i}" for i in range(4)])
+    cache = PageTextStore(str(tmp_path / "pages.db"))
+    calls = _count_extractions(monkeypatch)
+
+    pages = iter_pdf_pages(str(path), cache)
+    next(pages), next(pages)
+    pages.close()  # Crash / cancellation half-way through
+    assert cache.page_count(document_parser.hash_file(str(path))) is None
+
+    monkeypatch.setattr(document_parser, "_page_cache_path", str(tmp_path / "pages.db"))
+    monkeypatch.setattr(document_parser, "_page_cache", cache)
+    chunks = parse_document(str(path))
+    assert [c["location"] for c in chunks] == ["Page 1", "Page 2", "Page 3", "Page 4"]
+    assert chunks[3]["content"] == "[scan] Page text 3"
+    assert calls == [1, 2, 3, 4]  # Pages 1-2 were not extracted twice
+
+def test_known_hash_is_used_instead_of_rereading(tmp_path, monkeypatch):
+    path = tmp_path / "lecture.pdf"
+    _write_pdf(path, ["Agile manifesto", "Scrum roles"])
+    sha256 = document_parser.hash_file(str(path))
+    cache = PageTextStore(str(tmp_path / "pages.db"))
+    monkeypatch.setattr(document_parser, "hash_file", lambda p: (_ for _ in ()).throw(AssertionError("re-hashed")))
+
+    assert [t for _, t in iter_pdf_pages(str(path), cache, file_hash=sha256)] == ["Agile manifesto", "Scrum roles"]
+    assert cache.page_count(sha256) == 2
@@ -0,0 +1,233 @@
+import pytest
+import os
+import shutil
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from teacher_assistant.src.infrastructure.workspace import WorkspaceManager
+from teacher_assistant.src.infrastructure.smart_cache import SmartCache
+from teacher_assistant.src.use_cases.rag_engine import RAGService
+from teacher_assistant.src.core.scheduler import GenerationGate
+
+# Test Configuration
+TEST_BASE_DIR = "./test_rag_storage"
+
+class FakeLLM:
+    """Deterministic stand-in for OllamaClient (no Ollama server needed)."""
+    def __init__(self):
+        self.chat_calls = 0
+        self.embed_calls = 0
+
+    def _vec(self, text):
+        seed = sum(text.encode()) % 1000
+        return np.random.default_rng(seed).standard_normal(768).tolist()
+
+    def get_embedding(self, text):
+        self.embed_calls += 1
+        return self._vec(text)
+
+    def get_embeddings_batch(self, texts):
+        return [self.get_embedding(t) for t in texts]
+
+    def chat(self, system_prompt, user_message):
+        self.chat_calls += 1
+        return f"answer #{self.chat_calls}"
+
+    async def get_embedding_async(self, text):
+        return self.get_embedding(text)
+
+    async def chat_async(self, system_prompt, user_message):
+        return self.chat(system_prompt, user_message)
+
+    async def chat_stream_async(self, system_prompt, user_message):
+        for piece in self.chat(system_prompt, user_message).split(" "):
+            yield piece + " "
+
+@pytest.fixture
+def rag():
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+    manager = WorkspaceManager(base_dir=TEST_BASE_DIR)
+    cache = SmartCache(db_path=manager.get_cache_path("course"))
+    service = RAGService(manager.get_database("course"), FakeLLM(), cache)
+    yield service
+    cache.close()
+    shutil.rmtree(TEST_BASE_DIR)
+
+def test_async_path_generates_then_serves_from_cache(rag):
+    first = asyncio.run(rag.answer_question_async("Explain the waterfall model"))
+    assert first.status.startswith("generated_")
+    assert first.response == "answer #1"
+
+    second = asyncio.run(rag.answer_question_async("Explain the waterfall model"))
+    assert second.status == "cached"
+    assert rag.llm.chat_calls == 1
+
+def test_sync_and_async_paths_share_the_cache(rag):
+    rag.answer_question("What is a use case diagram?")
+    cached = asyncio.run(rag.answer_question_async("What is a use case diagram?"))
+    assert cached.status == "cached"
+
+def test_skip_rag_and_throttle_on_async_path(rag):
+    simple = asyncio.run(rag.answer_question_async("hello there"))
+    assert simple.status == "chat_simple"
+
+    throttled = asyncio.run(rag.answer_question_async("Explain requirements engineering", force_cache_only=True))
+    assert throttled.status == "throttled_cpu_hot"
+
+async def _collect(stream):
+    return [event async for event in stream]
+
+def test_stream_yields_tokens_then_caches_the_full_answer(rag):
+    events = asyncio.run(_collect(rag.stream_answer_async("Explain the spiral model")))
+    kinds = [kind for kind, _ in events]
+    assert kinds[-1] == "done" and kinds.count("done") == 1
+    assert "token" in kinds
+
+    streamed = "".join(payload for kind, payload in events if kind == "token")
+    final = events[-1][1]
+    assert final.response == streamed
+    assert final.status.startswith("generated_")
+
+    # The assembled answer was written to the cache
+    events = asyncio.run(_collect(rag.stream_answer_async("Explain the spiral model")))
+    assert [kind for kind, _ in events] == ["done"]
+    assert events[0][1].status == "cached"
+    assert events[0][1].response.startswith(streamed)
+
+def test_exact_hit_skips_embedding_and_repeats_are_memoized(rag):
+    rag.answer_question("Explain the V-model")
+    embeds_after_first = rag.llm.embed_calls
+
+    # Exact cache hit: no embedding round trip at all
+    assert rag.answer_question("Explain the V-model").status == "cached"
+    assert rag.llm.embed_calls == embeds_after_first
+
+    # Cache wiped: same normalized question re-embeds from the in-memory memo
+    rag.cache.clear()
+    asyncio.run(rag.answer_question_async("explain the v-model??"))
+    assert rag.llm.embed_calls == embeds_after_first
+
+class SlowLLM(FakeLLM):
+    """Generation takes a while, so duplicates arrive while it is in flight."""
+    def chat(self, system_prompt, user_message):
+        time.sleep(0.2)
+        return super().chat(system_prompt, user_message)
+
+    async def chat_async(self, system_prompt, user_message):
+        await asyncio.sleep(0.2)
+        self.chat_calls += 1
+        return f"answer #{self.chat_calls}"
+
+    async def chat_stream_async(self, system_prompt, user_message):
+        await asyncio.sleep(0.2)
+        self.chat_calls += 1
+        for piece in f"answer #{self.chat_calls}".split(" "):
+            yield piece + " "
+
+def test_concurrent_duplicates_share_one_generation(rag):
+    rag.llm = SlowLLM()
+
+    async def burst():
+        questions = ["What is a sequence diagram?", "what is a sequence diagram", "WHAT IS A SEQUENCE DIAGRAM??"] * 10
+        return await asyncio.gather(*(rag.answer_question_async(q) for q in questions))
+
+    responses = asyncio.run(burst())
+    assert rag.llm.chat_calls == 1
+    assert {r.response for r in responses} == {"answer #1"}
+    statuses = [r.status for r in responses]
+    assert sum(s.startswith("generated_") for s in statuses) == 1
+    assert statuses.count("coalesced") == 29  # Followers are not saved to the forum again
+
+def test_semantic_neighbours_join_the_in_flight_generation(rag):
+    rag.llm = SlowLLM()
+
+    async def burst():
+        # Different wording, same FakeLLM embedding (same bytes)
+        return await asyncio.gather(rag.answer_question_async("Explain waterfall model"),
+                                    rag.answer_question_async("Explain model waterfall"))
+
+    first, second = asyncio.run(burst())
+    assert rag.llm.chat_calls == 1
+    assert second.response == first.response
+    assert sorted([first.status == "coalesced", second.status == "coalesced"]) == [False, True]  # Either may lead
+
+def test_stream_and_plain_requests_coalesce(rag):
+    rag.llm = SlowLLM()
+
+    async def burst():
+        return await asyncio.gather(_collect(rag.stream_answer_async("Explain the spiral model")),
+                                    rag.answer_question_async("Explain the spiral model"))
+
+    events, plain = asyncio.run(burst())
+    assert rag.llm.chat_calls == 1
+    assert events[-1][1].response.strip() == plain.response.strip() == "answer #1"
+
+def test_threaded_duplicates_share_one_generation(rag):
+    rag.llm = SlowLLM()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(lambda _: rag.answer_question("Explain the Kanban board"), range(8)))
+    assert rag.llm.chat_calls == 1
+    assert {r.response for r in responses} == {"answer #1"}
+
+def test_generation_gate_caps_concurrent_llm_calls(rag):
+    class CountingLLM(SlowLLM):
+        running = peak = 0
+
+        async def chat_async(self, system_prompt, user_message):
+            CountingLLM.running += 1
+            CountingLLM.peak = max(CountingLLM.peak, CountingLLM.running)
+            try:
+                return await super().chat_async(system_prompt, user_message)
+            finally:
+                CountingLLM.running -= 1
+
+    rag.llm = CountingLLM()
+    rag.generation_gate = GenerationGate(capacity=2)
+
+    async def distinct_questions():
+        questions = ["coupling", "cohesion", "waterfall model", "scrum roles", "uml"]
+        return await asyncio.gather(*(rag.answer_question_async(f"Explain {q} in detail") for q in questions))
+
+    responses = asyncio.run(distinct_questions())
+    assert rag.llm.chat_calls == 5
+    assert CountingLLM.peak == 2
+    assert all(r.status.startswith("generated_") for r in responses)
+
+def test_reduced_mode_caps_answer_length_and_history(rag):
+    class RecordingLLM(FakeLLM):
+        calls = []
+
+        async def chat_async(self, system_prompt, user_message, num_predict=None):
+            RecordingLLM.calls.append((user_message, num_predict))
+            return self.chat(system_prompt, user_message)
+
+    rag.llm = RecordingLLM()
+    history = [{"role": "user", "content": f"turn {i}"} for i in range(6)]
+    asyncio.run(rag.answer_question_async("Explain cohesion", history=history))
+    asyncio.run(rag.answer_question_async("Explain coupling", history=history, reduced=True))
+    (normal_msg, normal_limit), (reduced_msg, reduced_limit) = RecordingLLM.calls
+    assert normal_limit is None and "turn 2" in normal_msg
+    assert reduced_limit == 512 and "turn 3" not in reduced_msg and "turn 5" in reduced_msg
+
+def test_sync_path_is_capped_by_the_generation_gate(rag):
+    class CountingLLM(SlowLLM):
+        running = peak = 0
+
+        def chat(self, system_prompt, user_message):
+            CountingLLM.running += 1
+            CountingLLM.peak = max(CountingLLM.peak, CountingLLM.running)
+            try:
+                return super().chat(system_prompt, user_message)
+            finally:
+                CountingLLM.running -= 1
+
+    rag.llm = CountingLLM()
+    rag.generation_gate = GenerationGate(capacity=2)
+    questions = ["coupling", "cohesion", "waterfall model", "scrum roles", "uml"]
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        responses = list(pool.map(lambda q: rag.answer_question(f"Explain {q} in detail"), questions))
+    assert CountingLLM.peak == 2
+    assert all(r.status.startswith("generated_") for r in responses)
+    assert rag.generation_gate.scheduler.active == 0
@@ -0,0 +1,73 @@
+import threading
+from teacher_assistant.src.core.rate_limiter import TokenBucketLimiter
+from teacher_assistant.src.core.resource_guard import ResourceGuard
+
+LIMITS = {"guest": (60, 3), "student": (60, 5), "teacher": (120, 10)}
+
+def test_burst_then_refill_at_the_role_rate():
+    limiter = TokenBucketLimiter(limits=LIMITS, sweep_interval=1e9)
+    assert [limiter.allow("ip:1", "guest", now=0.0) for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow("ip:1", "guest", now=0.5) is False  # 1 token/s: half a token so far
+    assert limiter.allow("ip:1", "guest", now=1.0) is True
+    assert limiter.allow("ip:2", "guest", now=1.0) is True  # Separate bucket
+
+    # Teachers get a bigger burst; unknown roles fall back to the default role
+    assert sum(limiter.allow("u:t", "teacher", now=0.0) for _ in range(20)) == 10
+    assert sum(limiter.allow("u:x", "ghost", now=0.0) for _ in range(20)) == 5
+
+def test_sweep_drops_only_refilled_buckets():
+    limiter = TokenBucketLimiter(limits=LIMITS, sweep_interval=1e9)
+    for i in range(100):
+        limiter.allow(f"ip:{i}", "guest", now=0.0)  # 2 of 3 tokens left: full again at t=1
+    for _ in range(3):
+        limiter.allow("ip:busy", "guest", now=0.0)  # Empty: full again at t=3
+    assert len(limiter) == 101
+
+    assert limiter.sweep(now=2.0) == 100
+    assert len(limiter) == 1
+    # The surviving bucket kept its state
+    assert limiter.allow("ip:busy", "guest", now=2.0) is True
+    assert limiter.allow("ip:busy", "guest", now=2.0) is True
+    assert limiter.allow("ip:busy", "guest", now=2.0) is False
+
+def test_inline_sweep_and_hard_cap_bound_memory():
+    limiter = TokenBucketLimiter(limits=LIMITS, shards=4, sweep_interval=10.0, max_keys_per_shard=50)
+    for i in range(10_000):  # Address scan: every key new
+        limiter.allow(f"ip:{i}", "guest", now=1.0)
+    assert len(limiter) <= 4 * 50
+
+    limiter._last_sweep = 0.0
+    limiter.allow("ip:late", "guest", now=20.0)  # Past sweep_interval: sweeps before checking
+    assert len(limiter) == 1
+
+def test_concurrent_checks_never_overspend():
+    limiter = TokenBucketLimiter(limits={"student": (0.001, 200)}, sweep_interval=1e9)
+    results = []
+
+    def hammer():
+        results.extend(limiter.allow("user:same", "student") for _ in range(100))
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(results) == 200
+
+def test_guard_keys_signed_in_users_by_account_and_guests_by_ip():
+    guard = ResourceGuard(rate_limits=LIMITS)
+    alice = {"sub": "alice@uni.edu", "role": "student"}
+    bob = {"sub": "bob@uni.edu", "role": "student"}
+    # Same NAT address: guests share one bucket, accounts do not
+    assert sum(guard.check_rate_limit("10.0.0.1") for _ in range(10)) == 3
+    assert sum(guard.check_rate_limit("10.0.0.1", alice) for _ in range(10)) == 5
+    assert sum(guard.check_rate_limit("10.0.0.1", bob) for _ in range(10)) == 5
+    assert guard.metrics()["rate_limit"]["blocked"] == 17
+
+def test_default_limits_keep_the_old_per_minute_window():
+    limiter = TokenBucketLimiter(sweep_interval=1e9)
+    assert sum(limiter.allow("user:s", "student", now=0.0) for _ in range(70)) == 60
+    # Guests are not rate limited, even well past the student burst; a missing role still is
+    assert all(limiter.allow("ip:1", "guest", now=0.0) for _ in range(200))
+    assert sum(limiter.allow("ip:2", None, now=0.0) for _ in range(70)) == 60
+    assert len(limiter) == 2  # No bucket kept for unlimited guests
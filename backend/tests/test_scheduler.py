@@ -0,0 +1,189 @@
+import pytest
+import time
+import asyncio
+import threading
+from teacher_assistant.src.core.scheduler import (
+    AdmissionScheduler, GenerationGate, PRIORITY_FAST_LANE, PRIORITY_TEACHER, PRIORITY_VOICE, PRIORITY_STUDENT
+)
+from teacher_assistant.src.core.resource_guard import ResourceGuard
+from teacher_assistant.src.core.latency import PATH_GENERATION
+
+def test_slots_go_to_higher_priority_classes_first():
+    scheduler = AdmissionScheduler(capacity=1)
+    order = []
+
+    async def request(name, priority):
+        admitted, _ = await scheduler.acquire(priority)
+        assert admitted
+        order.append(name)
+        await asyncio.sleep(0.01)
+        scheduler.release()
+
+    async def scenario():
+        assert scheduler.try_acquire()  # Occupy the only slot
+        tasks = [asyncio.create_task(request(name, p)) for name, p in
+                 [("student1", PRIORITY_STUDENT), ("voice", PRIORITY_VOICE), ("student2", PRIORITY_STUDENT),
+                  ("teacher", PRIORITY_TEACHER), ("cached", PRIORITY_FAST_LANE)]]
+        await asyncio.sleep(0.01)
+        assert scheduler.queue_length() == 5
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["cached", "teacher", "voice", "student1", "student2"]
+
+def test_timed_out_wait_keeps_its_place_and_resumes_with_the_ticket():
+    scheduler = AdmissionScheduler(capacity=1)
+
+    async def scenario():
+        scheduler.try_acquire()
+        admitted, ticket_id = await scheduler.acquire(PRIORITY_STUDENT, timeout=0.05)
+        assert not admitted and ticket_id
+        later = scheduler.enqueue(PRIORITY_STUDENT)
+        assert scheduler.status(ticket_id)["position"] == 1
+        assert scheduler.status(later.id)["position"] == 2
+
+        # Client re-sends with its ticket; the slot is handed over while it waits
+        resumed = asyncio.create_task(scheduler.acquire(PRIORITY_STUDENT, ticket_id=ticket_id, timeout=1))
+        await asyncio.sleep(0.01)
+        scheduler.release()
+        assert await resumed == (True, ticket_id)
+        assert scheduler.status(ticket_id)["status"] == "unknown"  # Claimed tickets are forgotten
+
+    asyncio.run(scenario())
+
+def test_unclaimed_grants_are_returned():
+    scheduler = AdmissionScheduler(capacity=1, claim_ttl=0.05)
+    scheduler.try_acquire()
+    abandoned = scheduler.enqueue(PRIORITY_STUDENT)
+    waiting = scheduler.enqueue(PRIORITY_STUDENT)
+    scheduler.release()
+    assert scheduler.status(abandoned.id)["status"] == "ready"
+
+    time.sleep(0.06)  # The client stopped polling
+    assert scheduler.status(abandoned.id)["status"] == "unknown"
+    assert scheduler.poll(waiting.id)
+    assert scheduler.stats()["expired_grants"] == 1
+
+def test_cancel_is_constant_time_and_frees_the_place():
+    scheduler = AdmissionScheduler(capacity=1)
+    scheduler.try_acquire()
+    tickets = [scheduler.enqueue(PRIORITY_STUDENT) for _ in range(20000)]
+    start = time.perf_counter()
+    for ticket in tickets[1000:]:
+        scheduler.cancel(ticket.id)
+    assert time.perf_counter() - start < 1.0
+    assert scheduler.queue_length() == 1000
+
+def test_eta_follows_measured_service_time():
+    guard = ResourceGuard(max_concurrent=2, adaptive=False)
+    for _ in range(10):
+        guard.scheduler.try_acquire()
+        guard.release_slot(8.0, "generated_standard")
+    guard.scheduler.try_acquire()
+    guard.scheduler.try_acquire()
+    ticket_id = guard.join_queue()
+    status = guard.get_queue_status(ticket_id)
+    assert status["wait_time"] == pytest.approx(4.0, abs=0.01)  # 1 * 8s / 2 slots
+    assert status["wait_time_p95"] == pytest.approx(4.0, abs=0.01)
+
+def test_guard_keeps_the_polling_protocol():
+    guard = ResourceGuard(max_concurrent=1)
+    assert guard.acquire_slot() == (True, "Access Granted")
+    assert guard.acquire_slot() == (False, "System Busy")
+    ticket_id = guard.join_queue()
+    assert guard.acquire_slot() == (False, "Queue Required")
+    assert guard.acquire_slot(ticket_id) == (False, "Wait Your Turn")
+    guard.release_slot(1.0, "cached")
+    assert guard.acquire_slot(ticket_id) == (True, "Access Granted")
+    assert guard.active_requests == 1
+
+def _grant_order(scheduler, n):
+    order = []
+    for _ in range(n):
+        scheduler.release()
+        granted = next(iter(scheduler._granted.values()))
+        order.append(granted.flow)
+        scheduler.poll(granted.id)
+    return order
+
+def test_busy_course_cannot_starve_the_others():
+    scheduler = AdmissionScheduler(capacity=1)
+    scheduler.try_acquire()
+    exam = [scheduler.enqueue(PRIORITY_STUDENT, flow="exam") for _ in range(50)]
+    quiet = scheduler.enqueue(PRIORITY_STUDENT, flow="quiet")
+    assert scheduler.status(quiet.id)["position"] == 2  # Not behind all 50
+    assert scheduler.status(exam[3].id)["position"] == 5  # 4 of its own course + 1 of "quiet"
+    assert _grant_order(scheduler, 3) == ["exam", "quiet", "exam"]
+    assert scheduler.stats()["queued_by_flow"] == {"exam": 48}
+
+def test_weights_set_the_share_and_idle_time_earns_no_credit():
+    scheduler = AdmissionScheduler(capacity=1)
+    scheduler.set_weight("exam", 2.0)
+    scheduler.try_acquire()
+    for _ in range(30):
+        scheduler.enqueue(PRIORITY_STUDENT, flow="exam")
+        scheduler.enqueue(PRIORITY_STUDENT, flow="other")
+    assert _grant_order(scheduler, 30).count("exam") == 20
+
+    # A course arriving late is interleaved from now on, not served until it "catches up"
+    for _ in range(5):
+        scheduler.enqueue(PRIORITY_STUDENT, flow="late")
+    assert _grant_order(scheduler, 4).count("late") <= 2
+
+def test_generation_cap_lends_admission_slots_to_cache_hits():
+    admission = AdmissionScheduler(capacity=4)
+    gate = GenerationGate(capacity=1, admission=admission)
+    in_generation = []
+
+    async def generate(course):
+        admitted, _ = await admission.acquire(PRIORITY_STUDENT)
+        assert admitted
+        async with gate.slot(course):
+            in_generation.append(course)
+            await asyncio.sleep(0.02)
+        admission.release()
+
+    async def scenario():
+        tasks = [asyncio.create_task(generate(c)) for c in ("a", "a", "a", "b")]
+        await asyncio.sleep(0.005)
+        # One generating, three waiting for the model: their admission slots were lent back
+        assert gate.scheduler.active == 1 and gate.parked == 3
+        assert admission.active == 1
+        assert admission.try_acquire()  # A cache hit still gets in
+        admission.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert in_generation == ["a", "a", "b", "a"]  # "b" is not stuck behind every "a"
+    assert admission.active == 0 and gate.scheduler.active == 0 and gate.parked == 0
+
+def test_generation_gate_wait_is_not_admission_latency():
+    guard = ResourceGuard(max_concurrent=4, max_generations=1, adaptive=False)
+
+    async def request():
+        assert guard.scheduler.try_acquire(PRIORITY_STUDENT)
+        started = guard.begin_service()
+        async with guard.generation.slot("course"):
+            await asyncio.sleep(0.05)
+        guard.release_slot(time.monotonic() - started, "generated_rag")
+
+    async def scenario():
+        await asyncio.gather(*(asyncio.create_task(request()) for _ in range(4)))
+
+    asyncio.run(scenario())
+    summary = guard.latency.summary(PATH_GENERATION)
+    # The last request waited ~0.15s for the model; only its own ~0.05s counts
+    assert summary["count"] == 4 and summary["p99"] < 0.1
+
+def test_threads_wait_for_a_slot_with_acquire_blocking():
+    scheduler = AdmissionScheduler(capacity=1)
+    assert scheduler.try_acquire()
+    threading.Timer(0.05, scheduler.release).start()
+    started = time.monotonic()
+    assert scheduler.acquire_blocking(PRIORITY_STUDENT, flow="course", timeout=2.0)
+    assert 0.03 < time.monotonic() - started < 1.0
+    assert not scheduler.acquire_blocking(PRIORITY_STUDENT, timeout=0.05)  # Gives its place up
+    assert scheduler.queue_length() == 0
+    scheduler.release()
+    assert scheduler.active == 0
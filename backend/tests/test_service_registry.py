@@ -0,0 +1,56 @@
+import pytest
+import os
+import shutil
+import time
+from teacher_assistant.src.infrastructure.workspace import WorkspaceManager
+from teacher_assistant.src.infrastructure.ollama_client import OllamaClient
+from teacher_assistant.src.use_cases.service_registry import ServiceRegistry
+
+# Test Configuration
+TEST_BASE_DIR = "./test_registry_storage"
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+    os.makedirs(TEST_BASE_DIR)
+    yield
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+
+def test_same_course_shares_cache_and_service():
+    registry = ServiceRegistry(WorkspaceManager(base_dir=TEST_BASE_DIR), OllamaClient())
+
+    rag_a = registry.get_rag_service("course_a")
+    assert registry.get_rag_service("course_a") is rag_a
+    assert registry.get_cache("course_a") is rag_a.cache
+    assert registry.get_cache("course_b") is not rag_a.cache
+
+def test_warm_l1_survives_between_lookups():
+    registry = ServiceRegistry(WorkspaceManager(base_dir=TEST_BASE_DIR), OllamaClient())
+    registry.get_cache("course_a").set("What is UML?", "A modeling language.", [])
+    assert registry.get_cache("course_a").get("what is uml") is not None
+
+def test_idle_courses_are_evicted():
+    registry = ServiceRegistry(WorkspaceManager(base_dir=TEST_BASE_DIR), OllamaClient(), idle_ttl=10)
+    first = registry.get_rag_service("course_a")
+    registry.get_rag_service("course_b")
+
+    evicted = registry.evict_idle(now=time.monotonic() + 60)
+    assert sorted(evicted) == ["course_a", "course_b"]
+    assert registry.active_courses() == []
+    assert registry.get_rag_service("course_a") is not first
+
+def test_cost_scan_reads_idle_courses_without_registering_them():
+    workspace = WorkspaceManager(base_dir=TEST_BASE_DIR)
+    earlier = ServiceRegistry(workspace, OllamaClient())
+    earlier.get_cache("course_b").set("What is UML?", "A modeling language.", [])
+    earlier.close()
+
+    registry = ServiceRegistry(workspace, OllamaClient())
+    registry.get_cache("course_a").set("What is Scrum?", "An agile framework.", [])
+    os.makedirs(os.path.join(TEST_BASE_DIR, "teacher_course_c"))  # Workspace without a cache yet
+
+    assert registry.cache_hits_by_course() == {"course_a": 1, "course_b": 1, "course_c": 0}
+    assert registry.active_courses() == ["course_a"]
+    assert not os.path.exists(os.path.join(TEST_BASE_DIR, "teacher_course_c", "smart_cache.db"))
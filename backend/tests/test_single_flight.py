@@ -0,0 +1,42 @@
+import pytest
+import asyncio
+from teacher_assistant.src.infrastructure.single_flight import AsyncSingleFlight
+
+def test_followers_get_the_leaders_exception():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def boom():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("ollama down")
+
+    async def burst():
+        return await asyncio.gather(*(flights.do("q", boom) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flights.stats()["in_flight"] == 0
+
+def test_follower_takes_over_when_the_leader_is_cancelled():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return len(calls)
+
+    async def scenario():
+        leader = asyncio.create_task(flights.do("q", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flights.do("q", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()  # e.g. the client closed its stream
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    result, shared = asyncio.run(scenario())
+    assert (result, shared) == (2, False)  # The follower re-ran the call itself
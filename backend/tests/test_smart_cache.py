@@ -0,0 +1,144 @@
+import pytest
+import os
+import json
+import shutil
+import sqlite3
+import numpy as np
+from teacher_assistant.src.infrastructure.smart_cache import SmartCache
+
+# Test Configuration
+TEST_BASE_DIR = "./test_cache_storage"
+TEST_DB = os.path.join(TEST_BASE_DIR, "smart_cache.db")
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+    os.makedirs(TEST_BASE_DIR)
+    yield
+    if os.path.exists(TEST_BASE_DIR):
+        shutil.rmtree(TEST_BASE_DIR)
+
+def _vec(seed, dim=768):
+    return np.random.default_rng(seed).standard_normal(dim).tolist()
+
+def test_embeddings_stored_as_float32_blobs():
+    """New rows must hold raw float32 bytes, not JSON."""
+    cache = SmartCache(db_path=TEST_DB)
+    cache.set("What is UML?", "A modeling language.", ["a.pdf | Page 1"], embedding=_vec(1))
+
+    conn = sqlite3.connect(TEST_DB)
+    blob = conn.execute("SELECT embedding_blob FROM qa_cache").fetchone()[0]
+    conn.close()
+
+    assert isinstance(blob, bytes)
+    assert len(blob) == 768 * 4
+    assert np.allclose(np.frombuffer(blob, dtype=np.float32), _vec(1), atol=1e-6)
+
+def test_legacy_json_rows_are_migrated():
+    """Caches written by older versions (JSON embeddings) are converted on open."""
+    conn = sqlite3.connect(TEST_DB)
+    conn.execute('''
+        CREATE TABLE qa_cache (
+            query_hash TEXT PRIMARY KEY, query_text TEXT, normalized_query TEXT,
+            response TEXT, references_json TEXT, embedding_blob BLOB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, access_count INTEGER DEFAULT 1
+        )
+    ''')
+    conn.execute(
+        "INSERT INTO qa_cache (query_hash, query_text, normalized_query, response, references_json, embedding_blob) VALUES (?, ?, ?, ?, ?, ?)",
+        ("h1", "q", "q", "legacy answer", json.dumps([]), json.dumps(_vec(2)))
+    )
+    conn.commit()
+    conn.close()
+
+    cache = SmartCache(db_path=TEST_DB)
+
+    conn = sqlite3.connect(TEST_DB)
+    blob = conn.execute("SELECT embedding_blob FROM qa_cache").fetchone()[0]
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    assert isinstance(blob, bytes) and len(blob) == 768 * 4
+    assert version >= 1
+
+    hit = cache.get_semantic(_vec(2), threshold=0.99)
+    assert hit is not None and hit['response'] == "legacy answer"
+
+def test_float32_blob_starting_with_bracket_and_corrupt_rows_load():
+    """Format comes from the storage class, not the first byte; bad rows are skipped."""
+    raw = bytearray(np.asarray(_vec(5), dtype=np.float32).tobytes())
+    raw[0] = ord('[')  # ~1 in 256 real embeddings start like this
+    vec = np.frombuffer(bytes(raw), dtype=np.float32).tolist()
+    cache = SmartCache(db_path=TEST_DB)
+    cache.set("what is coupling", "bracket answer", [], embedding=vec)
+    conn = sqlite3.connect(TEST_DB)
+    conn.execute(
+        "INSERT INTO qa_cache (query_hash, query_text, normalized_query, response, references_json, embedding_blob) VALUES (?, ?, ?, ?, ?, ?)",
+        ("broken", "q", "q", "broken answer", json.dumps([]), b"\x5b\x00\x01")
+    )
+    conn.commit()
+    conn.close()
+
+    reopened = SmartCache(db_path=TEST_DB)
+    hit = reopened.get_semantic(vec, threshold=0.99)
+    assert hit is not None and hit['response'] == "bracket answer"
+    assert reopened.get_semantic(_vec(6), threshold=0.99) is None  # Still usable afterwards
+
+def test_semantic_lookup_uses_resident_matrix():
+    """set() after the first lookup is visible without reloading from disk."""
+    cache = SmartCache(db_path=TEST_DB)
+    assert cache.get_semantic(_vec(3)) is None
+
+    for i in range(100):  # Forces the matrix to grow past its initial capacity
+        cache.set(f"question {i}", f"answer {i}", [], embedding=_vec(100 + i))
+
+    hit = cache.get_semantic(_vec(142), threshold=0.99)
+    assert hit['response'] == "answer 42"
+    assert hit['type'] == 'semantic'
+    assert cache.get_semantic(_vec(4), threshold=0.9) is None
+
+    # Re-setting the same question replaces its row instead of appending
+    cache.set("question 42", "updated", [], embedding=_vec(142))
+    assert cache._matrix_size == 100
+    assert cache.get_semantic(_vec(142), threshold=0.99)['response'] == "updated"
+
+    # A fresh instance rebuilds the same matrix from disk
+    reopened = SmartCache(db_path=TEST_DB)
+    assert reopened.get_semantic(_vec(142), threshold=0.99)['response'] == "updated"
+
+def test_clear_resets_matrix():
+    cache = SmartCache(db_path=TEST_DB)
+    cache.set("What is UML?", "A modeling language.", [], embedding=_vec(5))
+    assert cache.get_semantic(_vec(5)) is not None
+    cache.clear()
+    assert cache.get_semantic(_vec(5)) is None
+    assert cache.get("What is UML?") is None
+
+def test_l1_is_bounded_and_counts_tiers():
+    cache = SmartCache(db_path=TEST_DB, l1_max_entries=2)
+    for i in range(3):
+        cache.set(f"question {i}", f"answer {i}", [])
+
+    stats = cache.get_stats()
+    assert stats['l1']['entries'] == 2
+    assert stats['tiers']['l1_evictions'] == 1
+
+    assert cache.get("question 2")['response'] == "answer 2"  # L1
+    assert cache.get("question 0")['response'] == "answer 0"  # Evicted -> L2 disk
+    assert cache.get_semantic(_vec(6)) is None                 # Full miss
+
+    tiers = cache.get_stats()['tiers']
+    assert tiers['l1_hits'] == 1
+    assert tiers['l2_exact_hits'] == 1
+    assert tiers['misses'] == 1
+
+def test_l1_ttl_and_invalidation():
+    cache = SmartCache(db_path=TEST_DB, l1_ttl=0.0)
+    cache.set("What is UML?", "A modeling language.", [])
+    assert cache.get("What is UML?") is not None
+    assert cache.get_stats()['tiers']['l1_hits'] == 0  # Expired immediately, served by L2
+
+    cache = SmartCache(db_path=TEST_DB)
+    cache.get("What is UML?")
+    cache.invalidate_l1()
+    assert cache.get_stats()['l1']['entries'] == 0
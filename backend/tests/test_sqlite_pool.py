@@ -0,0 +1,85 @@
+import time
+import sqlite3
+import threading
+import pytest
+from teacher_assistant.src.infrastructure.sqlite_pool import SQLitePool
+from teacher_assistant.src.infrastructure.workspace import WorkspaceManager
+from teacher_assistant.src.infrastructure.ollama_client import OllamaClient
+from teacher_assistant.src.use_cases.service_registry import ServiceRegistry
+
+def _in_thread(fn):
+    result = []
+    t = threading.Thread(target=lambda: result.append(fn()))
+    t.start()
+    t.join()
+    return result[0]
+
+def test_each_thread_reuses_its_own_connection(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"))
+    conn = pool.connection()
+    assert pool.connection() is conn
+    other = _in_thread(pool.connection)
+    assert other is not conn and len(pool._connections) == 2
+
+    _in_thread(pool.connection)  # The finished thread's connection is pruned on the next open
+    assert len(pool._connections) == 2
+    with pytest.raises(sqlite3.ProgrammingError):
+        other.execute("SELECT 1")
+
+def test_close_all_never_closes_a_connection_under_another_threads_query(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"))
+    pool.connection().execute("CREATE TABLE t (x)")
+    started, closed, done = threading.Event(), threading.Event(), {}
+
+    def worker():
+        conn = pool.connection()
+        started.set()
+        closed.wait(2)
+        done["mid_query"] = conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]  # Still open
+        fresh = pool.connection()
+        done["reconnected"] = fresh is not conn
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")  # The owner closed its retired connection
+        fresh.execute("SELECT 1")
+
+    t = threading.Thread(target=worker)
+    t.start()
+    started.wait(2)
+    mine = pool.connection()
+    pool.close_all()
+    with pytest.raises(sqlite3.ProgrammingError):
+        mine.execute("SELECT 1")  # The caller's own connection closes right away
+    closed.set()
+    t.join()
+    assert done == {"mid_query": 0, "reconnected": True}
+    assert pool.connection() is not mine
+
+def test_reused_thread_ident_closes_the_previous_connection(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"))
+    left_behind = sqlite3.connect(str(tmp_path / "pool.db"), check_same_thread=False)
+    pool._connections[threading.get_ident()] = left_behind  # A dead thread with this ident
+    conn = pool.connection()
+    assert pool._connections[threading.get_ident()] is conn
+    with pytest.raises(sqlite3.ProgrammingError):
+        left_behind.execute("SELECT 1")
+
+def test_registry_eviction_does_not_break_a_running_request(tmp_path):
+    registry = ServiceRegistry(WorkspaceManager(base_dir=str(tmp_path)), OllamaClient(), idle_ttl=10)
+    cache = registry.get_cache("course_a")
+    cache.set("What is UML?", "A modeling language.", [])
+    in_request, evicted, result = threading.Event(), threading.Event(), []
+
+    def request():
+        conn = cache._pool.connection()
+        in_request.set()
+        evicted.wait(2)
+        result.append(conn.execute("SELECT COUNT(*) FROM qa_cache").fetchone()[0])
+        result.append(cache.get("what is uml") is not None)
+
+    t = threading.Thread(target=request)
+    t.start()
+    in_request.wait(2)
+    assert registry.evict_idle(now=time.monotonic() + 60) == ["course_a"]
+    evicted.set()
+    t.join()
+    assert result == [1, True]
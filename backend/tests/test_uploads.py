@@ -0,0 +1,50 @@
+import io
+import os
+import asyncio
+import hashlib
+from starlette.datastructures import UploadFile
+from teacher_assistant.src.infrastructure import ingest_manifest
+from teacher_assistant.src.infrastructure.ingest_manifest import IngestManifest
+from teacher_assistant.src.infrastructure.uploads import store_upload
+
+def _upload(name, data):
+    return UploadFile(io.BytesIO(data), filename=name)
+
+def _store(uploads, doc_dir, manifest):
+    async def run():
+        return [await store_upload(u, doc_dir, manifest) for u in uploads]
+    return asyncio.run(run())
+
+def test_upload_is_streamed_hashed_and_duplicates_skipped(tmp_path):
+    doc_dir, db_dir = tmp_path / "documents", tmp_path / "db"
+    doc_dir.mkdir(), db_dir.mkdir()
+    manifest = IngestManifest(str(db_dir))
+    lecture = os.urandom(3 * 1024 * 1024 + 17)  # Several read chunks
+
+    results = _store([_upload("lecture.pdf", lecture), _upload("copy of lecture.pdf", lecture),
+                      _upload("../notes.txt", b"UML notes")], str(doc_dir), manifest)
+    assert results == [("lecture.pdf", None), ("copy of lecture.pdf", "lecture.pdf"), ("notes.txt", None)]
+    assert sorted(os.listdir(doc_dir)) == ["lecture.pdf", "notes.txt"]  # No temp files, no copy
+    assert (doc_dir / "lecture.pdf").read_bytes() == lecture
+    recorded = IngestManifest(str(db_dir)).uploads["lecture.pdf"]
+    assert recorded["sha256"] == hashlib.sha256(lecture).hexdigest() and recorded["size"] == len(lecture)
+
+def test_manifest_uses_upload_hashes_instead_of_rereading(tmp_path, monkeypatch):
+    doc_dir, db_dir = tmp_path / "documents", tmp_path / "db"
+    doc_dir.mkdir(), db_dir.mkdir()
+    _store([_upload("a.txt", b"alpha"), _upload("b.txt", b"beta")], str(doc_dir), IngestManifest(str(db_dir)))
+
+    (doc_dir / "c.txt").write_bytes(b"copied in by hand")
+    hashed = []
+    real_hash = ingest_manifest.hash_file
+    monkeypatch.setattr(ingest_manifest, "hash_file", lambda path: hashed.append(os.path.basename(path)) or real_hash(path))
+    paths = [str(doc_dir / n) for n in ("a.txt", "b.txt", "c.txt")]
+    diff = IngestManifest(str(db_dir)).diff(str(doc_dir), paths)
+    assert sorted(diff.new) == ["a.txt", "b.txt", "c.txt"]
+    assert hashed == ["c.txt"]  # Only the file that did not come through the upload path
+    assert diff.hashes["b.txt"]["sha256"] == hashlib.sha256(b"beta").hexdigest()
+
+    # Edited after upload: the recorded hash no longer applies
+    os.utime(doc_dir / "a.txt", ns=(1, 1))
+    IngestManifest(str(db_dir)).diff(str(doc_dir), paths)
+    assert "a.txt" in hashed
@@ -0,0 +1,72 @@
+import time
+import threading
+from teacher_assistant.src.infrastructure.write_behind import WriteBehindQueue
+
+def test_rows_are_batched_into_one_write():
+    batches = []
+    queue = WriteBehindQueue(batches.append, batch_size=50, flush_interval=10)
+    for i in range(50):
+        queue.submit((i,))
+
+    deadline = time.time() + 2
+    while not batches and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert len(batches) == 1
+    assert batches[0] == [(i,) for i in range(50)]
+    queue.close()
+
+def test_interval_flush_and_close_drain():
+    batches = []
+    queue = WriteBehindQueue(batches.append, batch_size=1000, flush_interval=0.05)
+    queue.submit(("a",))
+    time.sleep(0.3)
+    assert batches == [[("a",)]]
+
+    queue.submit(("b",))
+    queue.close()
+    assert sum(len(b) for b in batches) == 2
+    assert queue.stats()['pending'] == 0
+
+def test_drop_oldest_when_buffer_full():
+    gate = threading.Event()
+    written = []
+
+    def slow_write(rows):
+        gate.wait(2)
+        written.extend(rows)
+
+    queue = WriteBehindQueue(slow_write, batch_size=1, flush_interval=0.01, max_pending=3)
+    queue.submit((0,))
+    time.sleep(0.1)  # Worker is now stuck writing row 0
+    for i in range(1, 6):
+        queue.submit((i,))
+
+    assert queue.stats()['dropped'] == 2
+    gate.set()
+    queue.close()
+    assert written == [(0,), (3,), (4,), (5,)]
+
+def test_failed_batches_do_not_kill_the_writer():
+    def broken(rows):
+        raise RuntimeError("disk full")
+
+    queue = WriteBehindQueue(broken, batch_size=1, flush_interval=0.01)
+    queue.submit((1,))
+    queue.close()
+    assert queue.stats()['failed'] == 1
+
+def test_submit_after_close_writes_without_holding_the_producer_lock():
+    stats_during_write = []
+
+    def write(rows):
+        # Another request thread reads the stats while this synchronous write runs
+        reader = threading.Thread(target=lambda: stats_during_write.append(queue.stats()))
+        reader.start()
+        reader.join(1)
+
+    queue = WriteBehindQueue(write, batch_size=10, flush_interval=10)
+    queue.close()
+    queue.submit(("late",))
+    assert len(stats_during_write) == 1  # Not blocked on _cond
+    assert queue.stats()['written'] == 1